@@ -1,18 +1,18 @@
 """ Sheet containing DTW methods related to true similarity creation """
 
 import numpy as np
-import pandas as pd
-import collections as co
 
 from traj_dist.pydist.dtw import e_dtw as p_dtw
 from traj_dist.distance import dtw as c_dtw
 
-from multiprocessing import Pool
+from utils.similarity_matrix import SimilarityMatrix, compute_similarity_matrix
+from utils.similarity_measures.pairwise import PairwiseEngine
+
 import timeit as ti
 import time
 
 
-def py_dtw(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+def py_dtw(trajectories: dict[str, list[list[int]]]) -> SimilarityMatrix:
     """ 
     Method for computing DTW similarity between all trajectories in a given dataset using python. 
 
@@ -23,26 +23,10 @@ def py_dtw(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
 
     Returns
     ---
-    A nxn pandas dataframe containing the pairwise similarities - sorted alphabetically 
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py) - sorted alphabetically
     """
 
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
-
-    M = np.zeros((num_trajectoris, num_trajectoris))
-    
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-        for j, traj_j in enumerate(sorted_trajectories.keys()):
-            X = np.array(sorted_trajectories[traj_i])
-            Y = np.array(sorted_trajectories[traj_j])
-            dtw = p_dtw(X,Y)
-            M[i,j] = dtw
-            if i == j: 
-                break
-    
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-
-    return df
+    return compute_similarity_matrix({key: np.array(trajectory) for key, trajectory in trajectories.items()}, p_dtw)
 
 
 def measure_py_dtw(args):
@@ -59,7 +43,7 @@ def measure_py_dtw(args):
 
 
 
-def cy_dtw(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+def cy_dtw(trajectories: dict[str, list[list[int]]]) -> SimilarityMatrix:
     """ 
     Method for computing DTW similarity between all trajectories in a given dataset using cython. 
 
@@ -70,26 +54,10 @@ def cy_dtw(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
 
     Returns
     ---
-    A nxn pandas dataframe containing the pairwise similarities - sorted alphabetically 
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py) - sorted alphabetically
     """
 
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
-
-    M = np.zeros((num_trajectoris, num_trajectoris))
-    
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-        for j, traj_j in enumerate(sorted_trajectories.keys()):
-            X = np.array(sorted_trajectories[traj_i])
-            Y = np.array(sorted_trajectories[traj_j])
-            dtw = c_dtw(X,Y)
-            M[i,j] = dtw
-            if i == j: 
-                break
-    
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-
-    return df
+    return compute_similarity_matrix({key: np.array(trajectory) for key, trajectory in trajectories.items()}, c_dtw)
 
 def measure_cy_dtw(args):
     """ Method for measuring time efficiency using py_dtw """
@@ -101,31 +69,34 @@ def measure_cy_dtw(args):
 
 
 
-# Helper function for dtw parallell programming for speedy computations
-def _fun_wrapper(args):
-        x,y,j = args
-        dtw = c_dtw(x,y)
-        return dtw, j
+# Kernel for the pairwise engine, where each trajectory is stored as a hash with one layer
+def _dtw_kernel(x, y) -> float:
+    return c_dtw(np.array(x[0]), np.array(y[0]))
 
-def cy_dtw_pool(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+def cy_dtw_pool(trajectories: dict[str, list[list[int]]], processes: int = 12, checkpoint_folder: str | None = None, shard: str | None = None) -> SimilarityMatrix | None:
     """
     Same as above, but using a pool of procesess for speedup
-    """
-
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
 
-    M = np.zeros((num_trajectoris, num_trajectoris))  
-        
-    pool = Pool(12)
-
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-
-        dtw_elements = pool.map(_fun_wrapper, [(np.array(sorted_trajectories[traj_i]), np.array(sorted_trajectories[traj_j]), j) for j, traj_j in enumerate(sorted_trajectories.keys()) if i >= j])
-
-        for element in dtw_elements:
-            M[i,element[1]] = element[0]
+    Params
+    ---
+    trajectories : dict[str, list[list[float]]]
+        A dictionary containing the trajectories
+    processes : int
+        The number of worker processes
+    checkpoint_folder : str | None
+        Keeps the finished tiles in this folder, so a DTW computation that was stopped is resumed when run again
+    shard : str | None
+        Only computes this shard ("i/k") into checkpoint_folder and returns None. The shards are assembled with merge-shards.py
 
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-    
-    return df
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix - sorted alphabetically, or None for a shard
+    """
+    hashes = {key: [trajectory] for key, trajectory in trajectories.items()}
+    with PairwiseEngine(processes) as engine:
+        if shard is not None:
+            engine.compute_shard(hashes, _dtw_kernel, shard, checkpoint_folder, "numerical")
+            return None
+        keys, condensed, _ = engine.compute(hashes, _dtw_kernel, "numerical", checkpoint_folder=checkpoint_folder)
+
+    return SimilarityMatrix(keys, condensed)
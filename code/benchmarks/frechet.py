@@ -1,17 +1,18 @@
 """ Sheet containing Frechet methods related to true similarity creation """
 
 import numpy as np
-import pandas as pd
-import collections as co
 
-from multiprocessing import Pool
 import timeit as ti
 import time
 
 from traj_dist.pydist.frechet import frechet as p_frechet
 from traj_dist.distance import frechet as c_frechet
 
-def py_frechet(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+from utils.similarity_matrix import SimilarityMatrix, compute_similarity_matrix
+from utils.similarity_measures.pairwise import PairwiseEngine
+
+
+def py_frechet(trajectories: dict[str, list[list[int]]]) -> SimilarityMatrix:
     """ 
     Method for computing frechet similarity between all trajectories in a given dataset using python. 
 
@@ -22,26 +23,10 @@ def py_frechet(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
 
     Returns
     ---
-    A nxn pandas dataframe containing the pairwise similarities - sorted alphabetically 
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py) - sorted alphabetically
     """
 
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
-
-    M = np.zeros((num_trajectoris, num_trajectoris))
-    
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-        for j, traj_j in enumerate(sorted_trajectories.keys()):
-            X = np.array(sorted_trajectories[traj_i])
-            Y = np.array(sorted_trajectories[traj_j])
-            frechet = p_frechet(X,Y)
-            M[i,j] = frechet
-            if i == j: 
-                break
-    
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-
-    return df
+    return compute_similarity_matrix({key: np.array(trajectory) for key, trajectory in trajectories.items()}, p_frechet)
 
 
 
@@ -55,7 +40,7 @@ def measure_py_frechet(args):
 
 
 
-def cy_frechet(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+def cy_frechet(trajectories: dict[str, list[list[int]]]) -> SimilarityMatrix:
     """ 
     Method for computing frechet similarity between all trajectories in a given dataset using cython. 
 
@@ -66,26 +51,10 @@ def cy_frechet(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
 
     Returns
     ---
-    A nxn pandas dataframe containing the pairwise similarities - sorted alphabetically 
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py) - sorted alphabetically
     """
 
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
-
-    M = np.zeros((num_trajectoris, num_trajectoris))
-    
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-        for j, traj_j in enumerate(sorted_trajectories.keys()):
-            X = np.array(sorted_trajectories[traj_i])
-            Y = np.array(sorted_trajectories[traj_j])
-            frech = c_frechet(X,Y)
-            M[i,j] = frech
-            if i == j: 
-                break
-    
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-
-    return df
+    return compute_similarity_matrix({key: np.array(trajectory) for key, trajectory in trajectories.items()}, c_frechet)
 
 
 def measure_cy_frechet(args):
@@ -95,31 +64,35 @@ def measure_cy_frechet(args):
     return measures
 
 
-# Helper function for dtw parallell programming for speedy computations
-def _fun_wrapper(args):
-        x,y,j = args
-        frechet = c_frechet(x,y)
-        return frechet, j
+# Kernel for the pairwise engine, where each trajectory is stored as a hash with one layer
+def _frechet_kernel(x, y) -> float:
+    return c_frechet(np.array(x[0]), np.array(y[0]))
 
-def cy_frechet_pool(trajectories: dict[str, list[list[int]]]) -> pd.DataFrame:
+def cy_frechet_pool(trajectories: dict[str, list[list[int]]], processes: int = 12, checkpoint_folder: str | None = None, shard: str | None = None) -> SimilarityMatrix | None:
     """
     Same as above, but using a pool of procesess for speedup
-    """
-    sorted_trajectories = co.OrderedDict(sorted(trajectories.items()))
-    num_trajectoris = len(sorted_trajectories)
-
-    M = np.zeros((num_trajectoris, num_trajectoris))  
-        
-    pool = Pool(12)
 
-    for i, traj_i in enumerate(sorted_trajectories.keys()):
-        print(f"Cy Pool Frehet: {i}/1000")
-        frech_elements = pool.map(_fun_wrapper, [(np.array(sorted_trajectories[traj_i]), np.array(sorted_trajectories[traj_j]), j) for j, traj_j in enumerate(sorted_trajectories.keys()) if i >= j])
-
-        for element in frech_elements:
-            M[i,element[1]] = element[0]
+    Params
+    ---
+    trajectories : dict[str, list[list[float]]]
+        A dictionary containing the trajectories
+    processes : int
+        The number of worker processes
+    checkpoint_folder : str | None
+        Keeps the finished tiles in this folder, so a Frechet computation that was stopped is resumed when run again
+    shard : str | None
+        Only computes this shard ("i/k") into checkpoint_folder and returns None. The shards are assembled with merge-shards.py
 
-    df = pd.DataFrame(M, index=sorted_trajectories.keys(), columns=sorted_trajectories.keys())
-    
-    return df
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix - sorted alphabetically, or None for a shard
+    """
+    hashes = {key: [trajectory] for key, trajectory in trajectories.items()}
+    with PairwiseEngine(processes) as engine:
+        if shard is not None:
+            engine.compute_shard(hashes, _frechet_kernel, shard, checkpoint_folder, "numerical")
+            return None
+        keys, condensed, _ = engine.compute(hashes, _frechet_kernel, "numerical", checkpoint_folder=checkpoint_folder)
+
+    return SimilarityMatrix(keys, condensed)
 
@@ -11,14 +11,11 @@ import matplotlib.pyplot as plt
 
 from utils import metafile_handler as mfh
 from utils import file_handler as fh
-
-def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-    """Flips and mirrors a two-dimenional np.array """
-    return M.values + np.rot90(np.fliplr(M.values))
+from utils.similarity_matrix import load_similarity_matrix
 
 def generate_affinity_clusters(preference: int, distance_matrix_path: str, convergence_iter: int = 15, max_iter: int = 200, damping: float = 0.5) -> list:
     distance_path = os.path.abspath(distance_matrix_path)
-    distances = _mirrorDiagonal(pd.read_csv(distance_path, index_col=0))
+    distances = load_similarity_matrix(distance_path).to_square()
     
     #model = AffinityPropagation(preference=preference, affinity="euclidean", convergence_iter=convergence_iter, max_iter=max_iter, damping=damping)
     model = AffinityPropagation(preference=preference, affinity="euclidean")
@@ -29,7 +26,7 @@ def generate_affinity_clusters(preference: int, distance_matrix_path: str, conve
 
 def test_silhouette_score(preference: int, distance_matrix_path: str, convergence_iter: int = 15, max_iter: int = 200, damping: float = 0.5) -> list:
     distance_path = os.path.abspath(distance_matrix_path)
-    distances = _mirrorDiagonal(pd.read_csv(distance_path, index_col=0))
+    distances = load_similarity_matrix(distance_path).to_square()
 
     model = AffinityPropagation(preference=preference, affinity="euclidean", convergence_iter=convergence_iter, max_iter=max_iter, damping=damping)
     clusters = model.fit_predict(distances)
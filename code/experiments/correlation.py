@@ -4,19 +4,17 @@ import os
 
 from experiments.grid_similarity import generate_grid_hash_similarity
 from experiments.disk_similarity import generate_disk_hash_similarity
+from utils.similarity_matrix import load_similarity_matrix, get_correlation
 
 
-def compute_correlation_similarity(city: str, scheme: str, runs: int):
-    """ Standalone method that computes the correlation with true similarity values from 10 runs"""
-
-    # Defining helper functions:
-
-    def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-        """Flips and mirrors a two-dimenional np.array """
-        return M.values + np.rot90(np.fliplr(M.values))
+def compute_correlation_similarity(city: str, scheme: str, runs: int, seed: int | None = None):
+    """ Standalone method that computes the correlation with true similarity values from 10 runs. 
     
-    porto_dtw = _mirrorDiagonal(pd.read_csv(os.path.abspath("../code/benchmarks/similarities/porto-dtw.csv"), index_col=0)).flatten()
-    porto_fre = _mirrorDiagonal(pd.read_csv(os.path.abspath("../code/benchmarks/similarities/porto-frechet.csv"), index_col=0)).flatten()
+    If seeded, run r uses seed + r and the hashes are reused from the hash cache when the method is run again
+    """
+
+    porto_dtw = load_similarity_matrix(os.path.abspath("../code/benchmarks/similarities/porto-dtw.csv"))
+    porto_fre = load_similarity_matrix(os.path.abspath("../code/benchmarks/similarities/porto-frechet.csv"))
 
     
 #    similarities = {
@@ -45,14 +43,15 @@ def compute_correlation_similarity(city: str, scheme: str, runs: int):
     for run in range(runs):
         print("Run :", run)
         hash_sims = None
+        run_seed = None if seed is None else seed + run
         if city.lower() == "porto" and scheme.lower()=="grid":
-            hash_sims = generate_grid_hash_similarity("porto", 1.6, 5)
+            hash_sims = generate_grid_hash_similarity("porto", 1.6, 5, run_seed)
         elif city.lower() == "porto" and scheme.lower() == "disk":
-            hash_sims = generate_disk_hash_similarity("porto", 2.2, 4, 60)
+            hash_sims = generate_disk_hash_similarity("porto", 2.2, 4, 60, run_seed)
 
-        h_sims =  _mirrorDiagonal(hash_sims).flatten()
-        correlation_dtw.append(np.corrcoef(h_sims, true_sims[city]["dtw"])[0][1])
-        correlation_fre.append(np.corrcoef(h_sims, true_sims[city]["fre"])[0][1])
+        # Both matrices are condensed, so only the pairs below the diagonal are correlated
+        correlation_dtw.append(get_correlation(hash_sims, true_sims[city]["dtw"]))
+        correlation_fre.append(get_correlation(hash_sims, true_sims[city]["fre"]))
 
 
     print(city, scheme, ": (min, max, avg, std)")
@@ -13,23 +13,19 @@ from multiprocessing import Pool
 
 from utils import file_handler as fh
 from utils import metafile_handler as mfh
+from utils.similarity_matrix import load_similarity_matrix, get_correlation
 
 from schemes.disk_lsh import DiskLSH
 
 from utils.similarity_measures.distance import py_edit_distance as py_ed
 from utils.similarity_measures.distance import py_dtw
+from utils.similarity_measures.distance import py_dtw_indexed
 
 
-# Defining helper functions:
-
-def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-    """Flips and mirrors a two-dimenional np.array """
-    return M.values + np.rot90(np.fliplr(M.values))
-
 # True similarities:
 
-P_DTW = _mirrorDiagonal(pd.read_csv("./benchmarks/similarities/porto-dtw-test.csv", index_col=0)).flatten() #.stack().values
-P_FRE = _mirrorDiagonal(pd.read_csv("./benchmarks/similarities/porto-frechet-test.csv", index_col=0)).flatten() #.stack().values
+P_DTW = load_similarity_matrix("./benchmarks/similarities/porto-dtw-test.csv")
+P_FRE = load_similarity_matrix("./benchmarks/similarities/porto-frechet-test.csv")
 
 # Some constants
 
@@ -60,35 +56,40 @@ DISTANCE_FUNC = {
 }
 
 
-def _constructDisk(city: str, diameter: float, layers: int, disks:int=50) -> DiskLSH:
+def _constructDisk(city: str, diameter: float, layers: int, disks:int=50, seed: int | None = None) -> DiskLSH:
     """ Constructs a grid hash object over the given city """
     if city.lower() == "porto":
-        return DiskLSH(f"GP_{layers}-{'{:.2f}'.format(diameter)}", P_MIN_LAT, P_MAX_LAT, P_MIN_LON, P_MAX_LON, disks, layers, diameter, PORTO_META_TEST, PORTO_CHOSEN_DATA)
+        return DiskLSH(f"GP_{layers}-{'{:.2f}'.format(diameter)}", P_MIN_LAT, P_MAX_LAT, P_MIN_LON, P_MAX_LON, disks, layers, diameter, PORTO_META_TEST, PORTO_CHOSEN_DATA, seed)
     else:
         raise ValueError("City argument must be porto")
 
 
 def _compute_hashes(disk: DiskLSH, measure: str = "py_ed") -> dict[str,list]:
+    # Runs inside the pool workers, so the KD-tree queries are kept to one worker each
     if measure == "py_ed":
-        return disk.compute_dataset_hashes_with_KD_tree() 
+        return disk.compute_dataset_hashes_with_KD_tree(workers=1) 
     elif measure == "py_dtw": 
-        return disk.compute_dataset_hashes_with_KD_tree_numerical()
+        return disk.compute_dataset_hashes_with_KD_tree_integer(workers=1)
     else:
         raise ValueError("Preferred similarity measure not supported")
     
 
 def _fun_wrapper_corr(args):
-    city, dia, lay, measure, reference = args
-    Disk = _constructDisk(city, dia, lay)
+    Disk, city, measure, reference = args
     hashes = _compute_hashes(Disk, measure)
 
-    edits = _mirrorDiagonal(MEASURE[measure](hashes)).flatten()
-    corr = np.corrcoef(edits, REFERENCE[city.lower()+reference.lower()])[0][1]
+    # The dtw looks the distances between the disks up in the tables of the scheme
+    if measure == "py_dtw":
+        similarities = py_dtw_indexed(hashes, Disk.distance_tables)
+    else:
+        similarities = MEASURE[measure](hashes)
+
+    corr = get_correlation(similarities, REFERENCE[city.lower()+reference.lower()])
     return corr
 
 
 
-def _compute_disk_diameter_layers(city: str, layers: list[int], diameter: list[float], measure: str = "py_dtw", reference: str = "dtw", parallell_jobs: int = 20 ):
+def _compute_disk_diameter_layers(city: str, layers: list[int], diameter: list[float], measure: str = "py_dtw", reference: str = "dtw", parallell_jobs: int = 20, seed: int | None = None):
     """ Computations for the visualisation """
     
     pool = Pool()
@@ -101,7 +102,9 @@ def _compute_disk_diameter_layers(city: str, layers: list[int], diameter: list[f
             #edits = _mirrorDiagonal(MEASURE[measure](hashes)).flatten()
 
             #corr = np.corrcoef(edits, REFERENCE[city.lower()+reference.lower()])[0][1]
-            corrs = pool.map(_fun_wrapper_corr, [(city, dia, lay, measure, reference) for _ in range(parallell_jobs)])
+            # The schemes are seeded per job and sent to the workers, so that a run can be reproduced
+            seeds = [None if seed is None else seed + job for job in range(parallell_jobs)]
+            corrs = pool.map(_fun_wrapper_corr, [(_constructDisk(city, dia, lay, seed=job_seed), city, measure, reference) for job_seed in seeds])
             corr = np.average(np.array(corrs) )
             std = np.std(np.array(corrs))
             result.append([corr, dia, std])
@@ -113,7 +116,7 @@ def _compute_disk_diameter_layers(city: str, layers: list[int], diameter: list[f
 
 
 
-def plot_disk_dia_layers(city: str, layers: list[int], diameter: list[float], measure: str = "py_dtw", reference: str = "dtw", parallell_jobs: int = 20 ):
+def plot_disk_dia_layers(city: str, layers: list[int], diameter: list[float], measure: str = "py_dtw", reference: str = "dtw", parallell_jobs: int = 20, seed: int | None = None):
     """ Visualises the 'optimal' values for resolution and layers for the grid hashes 
     
     Param
@@ -130,9 +133,11 @@ def plot_disk_dia_layers(city: str, layers: list[int], diameter: list[float], me
         The true similarities that will be used as reference. Either dtw or frechet
     paralell_jobs : int (default 20)
         Yhe number of parallell jobs that will create the data foundation
+    seed : int | None (default None)
+        Seed for the schemes, job j uses seed + j. Unseeded if None
     """
 
-    results = _compute_disk_diameter_layers(city, layers, diameter, measure, reference, parallell_jobs)
+    results = _compute_disk_diameter_layers(city, layers, diameter, measure, reference, parallell_jobs, seed)
    
 
     fig, ax1 = plt.subplots(figsize=(10,8), dpi=300)
@@ -176,8 +181,13 @@ def _fun_wrapper_corr_disks(args):
     Disk = _constructDisk(city, dia, lay, disks)
     hashes = _compute_hashes(Disk, measure)
 
-    edits = _mirrorDiagonal(MEASURE[measure](hashes)).flatten()
-    corr = np.corrcoef(edits, REFERENCE[city.lower()+reference.lower()])[0][1]
+    # The dtw looks the distances between the disks up in the tables of the scheme
+    if measure == "py_dtw":
+        similarities = py_dtw_indexed(hashes, Disk.distance_tables)
+    else:
+        similarities = MEASURE[measure](hashes)
+
+    corr = get_correlation(similarities, REFERENCE[city.lower()+reference.lower()])
     return corr
 
 
@@ -7,13 +7,14 @@ Will run N processess in parallell to measure time efficiency
 from multiprocessing import Pool
 import time
 import timeit as ti
-import pandas as pd
 
 from schemes.disk_lsh import DiskLSH
+from utils.hash_cache import HashCache
+from utils.similarity_matrix import SimilarityMatrix
 
 from utils.similarity_measures.distance import py_edit_distance as py_ed
 from utils.similarity_measures.distance import py_dtw
-from utils.similarity_measures.distance import py_dtw_parallell
+from utils.similarity_measures.distance import py_dtw_indexed_parallell
 
 P_MAX_LON = -8.57
 P_MIN_LON = -8.66
@@ -37,10 +38,10 @@ MEASURE = {
 }
 
 
-def _constructDisk(city: str, diameter: float, layers: int, disks: int, size: int) -> DiskLSH:
+def _constructDisk(city: str, diameter: float, layers: int, disks: int, size: int, seed: int | None = None) -> DiskLSH:
     """ Constructs a grid hash object over the given city """
     if city.lower() == "porto":
-        return DiskLSH(f"DP_{layers}-{'{:.2f}'.format(diameter)}", P_MIN_LAT, P_MAX_LAT, P_MIN_LON, P_MAX_LON, disks, layers, diameter, PORTO_META(size), PORTO_CHOSEN_DATA)
+        return DiskLSH(f"DP_{layers}-{'{:.2f}'.format(diameter)}", P_MIN_LAT, P_MAX_LAT, P_MIN_LON, P_MAX_LON, disks, layers, diameter, PORTO_META(size), PORTO_CHOSEN_DATA, seed)
     else:
         raise ValueError("City argument must be porto")
     
@@ -97,11 +98,13 @@ def measure_disk_hash_similarity_computation_time(city: str, size: int, diameter
     return execution_times
 
 
-def generate_disk_hash_similarity(city: str, diameter: float, layers: int, disks: int) -> pd.DataFrame:
-    """Generates the full grid hash similarities and saves it as a dataframe """
+def generate_disk_hash_similarity(city: str, diameter: float, layers: int, disks: int, seed: int | None = None) -> SimilarityMatrix:
+    """Generates the full disk hash similarities as a condensed similarity matrix. The hashes of seeded schemes are cached """
 
-    Disk =_constructDisk(city, diameter, layers, disks, 1000)
-    hashes = Disk.compute_dataset_hashes_with_KD_tree_numerical()
-    similarities = py_dtw_parallell(hashes)
+    Disk =_constructDisk(city, diameter, layers, disks, 1000, seed)
+    if seed is not None:
+        Disk.set_hash_cache(HashCache())
+    hashes = Disk.compute_dataset_hashes_with_KD_tree_integer()
+    similarities = py_dtw_indexed_parallell(hashes, Disk.distance_tables)
 
     return similarities
\ No newline at end of file
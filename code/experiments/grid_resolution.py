@@ -16,6 +16,7 @@ from multiprocessing import Pool
 
 from utils import file_handler as fh
 from utils import metafile_handler as mfh
+from utils.similarity_matrix import load_similarity_matrix, get_correlation
 
 from schemes.grid_lsh import GridLSH
 
@@ -36,21 +37,17 @@ MEASURE = {
 
 # Defining helper functions:
 
-def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-    """Flips and mirrors a two-dimenional np.array """
-    return M.values + np.rot90(np.fliplr(M.values))
-
-def _constructGrid(city: str, res: float, layers: int) -> GridLSH:
+def _constructGrid(city: str, res: float, layers: int, seed: int | None = None) -> GridLSH:
     """ Constructs a grid hash object over the given city """
     if city.lower() == "porto":
-        return GridLSH(f"GP_{layers}-{'{:.2f}'.format(res)}", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, res, layers, PORTO_META_TEST, PORTO_CHOSEN_DATA)
+        return GridLSH(f"GP_{layers}-{'{:.2f}'.format(res)}", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, res, layers, PORTO_META_TEST, PORTO_CHOSEN_DATA, seed)
     else:
         raise ValueError("City argument must be porto")
 
 # True similarities:
 
-P_DTW = _mirrorDiagonal(pd.read_csv("./benchmarks/similarities/porto-dtw-test.csv", index_col=0)).flatten() #.stack().values
-P_FRE = _mirrorDiagonal(pd.read_csv("./benchmarks/similarities/porto-frechet-test.csv", index_col=0)).flatten() #.stack().values
+P_DTW = load_similarity_matrix("./benchmarks/similarities/porto-dtw-test.csv")
+P_FRE = load_similarity_matrix("./benchmarks/similarities/porto-frechet-test.csv")
 
 #P_dtw_mirrored = mirrorDiagonal(P_dtw).flatten()
 #P_fre_mirrored = mirrorDiagonal(P_fre).flatten()
@@ -66,15 +63,14 @@ DISTANCE_FUNC = {
 }
 
 def _fun_wrapper_corr(args):
-    city, res, lay, measure, reference = args
-    Grid = _constructGrid(city, res, lay)
+    Grid, city, measure, reference = args
     hashes = Grid.compute_dataset_hashes()
 
-    edits = _mirrorDiagonal(MEASURE[measure](hashes)).flatten()
-    corr = np.corrcoef(edits, REFERENCE[city.lower()+reference.lower()])[0][1]
+    edits = MEASURE[measure](hashes)
+    corr = get_correlation(edits, REFERENCE[city.lower()+reference.lower()])
     return corr
 
-def _compute_grid_res_layers(city: str, layers: list[int], resolution: list[float], measure: str = "py_edp", reference: str = "dtw", parallell_jobs: int = 20 ):
+def _compute_grid_res_layers(city: str, layers: list[int], resolution: list[float], measure: str = "py_edp", reference: str = "dtw", parallell_jobs: int = 20, seed: int | None = None):
     """ Computations for the visualisation """
     
     pool = Pool()
@@ -87,7 +83,9 @@ def _compute_grid_res_layers(city: str, layers: list[int], resolution: list[floa
             #edits = _mirrorDiagonal(MEASURE[measure](hashes)).flatten()
 
             #corr = np.corrcoef(edits, REFERENCE[city.lower()+reference.lower()])[0][1]
-            corrs = pool.map(_fun_wrapper_corr, [(city, res, lay, measure, reference) for _ in range(parallell_jobs)])
+            # The schemes are seeded per job and sent to the workers, so that a run can be reproduced
+            seeds = [None if seed is None else seed + job for job in range(parallell_jobs)]
+            corrs = pool.map(_fun_wrapper_corr, [(_constructGrid(city, res, lay, job_seed), city, measure, reference) for job_seed in seeds])
             corr = np.average(np.array(corrs) )
             std = np.std(np.array(corrs))
             result.append([corr, res, std])
@@ -98,7 +96,7 @@ def _compute_grid_res_layers(city: str, layers: list[int], resolution: list[floa
 
 
 
-def plot_grid_res_layers(city: str, layers: list[int], resolution: list[float], measure: str = "py_edp", reference: str = "dtw", parallell_jobs: int = 20 ):
+def plot_grid_res_layers(city: str, layers: list[int], resolution: list[float], measure: str = "py_edp", reference: str = "dtw", parallell_jobs: int = 20, seed: int | None = None):
     """ Visualises the 'optimal' values for resolution and layers for the grid hashes 
     
     Param
@@ -115,9 +113,11 @@ def plot_grid_res_layers(city: str, layers: list[int], resolution: list[float],
         The true similarities that will be used as reference. Either dtw or frechet
     paralell_jobs : int (default 20)
         Yhe number of parallell jobs that will create the data foundation
+    seed : int | None (default None)
+        Seed for the schemes, job j uses seed + j. Unseeded if None
     """
 
-    results = _compute_grid_res_layers(city, layers, resolution, measure, reference, parallell_jobs)
+    results = _compute_grid_res_layers(city, layers, resolution, measure, reference, parallell_jobs, seed)
    
 
     fig, ax1 = plt.subplots(figsize=(10,8), dpi=300)
@@ -7,11 +7,12 @@ Will run N processess in parallell to measure time efficiency
 from multiprocessing import Pool
 import time
 import timeit as ti
-import pandas as pd
 
 import global_variables
 
 from schemes.grid_lsh import GridLSH
+from utils.hash_cache import HashCache
+from utils.similarity_matrix import SimilarityMatrix
 
 from utils.similarity_measures.distance import py_edit_distance as py_ed
 from utils.similarity_measures.distance import py_edit_distance_penalty as py_edp
@@ -28,10 +29,10 @@ MEASURE = {
     "dtw" : py_edp,
 }
 
-def _constructGrid(city: str, res: float, layers: int, size: int) -> GridLSH:
+def _constructGrid(city: str, res: float, layers: int, size: int, seed: int | None = None) -> GridLSH:
     """ Constructs a grid hash object over the given city """
     if city.lower() == "porto":
-        return GridLSH(f"GP_{layers}-{'{:.2f}'.format(res)}", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, res, layers, PORTO_META(size), PORTO_CHOSEN_DATA)
+        return GridLSH(f"GP_{layers}-{'{:.2f}'.format(res)}", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, res, layers, PORTO_META(size), PORTO_CHOSEN_DATA, seed)
     else:
         raise ValueError("City argument must be porto")
     
@@ -71,9 +72,11 @@ def measure_grid_hash_similarity_computation_time(city: str, size: int, res: flo
 
 
 
-def generate_grid_hash_similarity(city: str, res: float, layers: int) -> pd.DataFrame:
-    """Generates the full grid hash similarities and saves it as a dataframe """
-    Grid =_constructGrid(city, res, layers, 1000)
+def generate_grid_hash_similarity(city: str, res: float, layers: int, seed: int | None = None) -> SimilarityMatrix:
+    """Generates the full grid hash similarities as a condensed similarity matrix. The hashes of seeded grids are cached """
+    Grid =_constructGrid(city, res, layers, 1000, seed)
+    if seed is not None:
+        Grid.set_hash_cache(HashCache())
     hashes = Grid.compute_dataset_hashes()
     similarities = py_edp_parallell(hashes)
 
@@ -14,14 +14,10 @@ import global_variables
 
 from utils import metafile_handler as mfh
 from utils import file_handler as fh
+from utils.similarity_matrix import load_similarity_matrix
 from math import ceil
 
 
-def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-    """Flips and mirrors a two-dimenional np.array """
-    return M.values + np.rot90(np.fliplr(M.values))
-
-
 
 class HCA():
     """ A HCA class created for clustering and visualisation """        
@@ -30,7 +26,7 @@ class HCA():
         self.n_clusters = n_clusters
         
         self.distance_matrix_path = distance_matrix_path
-        self.distances = _mirrorDiagonal(pd.read_csv(os.path.abspath(self.distance_matrix_path),index_col=0))
+        self.distances = load_similarity_matrix(os.path.abspath(self.distance_matrix_path)).to_square()
         self.model, self.clusters = self.generate_agglomerative_clusters()
 
 
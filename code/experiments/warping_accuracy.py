@@ -0,0 +1,124 @@
+"""
+Sheet that measures the speed-up and the accuracy of the banded and approximate (FastDTW) warping of the hash similarities
+
+Each mode is computed over the same hashes as the exact measure, and compared with the exact similarity matrix:
+
+    seconds, speedup     : wall time of the pairwise computation, and the exact time divided by it
+    pearson, spearman    : correlation of the pairs with the exact matrix
+    mean_relative_error  : mean of (approximate - exact) / exact over the pairs with a non-zero exact value
+    correlation_loss     : how much lower the Pearson correlation with the true similarities is than for the exact matrix, if a true matrix is given
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from experiments.grid_similarity import _constructGrid
+from experiments.disk_similarity import _constructDisk
+
+from utils.similarity_matrix import load_similarity_matrix
+from utils.similarity_measures.distance import py_dtw_parallell, py_edit_distance_penalty_parallell
+from utils.similarity_measures.pairwise import PairwiseEngine
+
+
+BANDS = [0.05, 0.1, 0.2]
+RADII = [1, 2, 4]
+
+MEASURE = {
+    "dtw" : py_dtw_parallell,
+    "edp" : py_edit_distance_penalty_parallell,
+}
+
+
+def _get_spearman(x: np.ndarray, y: np.ndarray) -> float:
+    return float(np.corrcoef(pd.Series(x).rank().values, pd.Series(y).rank().values)[0][1])
+
+
+def measure_warping_accuracy(hashes: dict[str, list], measure: str, bands: list[float] = BANDS, radii: list[int] = RADII, true_similarities: str | None = None, processes: int | None = None) -> pd.DataFrame:
+    """
+    Computes the hash similarities exactly, banded and approximated, and compares them with the exact similarities
+
+    Param
+    ---
+    hashes : dict[str, list]
+        The trajectory hashes, disk centers for "dtw" and grid cells for "edp"
+    measure : str
+        "dtw" | "edp"
+    bands : list[float]
+        The bands of the banded warping, as fractions of the longest layer
+    radii : list[int]
+        The radii of the approximate warping
+    true_similarities : str | None
+        The path of the true similarity matrix of the same trajectories (e.g. benchmarks/similarities/porto-dtw.npy), to report the correlation loss
+    processes : int | None
+        The number of worker processes, all available cpus if None
+
+    Returns
+    ---
+    A dataframe with one row per mode ("exact" | "banded" | "fast") and parameter, see the top of this sheet
+    """
+    modes = [("exact", None, {})] + [("banded", band, {"band": band}) for band in bands] + [("fast", radius, {"radius": radius}) for radius in radii]
+
+    true = None
+    if true_similarities is not None:
+        true = load_similarity_matrix(true_similarities).select(sorted(hashes.keys())).condensed.astype(np.float64)
+
+    rows = []
+    with PairwiseEngine(processes) as engine:
+        for mode, parameter, options in modes:
+            start = time.perf_counter()
+            matrix = MEASURE[measure](hashes, engine=engine, **options)
+            seconds = time.perf_counter() - start
+
+            condensed = matrix.condensed.astype(np.float64)
+            if mode == "exact":
+                exact, exact_seconds = condensed, seconds
+            nonzero = exact != 0
+
+            row = {
+                "mode": mode,
+                "parameter": parameter,
+                "seconds": seconds,
+                "speedup": exact_seconds / seconds if seconds > 0 else np.nan,
+                "pearson": float(np.corrcoef(condensed, exact)[0][1]),
+                "spearman": _get_spearman(condensed, exact),
+                "mean_relative_error": float(np.mean((condensed[nonzero] - exact[nonzero]) / exact[nonzero])) if nonzero.any() else 0.0,
+            }
+            if true is not None:
+                row["true_pearson"] = float(np.corrcoef(condensed, true)[0][1])
+                row["correlation_loss"] = rows[0]["true_pearson"] - row["true_pearson"] if rows else 0.0
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def measure_grid_warping_accuracy(city: str, res: float, layers: int, bands: list[float] = BANDS, radii: list[int] = RADII, true_similarities: str | None = None, seed: int | None = None) -> pd.DataFrame:
+    """ Measures the banded and approximate edit distance with penalty over the grid hashes of a city, see measure_warping_accuracy """
+    Grid = _constructGrid(city, res, layers, 1000, seed)
+    hashes = Grid.compute_dataset_hashes()
+    return measure_warping_accuracy(hashes, "edp", bands, radii, true_similarities)
+
+
+def measure_disk_warping_accuracy(city: str, diameter: float, layers: int, disks: int, bands: list[float] = BANDS, radii: list[int] = RADII, true_similarities: str | None = None, seed: int | None = None) -> pd.DataFrame:
+    """ Measures the banded and approximate dtw over the numerical disk hashes of a city, see measure_warping_accuracy """
+    Disk = _constructDisk(city, diameter, layers, disks, 1000, seed)
+    hashes = Disk.compute_dataset_hashes_with_KD_tree_numerical()
+    return measure_warping_accuracy(hashes, "dtw", bands, radii, true_similarities)
+
+
+
+if __name__=="__main__":
+    import random
+
+    from utils.cell_id import pack_cells
+
+    # Random walks in place of hashes, so the sheet can be tried without the data
+    random.seed(1)
+    np.random.seed(1)
+    hashes = {f"t{k}": [list(np.cumsum(np.random.rand(random.randint(40, 120), 2) - 0.5, axis=0)) for _ in range(3)] for k in range(60)}
+    print(measure_warping_accuracy(hashes, "dtw", processes=2).to_string(index=False))
+
+    cells = [np.cumsum(np.random.randint(-1, 2, (random.randint(40, 120), 2)), axis=0) + 100 for _ in range(60 * 3)]
+    hashes = {f"t{k}": [pack_cells(layer[:, 0], layer[:, 1]) for layer in cells[3*k:3*k + 3]] for k in range(60)}
+    print(measure_warping_accuracy(hashes, "edp", processes=2).to_string(index=False))
@@ -17,6 +17,24 @@ P_MAX_LAT = 41.26
 P_MIN_LAT = 41.07
 
 
+#DATA EXTRACTION:
+
+#The minimum number of points a trajectory must have to be included in the dataset
+MIN_NUMBER_OF_POINTS = 2
+
+
+#HASH CACHE:
+
+#The folder where computed dataset hashes are cached
+HASH_CACHE_FOLDER = "../data/hash_cache/"
+
+#The maximum total size of the hash cache (in bytes)
+HASH_CACHE_MAX_BYTES = 2 * 1024**3
+
+#Cached hashes that have not been used for this long are evicted (in seconds)
+HASH_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+
 #FRECHET ALGORITHM:
 
 #Threshold distance to approve that two points are similar enough(in meters) in Frechet distance
@@ -0,0 +1,23 @@
+""" Assembles the similarity matrix of a computation that was split into shards, and writes it as a condensed matrix (see utils/similarity_matrix.py) """
+
+import argparse
+
+import numpy as np
+
+from utils.similarity_matrix import SimilarityMatrix, write_similarity_matrix
+from utils.similarity_measures.pairwise import merge_shards
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Merges the shards of a pairwise similarity computation into one matrix")
+    parser.add_argument("folder", help="The folder the shards were computed into")
+    parser.add_argument("output", help="The path of the merged matrix, e.g. code/benchmarks/similarities/porto-dtw.npy")
+    parser.add_argument("--legacy-csv", action="store_true", help="Also write the matrix as csv")
+    args = parser.parse_args()
+
+    keys, condensed, diagonal = merge_shards(args.folder)
+    if np.any(diagonal != 0):
+        print(f"Warning: {np.count_nonzero(diagonal)} trajectories have a non-zero distance to themselves, which is not stored")
+
+    write_similarity_matrix(SimilarityMatrix(keys, condensed), args.output, args.legacy_csv)
+    print(f"Merged {len(keys)} trajectories into {args.output}")
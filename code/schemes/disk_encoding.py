@@ -0,0 +1,59 @@
+"""
+Output encodings for the disks entered by a trajectory in a DiskLSH layer
+"""
+
+import numpy as np
+
+from utils import alphabetical_number as an
+from utils import cell_id as ci
+
+
+class DiskEncoding:
+    """ Interface for the disk hash encodings """
+
+    def encode(self, disks: np.ndarray, entered: np.ndarray) -> list | np.ndarray:
+        """
+        Encodes the disks entered in one layer
+
+        Params
+        ---
+        disks : np.ndarray (num_disks, 2)
+            The disk centers of the layer
+        entered : np.ndarray[int]
+            The indices of the entered disks, in the order they were entered
+
+        Returns
+        ---
+        A sequence that can be sliced into the hashes of the individual trajectories
+        """
+        pass
+
+
+
+class AlphabeticalEncoding(DiskEncoding):
+    """ Disks as alphabetical names ("AB") """
+
+    def __init__(self) -> None:
+        self._names = []
+
+
+    def encode(self, disks: np.ndarray, entered: np.ndarray) -> list[str]:
+        if len(self._names) < len(disks):
+            self._names = [an.get_alphabetical_value(disk) for disk in range(len(disks))]
+        return [self._names[disk] for disk in entered.tolist()]
+
+
+
+class NumericalEncoding(DiskEncoding):
+    """ Disks as their center coordinates """
+
+    def encode(self, disks: np.ndarray, entered: np.ndarray) -> list[np.ndarray]:
+        return list(disks[entered])
+
+
+
+class IntegerEncoding(DiskEncoding):
+    """ Disks as a compact array of disk indices """
+
+    def encode(self, disks: np.ndarray, entered: np.ndarray) -> np.ndarray:
+        return entered.astype(ci.get_disk_index_dtype(len(disks)))
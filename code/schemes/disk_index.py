@@ -0,0 +1,219 @@
+"""
+Spatial index strategies for finding the disks of a DiskLSH layer that contain a point
+
+Every index is built over the disks of one layer and answers batched queries with (point, disk) pairs,
+so that the hashing engine in DiskLSH is the same for all strategies.
+"""
+
+import numpy as np
+
+from scipy import spatial as sp
+
+
+class DiskIndex:
+    """ Interface for the spatial indexes over the disks of one layer """
+
+    def __init__(self, disks: np.ndarray, radius: float) -> None:
+        """
+        Parameters
+        ----------
+        disks : np.ndarray (num_disks, 2)
+            The disk centers as (lat, lon)
+        radius : float
+            The disk radius in decimal degrees
+        """
+        self.disks = np.asarray(disks, dtype=np.float64).reshape(-1, 2)
+        self.radius = radius
+
+
+    def query_pairs(self, coordinates: np.ndarray, workers: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the disks containing each point
+
+        Params
+        ---
+        coordinates : np.ndarray (n, 2)
+            The points that will be queried
+        workers : int
+            The number of workers the index may use, -1 uses all cpus. Ignored by indexes that are not parallel
+
+        Returns
+        ---
+        (point_index, disk_index) pairs where the point is inside the disk, sorted by point and then disk
+        """
+        pass
+
+
+    def _match_candidates(self, coordinates: np.ndarray, candidates: np.ndarray, chunk_size: int = 65536) -> tuple[np.ndarray, np.ndarray]:
+        """ Brute force matching of points against the candidate disks, in chunks to keep memory bounded """
+        point_index, disk_index = [], []
+        centers = self.disks[candidates]
+
+        for start in range(0, len(coordinates), chunk_size):
+            chunk = coordinates[start:start + chunk_size]
+            distances = np.sqrt((chunk[:, 0, None] - centers[None, :, 0])**2 + (chunk[:, 1, None] - centers[None, :, 1])**2)
+            points, disks = np.nonzero(distances <= self.radius)
+            point_index.append(points + start)
+            disk_index.append(candidates[disks])
+
+        if not point_index:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(point_index).astype(np.int64), np.concatenate(disk_index).astype(np.int64)
+
+
+
+class BruteForceIndex(DiskIndex):
+    """ Checks every point against every disk in the layer """
+
+    def query_pairs(self, coordinates: np.ndarray, workers: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        return self._match_candidates(coordinates, np.arange(len(self.disks)))
+
+
+
+class QuadrantIndex(DiskIndex):
+    """ Splits the area into four quadrants and checks each point against the disks intersecting its quadrant """
+
+    def __init__(self, disks: np.ndarray, radius: float, split_lat: float, split_lon: float, quadrants: list[list[int]]) -> None:
+        """
+        Parameters
+        ----------
+        disks : np.ndarray (num_disks, 2)
+            The disk centers as (lat, lon)
+        radius : float
+            The disk radius in decimal degrees
+        split_lat, split_lon : float
+            The point where the area is split into quadrants
+        quadrants : list[list[int]]
+            The indices of the disks intersecting each of the four quadrants
+        """
+        super().__init__(disks, radius)
+        self.split_lat = split_lat
+        self.split_lon = split_lon
+        self.quadrants = [np.array(sorted(quadrant), dtype=np.int64) for quadrant in quadrants]
+
+
+    def query_pairs(self, coordinates: np.ndarray, workers: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+        # Same quadrant numbering as DiskLSH._get_quadrant
+        upper = coordinates[:, 0] >= self.split_lat
+        right = coordinates[:, 1] > self.split_lon
+        quadrant_of_point = np.where(upper, 0, 2) + right
+
+        point_index, disk_index = [], []
+        for quadrant, candidates in enumerate(self.quadrants):
+            points = np.flatnonzero(quadrant_of_point == quadrant)
+            matched_points, matched_disks = self._match_candidates(coordinates[points], candidates)
+            point_index.append(points[matched_points])
+            disk_index.append(matched_disks)
+
+        point_index = np.concatenate(point_index)
+        disk_index = np.concatenate(disk_index)
+        order = np.lexsort((disk_index, point_index))
+        return point_index[order], disk_index[order]
+
+
+
+class KDTreeIndex(DiskIndex):
+    """ Queries a KD-tree over the disk centers """
+
+    def __init__(self, disks: np.ndarray, radius: float, tree: sp.KDTree | None = None) -> None:
+        super().__init__(disks, radius)
+        self.tree = tree if tree is not None else sp.KDTree(self.disks)
+
+
+    def query_pairs(self, coordinates: np.ndarray, workers: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if len(coordinates) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        intersect_disks = self.tree.query_ball_point(coordinates, self.radius, workers=workers, return_sorted=True)
+        counts = np.fromiter(map(len, intersect_disks), dtype=np.int64, count=len(intersect_disks))
+        point_index = np.repeat(np.arange(len(counts)), counts)
+        disk_index = np.fromiter((disk for disks in intersect_disks for disk in disks), dtype=np.int64, count=counts.sum())
+
+        return point_index, disk_index
+
+
+
+class BucketGridIndex(DiskIndex):
+    """ 
+    Uniform grid over the disk centers with a cell size equal to the disk diameter
+
+    As all disks in a layer share the same radius, a point can only be inside disks centered in its own cell or one of the 8 neighbouring cells.
+    The grid is stored CSR-style: the disks of cell c are cell_disks[cell_start[c]:cell_start[c+1]]
+    """
+
+    # The flat arrays that fully describe the grid
+    ARRAYS = ("origin", "shape", "cell_disks", "cell_start")
+
+    def __init__(self, disks: np.ndarray, radius: float) -> None:
+        super().__init__(disks, radius)
+        self.cell_size = 2 * radius
+
+        if len(self.disks):
+            self.origin = self.disks.min(axis=0)
+            self.shape = (np.floor((self.disks.max(axis=0) - self.origin) / self.cell_size).astype(np.int64) + 1)
+        else:
+            self.origin = np.zeros(2)
+            self.shape = np.ones(2, dtype=np.int64)
+
+        lat_cells, lon_cells = self._get_cells(self.disks)
+        cells = lat_cells * self.shape[1] + lon_cells
+
+        self.cell_disks = np.argsort(cells, kind="stable").astype(np.int64)
+        self.cell_start = np.zeros(self.shape[0] * self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.shape[0] * self.shape[1]), out=self.cell_start[1:])
+
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """ Returns the grid as flat arrays """
+        return {key: np.asarray(getattr(self, key)) for key in self.ARRAYS}
+
+
+    @classmethod
+    def from_arrays(cls, disks: np.ndarray, radius: float, arrays: dict[str, np.ndarray]):
+        """ Restores a grid from the arrays returned by to_arrays, without rebuilding it """
+        index = cls.__new__(cls)
+        DiskIndex.__init__(index, disks, radius)
+        index.cell_size = 2 * radius
+        for key in cls.ARRAYS:
+            setattr(index, key, np.asarray(arrays[key]))
+        return index
+
+
+    def _get_cells(self, coordinates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ Returns the (possibly out of grid) lat and lon cell of each point """
+        cells = np.floor((coordinates - self.origin) / self.cell_size).astype(np.int64)
+        return cells[:, 0], cells[:, 1]
+
+
+    def query_pairs(self, coordinates: np.ndarray, workers: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        lat_cells, lon_cells = self._get_cells(coordinates)
+
+        point_index, disk_index = [], []
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                lat, lon = lat_cells + d_lat, lon_cells + d_lon
+                inside = np.flatnonzero((lat >= 0) & (lat < self.shape[0]) & (lon >= 0) & (lon < self.shape[1]))
+                cells = lat[inside] * self.shape[1] + lon[inside]
+
+                # Expands each point into the disks of the neighbouring cell
+                starts = self.cell_start[cells]
+                counts = self.cell_start[cells + 1] - starts
+                points = np.repeat(inside, counts)
+                position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+                candidates = self.cell_disks[position]
+
+                centers = self.disks[candidates]
+                distances = np.sqrt((coordinates[points, 0] - centers[:, 0])**2 + (coordinates[points, 1] - centers[:, 1])**2)
+                matched = distances <= self.radius
+                point_index.append(points[matched])
+                disk_index.append(candidates[matched])
+
+        point_index = np.concatenate(point_index).astype(np.int64)
+        disk_index = np.concatenate(disk_index).astype(np.int64)
+        order = np.lexsort((disk_index, point_index))
+        return point_index[order], disk_index[order]
@@ -4,15 +4,22 @@ File for a disk-based LSH scheme class in python.
 Takes min/max lat/lon as argument -> Could potentially make this integrated in the future
 """
 import random
+
+from functools import cached_property
+
+import numpy as np
+
 from .lsh_interface import LSHInterface
 
 from utils import trajectory_distance as td
-from utils import alphabetical_number as an
 from utils import metafile_handler as mfh
 from utils import file_handler as fh
 
 from utils.classes.disk import Disk
 
+from .disk_index import DiskIndex, BruteForceIndex, QuadrantIndex, KDTreeIndex, BucketGridIndex
+from .disk_encoding import AlphabeticalEncoding, NumericalEncoding, IntegerEncoding
+
 from matplotlib import pyplot as plt
 from matplotlib import lines
 from matplotlib import collections as mc
@@ -26,12 +33,49 @@ import time
 
 
 
+def _get_disk_entries(point_index: np.ndarray, disk_index: np.ndarray, offsets: np.ndarray, num_disks: int) -> np.ndarray:
+    """ 
+    Finds the points where a trajectory enters a disk
+
+    Params
+    ---
+    point_index, disk_index : np.ndarray
+        Pairs of (point, disk) where the point is inside the disk, sorted by point and then disk
+    offsets : np.ndarray
+        Trajectory k consists of the points offsets[k]:offsets[k+1]
+    num_disks : int
+        The number of disks in the layer
+
+    Returns
+    ---
+    A mask over the pairs, true where the disk did not contain the previous point of the same trajectory
+    """
+    is_first = np.zeros(offsets[-1] + 1, dtype=bool)
+    is_first[offsets[:-1]] = True
+
+    keys = point_index * num_disks + disk_index
+    previous = keys - num_disks
+    position = np.minimum(np.searchsorted(keys, previous), max(len(keys) - 1, 0))
+    within_previous = keys[position] == previous if len(keys) else np.zeros(0, dtype=bool)
+
+    return is_first[point_index] | ~within_previous
+
+
+
 class DiskLSH(LSHInterface):
     """ 
-    A class for a grid-based LSH function for trajectory data
+    A class for a disk-based LSH function for trajectory data
     """
 
-    def __init__(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, disks: int, layers: int, diameter: float, meta_file: str, data_path: str) -> None:
+    # The spatial index strategies and output encodings that can be used for hashing
+    INDEXES = ("naive", "quad_tree", "kd_tree", "bucket_grid")
+    ENCODINGS = {
+        "alphabetical" : AlphabeticalEncoding,
+        "numerical" : NumericalEncoding,
+        "integer" : IntegerEncoding,
+    }
+
+    def __init__(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, disks: int, layers: int, diameter: float, meta_file: str, data_path: str, seed: int | None = None) -> None:
         """
         Parameters
         ----------
@@ -55,8 +99,20 @@ class DiskLSH(LSHInterface):
             A file containing the file-names that should be hashed through this class. Should be in the same folder as the data_path
         data_path: str
             The folder where the trajectories are stored
+        seed: int | None
+            Seed for the random disk centers. Unseeded if None
         """
 
+        self._set_params(name, min_lat, max_lat, min_lon, max_lon, disks, layers, diameter, meta_file, data_path, seed)
+
+        # Lastly, instantiate and compute the disks that will represent the hash function
+        rng = random.Random(seed) if seed is not None else random
+        self.disks = self._timed_build("disks", self._instantiate_disks, self.layers, self.num_disks, rng)
+
+
+    def _set_params(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, disks: int, layers: int, diameter: float, meta_file: str, data_path: str, seed: int | None = None) -> None:
+        """ Sets the parameters and the variables derived from them, everything but the random disks """
+
         # First, intializing the direct variables
 
         self.name = name
@@ -69,22 +125,22 @@ class DiskLSH(LSHInterface):
         self.diameter = diameter
         self.meta_file = meta_file
         self.data_path = data_path
+        self.seed = seed
 
         # Second, instantiate the indirect variables required for the scheme:
         self.lat_len = td.calculate_trajectory_distance([(self.min_lat, self.min_lon), (self.max_lat, self.min_lon)])
         self.lon_len = td.calculate_trajectory_distance([(self.min_lat, self.min_lon), (self.min_lat, self.max_lon)])
         
-        # Lastly, instantiate and compute the disks that will represent the hash function
-        self.disks = self._instantiate_disks(self.layers, self.num_disks)
+        # The build time in seconds of the disks and each auxiliary structure, filled in as the structures are built
+        self.build_times = dict()
         self.hashes = dict()
 
-        # Attributes for quad-tree-like structure
+        # Attributes for quad-tree-like structure. The structure itself (disks_qt) is built on first use
         self.split_lat = (self.max_lat + self.min_lat)/2
         self.split_lon = (self.min_lon + self.max_lon)/2
-        self.disks_qt = self._instantiate_disks_qt(self.layers, self.num_disks)
 
-        # Attributes for utilising a KD-tree during disk against point matching
-        self.KDTrees = self._instantiate_KD_tree(self.layers)
+        # Spatial indexes used by the hashing engine, built on first use
+        self._indexes = dict()
 
     def __str__(self) -> str:
         """ Prints information about the disks"""
@@ -95,19 +151,95 @@ class DiskLSH(LSHInterface):
             f"Layers: {self.layers} \n"
 
 
+    def __getstate__(self) -> dict:
+        """ Leaves out the hashes and the auxiliary structures when pickled, so that the scheme can be sent cheaply to pool workers """
+        state = self.__dict__.copy()
+        state["hashes"] = dict()
+        state["_indexes"] = dict()
+        state.pop("disks_qt", None)
+        state.pop("KDTrees", None)
+        state.pop("distance_tables", None)
+        return state
+
+
     def set_meta_file(self, meta_file: str) -> None:
         """ Resets the meta_file """
         self.meta_file = meta_file
 
 
-    def _instantiate_disks(self, layers: int, num_disks: int) -> dict[str, list]:
+    def _get_params(self) -> dict:
+        return dict(name=self.name, min_lat=float(self.min_lat), max_lat=float(self.max_lat), min_lon=float(self.min_lon), max_lon=float(self.max_lon), disks=int(self.num_disks), layers=int(self.layers), diameter=float(self.diameter), meta_file=self.meta_file, data_path=self.data_path, seed=self.seed)
+
+
+    def _get_arrays(self) -> dict[str, np.ndarray]:
+        return dict(disks=np.array([self.disks[layer] for layer in range(self.layers)], dtype=np.float64).reshape(self.layers, self.num_disks, 2))
+
+
+    def _get_index_arrays(self) -> dict[str, np.ndarray]:
+        """ The bucket grid of each layer is saved as its flat arrays """
+        arrays = dict()
+        for layer in range(self.layers):
+            for key, array in self._get_index("bucket_grid", layer).to_arrays().items():
+                arrays[f"bucket_grid/{layer}/{key}"] = array
+        return arrays
+
+
+    def _set_arrays(self, arrays: dict[str, np.ndarray]) -> None:
+        self.disks = {layer: disks.tolist() for layer, disks in enumerate(arrays["disks"])}
+        self._indexes = dict()
+        self.__dict__.pop("disks_qt", None)
+        self.__dict__.pop("KDTrees", None)
+        self.__dict__.pop("distance_tables", None)
+
+        radius = td.get_latitude_difference(self.diameter/2)
+        if any(key.startswith("bucket_grid/") for key in arrays):
+            self._indexes["bucket_grid"] = {
+                layer: BucketGridIndex.from_arrays(self.disks[layer], radius, {key: arrays[f"bucket_grid/{layer}/{key}"] for key in BucketGridIndex.ARRAYS})
+                for layer in range(self.layers)
+            }
+
+
+    def _timed_build(self, structure: str, build, *args):
+        """ Builds a structure and adds its build time to build_times """
+        start = time.perf_counter()
+        result = build(*args)
+        self.build_times[structure] = self.build_times.get(structure, 0) + time.perf_counter() - start
+        return result
+
+
+    @cached_property
+    def disks_qt(self) -> dict[str, list[list]]:
+        """ The disks of each layer sorted into the quadrants they intersect. Built on first use """
+        return self._timed_build("disks_qt", self._instantiate_disks_qt, self.layers, self.num_disks)
+
+
+    @cached_property
+    def KDTrees(self) -> dict[str, sp.KDTree]:
+        """ A KD-tree over the disks of each layer, used during disk against point matching. Built on first use """
+        return self._timed_build("KDTrees", self._instantiate_KD_tree, self.layers)
+
+
+    @cached_property
+    def distance_tables(self) -> np.ndarray:
+        """ The distances between the disk centers of each layer, (layers, num_disks, num_disks), used by dtw over integer hashes. Built on first use """
+        return self._timed_build("distance_tables", self._instantiate_distance_tables)
+
+
+    def _instantiate_distance_tables(self) -> np.ndarray:
+        """ Computes the euclidean distance between every pair of disk centers in each layer """
+        disks = self._get_arrays()["disks"]
+        differences = disks[:, :, np.newaxis, :] - disks[:, np.newaxis, :, :]
+        return np.sqrt((differences ** 2).sum(axis=3))
+
+
+    def _instantiate_disks(self, layers: int, num_disks: int, rng=random) -> dict[str, list]:
         """ Instantiates the random disks that will be present at each layer """
         disks = dict()
         for layer in range(layers):
             disks_list = []
             for disk in range(num_disks):
-                lat = random.uniform(self.min_lat, self.max_lat)
-                lon = random.uniform(self.min_lon, self.max_lon)
+                lat = rng.uniform(self.min_lat, self.max_lat)
+                lon = rng.uniform(self.min_lon, self.max_lon)
                 disks_list.append([lat, lon])
             
             disks[layer] = disks_list
@@ -202,325 +334,190 @@ class DiskLSH(LSHInterface):
         return trees
 
 
-    def _create_trajectory_hash(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """ Creates a hash for one trajectory for all layers. Returns it as a alist of length layers with a list of hashed point for each layer """
-        
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
-        for layer in self.disks.keys():
-            hash = []   # The created hash
-            within = [] # The disks that the trajectory are currently within
-            disks = self.disks[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                
-                # If next point no longer in disk: Remove from within list
-                for disk in within:
-                    if td.get_euclidean_distance([lat, lon], disk) > radius:
-                        within.remove(disk)
-
-                # If next point inside disk: Append to hash if not still within disk
-                # Can speed up substantially by applying a tree-structure here, naive implementation for now:
-                for i, disk in enumerate(disks):
-                    if td.get_euclidean_distance([lat, lon], disk) <= radius:
-                        if disk not in within:
-                            within.append(disk)
-                            diskHash = an.get_alphabetical_value(i)
-                            hash.append(diskHash)
-            hashes.append(hash)
-        return hashes
+    def _get_index(self, strategy: str, layer: int) -> DiskIndex:
+        """ Returns the spatial index of the given strategy for a layer. Indexes are built on first use and cached """
+        indexes = self._indexes.setdefault(strategy, dict())
+        if layer not in indexes:
+            radius = td.get_latitude_difference(self.diameter/2)
+            match strategy:
+                case "naive":
+                    indexes[layer] = self._timed_build(strategy, BruteForceIndex, self.disks[layer], radius)
+                case "quad_tree":
+                    quadrants = [[disk.name for disk in quadrant] for quadrant in self.disks_qt[layer]]
+                    indexes[layer] = self._timed_build(strategy, QuadrantIndex, self.disks[layer], radius, self.split_lat, self.split_lon, quadrants)
+                case "kd_tree":
+                    indexes[layer] = self._timed_build(strategy, KDTreeIndex, self.disks[layer], radius, self.KDTrees[layer])
+                case "bucket_grid":
+                    indexes[layer] = self._timed_build(strategy, BucketGridIndex, self.disks[layer], radius)
+                case _:
+                    raise ValueError(f"Unknown index strategy {strategy}. Must be one of {', '.join(self.INDEXES)}")
+        return indexes[layer]
+
+
+    def _create_block_hashes(self, coordinates: np.ndarray, offsets: np.ndarray, index: str = "naive", encoding: str = "alphabetical", workers: int = -1) -> list[list]:
+        """ 
+        Hashes a block of trajectories, querying all points of the block at once for each layer
 
+        Params
+        ---
+        coordinates : np.ndarray (n, 2)
+            The coordinates of the trajectories, stored back to back
+        offsets : np.ndarray
+            Trajectory k is coordinates[offsets[k]:offsets[k+1]]
+        index : str
+            The spatial index strategy: "naive" | "quad_tree" | "kd_tree" | "bucket_grid"
+        encoding : str
+            The output encoding: "alphabetical" | "numerical" | "integer"
+        workers : int
+            The number of workers used by parallel indexes, -1 uses all cpus
 
-    def _create_trajectory_hash_numerical(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """ Creates a hash for one trajectory for all layers. Returns it as a alist of length layers with a list of hashed point for each layer """
-        
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
+        Returns
+        ---
+        A list with the hash of each trajectory. Disks entered at the same point are ordered by their index
+        """
+        if encoding not in self.ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding}. Must be one of {', '.join(self.ENCODINGS)}")
+        encoder = self.ENCODINGS[encoding]()
+
+        hashes = [[] for _ in range(len(offsets) - 1)]
         for layer in self.disks.keys():
-            hash = []   # The created hash
-            within = [] # The disks that the trajectory are currently within
-            disks = self.disks[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                
-                # If next point no longer in disk: Remove from within list
-                for disk in within:
-                    if td.get_euclidean_distance([lat, lon], disk) > radius:
-                        within.remove(disk)
-
-                # If next point inside disk: Append to hash if not still within disk
-                # Can speed up substantially by applying a tree-structure here, naive implementation for now:
-                for i, disk in enumerate(disks):
-                    if td.get_euclidean_distance([lat, lon], disk) <= radius:
-                        if disk not in within:
-                            within.append(disk)
-                            diskHash = disk
-                            hash.append(diskHash)
-            hashes.append(hash)
-        return hashes
-    
-    
-    def _create_trajectory_hash_with_quad_tree(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """Same as above, but utilises a quad-tree-like structure for faster computation """
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
-        for layer in self.disks_qt.keys():
-            hash = []
-            within = []
-            disks = self.disks_qt[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                quadrant = self._get_quadrant(lat,lon, self.split_lat, self.split_lon)
-
-                for disk in within:
-                    if td.get_euclidean_distance([lat, lon], [disk.lat, disk.lon]) > radius:
-                        within.remove(disk)
-                
-                for disk in disks[quadrant]:
-                    if td.get_euclidean_distance([lat, lon], [disk.lat, disk.lon]) <= radius:
-                        if disk not in within:
-                            within.append(disk)
-                            diskHash = an.get_alphabetical_value(disk.name)
-                            hash.append(diskHash)
-            hashes.append(hash)
-        return hashes
-    
+            disk_index = self._get_index(index, layer)
+            point_index, disk_index = disk_index.query_pairs(coordinates, workers)
 
-    def _create_trajectory_hash_with_quad_tree_numerical(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """Same as above, but utilises a quad-tree-like structure for faster computation -numerical """
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
-        for layer in self.disks_qt.keys():
-            hash = []
-            within = []
-            disks = self.disks_qt[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                quadrant = self._get_quadrant(lat,lon, self.split_lat, self.split_lon)
-
-                for disk in within:
-                    if td.get_euclidean_distance([lat, lon], [disk.lat, disk.lon]) > radius:
-                        within.remove(disk)
-                
-                for disk in disks[quadrant]:
-                    if td.get_euclidean_distance([lat, lon], [disk.lat, disk.lon]) <= radius:
-                        if disk not in within:
-                            within.append(disk)
-                            diskHash = disk
-                            hash.append(diskHash)
-            hashes.append(hash)
-        return hashes
+            entries = _get_disk_entries(point_index, disk_index, offsets, self.num_disks)
+            values = encoder.encode(np.asarray(self.disks[layer]), disk_index[entries])
+            bounds = np.searchsorted(point_index[entries], offsets).tolist()
 
-    
-    def _create_trajectory_hash_with_KD_tree(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """Same as above, but utilises a KD-tree-like for faster computation """
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
-        for layer in self.disks.keys():
-            hash = []
-            within = []
-            tree = self.KDTrees[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                for disk in within:
-                    dsklat, dsklon = self.disks[layer][disk]
-                    #print(dsklat, dsklon)
-                    if td.get_euclidean_distance([lat, lon], [dsklat, dsklon]) > radius:
-                        #print("Removing disk")
-                        #print(dsklat, dsklon)
-                        within.remove(disk)
-
-                # Gives disk index
-                intersect_disks = tree.query_ball_point([lat,lon], radius)
-                for disk in intersect_disks:
-                    if disk not in within:
-                        within.append(disk)
-                        diskHash = an.get_alphabetical_value(disk)
-                        hash.append(diskHash)
-            hashes.append(hash)
-        return hashes
+            for k, hash in enumerate(hashes):
+                hash.append(values[bounds[k]:bounds[k+1]])
 
-    
-    def _create_trajectory_hash_with_KD_tree_numerical(self, trajectory: list[list[float]]) -> list[list[str]]:
-        """ Same as above, but creates hashes that consists of the disks coordinates """
-        hashes = []
-        radius = td.get_latitude_difference(self.diameter/2)
-        for layer in self.disks.keys():
-            hash = []
-            within = []
-            tree = self.KDTrees[layer]
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                for disk in within:
-                    dsklat, dsklon = self.disks[layer][disk]
-                    if td.get_euclidean_distance([lat, lon], [dsklat, dsklon]) > radius:
-                        within.remove(disk)
-
-                # Gives disk index
-                intersect_disks = tree.query_ball_point([lat,lon], radius)
-                for disk in intersect_disks:
-                    if disk not in within:
-                        within.append(disk)
-                        diskHash = tree.data[disk]
-                        hash.append(diskHash)
-            hashes.append(hash)
         return hashes
 
 
-    def compute_dataset_hashes(self) -> dict[str, list]:
+    def _create_trajectory_hash(self, trajectory: list[list[float]], index: str = "naive", encoding: str = "alphabetical") -> list[list[str]]:
+        """ Creates a hash for one trajectory for all layers. Returns it as a list of length layers with a list of hashed points for each layer """
+        coordinates = np.asarray(trajectory, dtype=np.float64).reshape(-1, 2)
+        return self._create_block_hashes(coordinates, np.array([0, len(coordinates)]), index, encoding)[0]
+
+
+    def _hash_dataset(self, index: str, encoding: str, workers: int = -1) -> dict[str, list]:
+        """ Hashes the trajectories in the meta_file with the given index strategy and encoding """
+        files = mfh.read_meta_file(self.meta_file)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
+
+        # The hashes does not depend on the index strategy, so cached hashes are shared between the strategies
+        compute = lambda coordinates, offsets: self._create_block_hashes(coordinates, offsets, index, encoding, workers)
+        return self._get_cached_hashes(encoding, keys, coordinates, offsets, compute)
+
+
+    def compute_dataset_hashes(self, index: str = "naive", encoding: str = "alphabetical", workers: int = -1) -> dict[str, list]:
         """ Method for computing the disk hashes for a given dataset. Stores the hashes in a dictionary
 
         Params
         ---
-        meta_file_path : str
-            The path to the dataset metafile
+        index : str
+            The spatial index strategy: "naive" | "quad_tree" | "kd_tree" | "bucket_grid"
+        encoding : str
+            The output encoding: "alphabetical" | "numerical" | "integer"
+        workers : int
+            The number of workers used by parallel indexes, -1 uses all cpus
 
         Returns
         ---
         A dictionary containing the hashes
         """
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-
-        # Beginning to hash trajectories
-        for key in trajectories:
-            self.hashes[key] = self._create_trajectory_hash(trajectories[key])
-        
+        self.hashes.update(self._hash_dataset(index, encoding, workers))
         return self.hashes
 
 
     def compute_dataset_hashes_with_quad_tree(self) -> dict[str, list]:
         """ Same as above, but utilises a quad-tree-like-structure for faster computation"""
-        # TODO
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-
-        # Beginning to hash trajectories
-        hashes = dict()
-        for key in trajectories:
-            hashes[key] = self._create_trajectory_hash(trajectories[key])
-        
-        return hashes
+        return self._hash_dataset("quad_tree", "alphabetical")
 
     
-    def compute_dataset_hashes_with_KD_tree(self) -> dict[str, list]:
+    def compute_dataset_hashes_with_KD_tree(self, workers: int = -1) -> dict[str, list]:
         """ Same as above, but utilises a KD-tree for faster computation"""
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-
-        # Beginning to hash trajectories
-        hashes = dict()
-        for key in trajectories:
-            hashes[key] = self._create_trajectory_hash_with_KD_tree(trajectories[key])
-        
-        return hashes
+        return self._hash_dataset("kd_tree", "alphabetical", workers)
 
     
-    def compute_dataset_hashes_with_KD_tree_numerical(self) -> dict[str, list]:
-        """Same as aboce, but returns the hashes as the disks center coordinates"""
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
+    def compute_dataset_hashes_with_KD_tree_numerical(self, workers: int = -1) -> dict[str, list]:
+        """Same as above, but returns the hashes as the disks center coordinates"""
+        return self._hash_dataset("kd_tree", "numerical", workers)
 
-        # Beginning to hash trajectories
-        hashes = dict()
-        for key in trajectories:
-            hashes[key] = self._create_trajectory_hash_with_KD_tree_numerical(trajectories[key])
-        
-        return hashes
+
+    def compute_dataset_hashes_with_KD_tree_integer(self, workers: int = -1) -> dict[str, list]:
+        """Same as above, but returns the hashes as arrays of disk indices. Use utils.cell_id.export_hashes to get the alphabetical form"""
+        return self._hash_dataset("kd_tree", "integer", workers)
 
 
-    def measure_hash_computation(self, number: int, repeat: int) -> list[list, int]:
-        """ Method for measuring the computation time of the grid hashes. Does not change the object nor its attributes. """
+    def measure_hash_computation(self, number: int, repeat: int, index: str = "naive", encoding: str = "alphabetical") -> list[list, int]:
+        """ Method for measuring the computation time of the disk hashes. Does not change the object nor its attributes. """
         files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
         hashes = dict()
+
+        # The index is built before measuring, so that only the hashing itself is timed
+        for layer in self.disks.keys():
+            self._get_index(index, layer)
         
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash(trajectories[key])
+        def compute_hashes(coordinates: np.ndarray, offsets: np.ndarray, hashes: dict):
+            for key, hash in zip(keys, self._create_block_hashes(coordinates, offsets, index, encoding)):
+                hashes[key] = hash
             return
             
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
+        measures = ti.repeat(lambda: compute_hashes(coordinates, offsets, hashes), number=number, repeat=repeat, timer=time.process_time)
         return (measures, len(hashes))
     
 
     def measure_hash_computation_numerical(self, number: int, repeat: int) -> list[list, int]:
-        """ Method for measuring the computation time of the grid hashes. Does not change the object nor its attributes. """
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-        hashes = dict()
-        
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash_numerical(trajectories[key])
-            return
-            
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
-        return (measures, len(hashes))
+        """ Same as above, but with the disks center coordinates as hashes """
+        return self.measure_hash_computation(number, repeat, "naive", "numerical")
 
 
-    def measure_hash_computation_with_quad_tree(self, number: int, repeat: int) -> None:
+    def measure_hash_computation_with_quad_tree(self, number: int, repeat: int) -> list[list, int]:
         """ Same as above, but using quad-structure for speed improvement """
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-        hashes = dict()
-        
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash_with_quad_tree(trajectories[key])
-            return
-
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
-        return (measures, len(hashes))
+        return self.measure_hash_computation(number, repeat, "quad_tree", "alphabetical")
     
 
-    def measure_hash_computation_with_quad_tree_numerical(self, number: int, repeat: int) -> None:
+    def measure_hash_computation_with_quad_tree_numerical(self, number: int, repeat: int) -> list[list, int]:
         """ Same as above, but using quad-structure for speed improvement """
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-        hashes = dict()
-        
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash_with_quad_tree_numerical(trajectories[key])
-            return
-
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
-        return (measures, len(hashes))
+        return self.measure_hash_computation(number, repeat, "quad_tree", "numerical")
 
     
-    def measure_hash_computation_with_KD_tree(self, number: int, repeat: int) -> None:
+    def measure_hash_computation_with_KD_tree(self, number: int, repeat: int) -> list[list, int]:
         """ Same as above, but using KD-tree for speed improvement """
+        return self.measure_hash_computation(number, repeat, "kd_tree", "alphabetical")
 
-        files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-        hashes = dict()
-        
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash_with_KD_tree(trajectories[key])
-            return
-        
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
 
-        return (measures, len(hashes))
+    def measure_hash_computation_with_KD_tree_numerical(self, number: int, repeat: int) -> list[list, int]:
+        """ Same as above, but using KD-tree for speed improvement """
+        return self.measure_hash_computation(number, repeat, "kd_tree", "numerical")
 
 
-    def measure_hash_computation_with_KD_tree_numerical(self, number: int, repeat: int) -> None:
-        """ Same as above, but using KD-tree for speed improvement """
+    def measure_index_strategies(self, number: int, repeat: int, encoding: str = "integer") -> dict[str, list]:
+        """ 
+        Measures the hash computation time of every index strategy on the same disks and data
 
+        Returns
+        ---
+        A dictionary with the measures of each strategy. Raises an exception if the strategies produce different hashes
+        """
         files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
-        hashes = dict()
-        
-        def compute_hashes(trajectories: dict, hashes: dict):
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash_with_KD_tree_numerical(trajectories[key])
-            return
-        
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
+
+        measures = dict()
+        reference = None
+        for index in self.INDEXES:
+            hashes = self._create_block_hashes(coordinates, offsets, index, encoding)
+            if reference is None:
+                reference = hashes
+            elif any(not np.array_equal(x, y) for hash_x, hash_y in zip(reference, hashes) for x, y in zip(hash_x, hash_y)):
+                raise Exception(f"Index strategy {index} produced different hashes than {self.INDEXES[0]}")
+
+            measures[index] = ti.repeat(lambda: self._create_block_hashes(coordinates, offsets, index, encoding), number=number, repeat=repeat, timer=time.process_time)
+
+        return measures
 
-        return (measures, len(hashes))
 
     def print_hashes(self) -> None:
         """ Printing the hashes """
@@ -81,3 +81,33 @@ def fun_wrapper_p_KD_tree(args):
     disk = DiskLSH("Porto D1", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, num_disks, layers, diameter, meta_file_p, PORTO_DATA)
    
     return disk.measure_hash_computation_with_KD_tree_numerical(1,1)[0]
+
+
+def fun_wrapper_p_index_strategies(args):
+    """ Wrapper function for measuring all disk index strategies on the same disks
+    ---
+    params : [num_of_files, disks, layers, diameter]
+        num_of_files must match one of the meta-files
+
+    Returns a dictionary with the measures of each index strategy. Raises an exception if the strategies disagree on the hashes
+    """
+
+    num_of_files, num_disks, layers, diameter = args
+    meta_file_p = f"../data/chosen_data/{global_variables.CHOSEN_SUBSET_NAME}/META.txt"
+    disk = DiskLSH("Porto D1", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, num_disks, layers, diameter, meta_file_p, PORTO_DATA)
+
+    return {index: measures[0] for index, measures in disk.measure_index_strategies(1,1).items()}
+
+
+def fun_wrapper_p_bucket_grid(args):
+    """ Wrapper function for measuring disk hash computation
+    ---
+    params : [num_of_files, disks, layers, diameter]
+        num_of_files must match one of the meta-files
+    """
+
+    num_of_files, num_disks, layers, diameter = args
+    meta_file_p = f"../data/chosen_data/{global_variables.CHOSEN_SUBSET_NAME}/META.txt"
+    disk = DiskLSH("Porto D1", global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON, num_disks, layers, diameter, meta_file_p, PORTO_DATA)
+   
+    return disk.measure_hash_computation(1,1, "bucket_grid", "numerical")[0]
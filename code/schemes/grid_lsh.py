@@ -5,17 +5,18 @@ Takes min/max lat/lon as argument -> Could potentially make this integrated in t
 """
 import random
 
+import numpy as np
+
 from .lsh_interface import LSHInterface
 
 from utils import trajectory_distance as td
 from utils import alphabetical_number as an
+from utils import cell_id as ci
 from utils import metafile_handler as mfh
 from utils import file_handler as fh
 
 from colorama import init as colorama_init, Fore, Style
 
-from itertools import groupby
-
 import timeit as ti
 import time
 
@@ -24,7 +25,7 @@ class GridLSH(LSHInterface):
     A class for a grid-based LSH function for trajectory data
     """
 
-    def __init__(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, resolution: float, layers: int, meta_file: str, data_path: str) -> None:
+    def __init__(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, resolution: float, layers: int, meta_file: str, data_path: str, seed: int | None = None) -> None:
         """
         Parameters
         ----------
@@ -46,8 +47,19 @@ class GridLSH(LSHInterface):
             A file containing the file-names that should be hashed through this class. Should be in the same folder as the data_path
         data_path: str
             The folder where the trajectories are stored
+        seed: int | None
+            Seed for the random grid distortions. Unseeded if None
         """
         
+        self._set_params(name, min_lat, max_lat, min_lon, max_lon, resolution, layers, meta_file, data_path, seed)
+
+        rng = random.Random(seed) if seed is not None else random
+        self._set_distortion(self._compute_grid_distortion(self.lat_len, self.lon_len, self.resolution, self.layers, rng))
+
+
+    def _set_params(self, name: str, min_lat: float, max_lat: float, min_lon: float, max_lon: float, resolution: float, layers: int, meta_file: str, data_path: str, seed: int | None = None) -> None:
+        """ Sets the parameters and the variables derived from them, everything but the random grid distortion """
+
         # First, initiating the direct variables
 
         self.name = name
@@ -59,6 +71,7 @@ class GridLSH(LSHInterface):
         self.layers = layers
         self.meta_file = meta_file
         self.data_path = data_path
+        self.seed = seed
 
         # Second, instantiate the indirect variables required for the scheme
 
@@ -67,11 +80,16 @@ class GridLSH(LSHInterface):
         self.lat_res = td.get_latitude_difference(self.resolution)
         self.lon_res = td.get_longitude_difference(self.resolution, self.min_lat)
 
-        self.distortion = self._compute_grid_distortion(self.lat_len, self.lon_len, self.resolution, self.layers)
-
         self.hashes = dict()
 
 
+    def __getstate__(self) -> dict:
+        """ Leaves out the hashes when pickled, so that the scheme can be sent cheaply to pool workers """
+        state = self.__dict__.copy()
+        state["hashes"] = dict()
+        return state
+
+
     def __str__(self) -> str:
         """ Prints information about the grid """
         lat_cells = int((self.max_lat - self.min_lat) // self.lat_res)
@@ -90,41 +108,113 @@ class GridLSH(LSHInterface):
         self.meta_file = meta_file
 
 
-    def _compute_grid_distortion(self, lat_len: float, lon_len: float, resolution: float, layers: int) -> list[float]:
+    def _compute_grid_distortion(self, lat_len: float, lon_len: float, resolution: float, layers: int, rng=random) -> list[float]:
         """ Compute a random grid distortion off the resolution for the number of layers"""
 
         # Distortion should be a random float in the interval [0, resolution)
-        distortion = [random.random()*resolution for x in range(layers)]
+        distortion = [rng.random()*resolution for x in range(layers)]
         return distortion
 
 
+    def _set_distortion(self, distortion: list[float]) -> None:
+        """ Sets the grid distortion (km) and the corresponding distortion in degrees for each layer """
+        self.distortion = list(distortion)
+        self.lat_distortion = np.array([td.get_latitude_difference(distortion) for distortion in self.distortion])
+        self.lon_distortion = np.array([td.get_longitude_difference(distortion, self.min_lat) for distortion in self.distortion])
+
+
+    def _get_params(self) -> dict:
+        return dict(name=self.name, min_lat=float(self.min_lat), max_lat=float(self.max_lat), min_lon=float(self.min_lon), max_lon=float(self.max_lon), resolution=float(self.resolution), layers=int(self.layers), meta_file=self.meta_file, data_path=self.data_path, seed=self.seed)
+
+
+    def _get_arrays(self) -> dict[str, np.ndarray]:
+        return dict(distortion=np.array(self.distortion, dtype=np.float64))
+
+
+    def _set_arrays(self, arrays: dict[str, np.ndarray]) -> None:
+        self._set_distortion(arrays["distortion"].tolist())
+
+
+    def _compute_cell_indices(self, coordinates: np.ndarray, offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ 
+        Snaps a block of trajectories to the grid for all layers at once
+
+        Params
+        ---
+        coordinates : np.ndarray (n, 2)
+            The coordinates of the trajectories, stored back to back
+        offsets : np.ndarray
+            Trajectory k is coordinates[offsets[k]:offsets[k+1]]
+
+        Returns
+        ---
+        (lat_cells, lon_cells, keep) as (layers, n) arrays, where keep masks out consecutive duplicate cells within each trajectory
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+        # Normalise the coordinates over 0 and compute the corresponding cell in each direction for every layer
+        lat_cells = np.floor_divide(coordinates[:, 0] + self.lat_distortion[:, None] - self.min_lat, self.lat_res).astype(np.int64)
+        lon_cells = np.floor_divide(coordinates[:, 1] + self.lon_distortion[:, None] - self.min_lon, self.lon_res).astype(np.int64)
+
+        keep = np.ones(lat_cells.shape, dtype=bool)
+        keep[:, 1:] = (np.diff(lat_cells, axis=1) != 0) | (np.diff(lon_cells, axis=1) != 0)
+
+        # The first point of every trajectory is always kept
+        starts = offsets[:-1][np.diff(offsets) > 0]
+        keep[:, starts] = True
+
+        return lat_cells, lon_cells, keep
+
+
+    def _create_block_hashes(self, coordinates: np.ndarray, offsets: np.ndarray) -> list[list[list[str]]]:
+        """ Creates the hashes for a block of trajectories, returns a list with the hash of each trajectory """
+
+        lat_cells, lon_cells, keep = self._compute_cell_indices(coordinates, offsets)
+
+        hashes = [[] for _ in range(len(offsets) - 1)]
+        for layer in range(self.layers):
+            # Only the cells left after removing consecutive duplicates are converted
+            values = an.get_alphabetical_values(lat_cells[layer][keep[layer]].tolist(), lon_cells[layer][keep[layer]].tolist())
+
+            bounds = np.zeros(len(keep[layer]) + 1, dtype=np.int64)
+            np.cumsum(keep[layer], out=bounds[1:])
+            bounds = bounds[offsets].tolist()
+
+            for k, hash in enumerate(hashes):
+                hash.append(values[bounds[k]:bounds[k+1]])
+
+        return hashes
+
+
+    def _create_block_hashes_integer(self, coordinates: np.ndarray, offsets: np.ndarray) -> list[list[np.ndarray]]:
+        """ Same as above, but each hashed layer is a uint32 array of packed (lat, lon) cell ids """
+
+        lat_cells, lon_cells, keep = self._compute_cell_indices(coordinates, offsets)
+
+        hashes = [[] for _ in range(len(offsets) - 1)]
+        for layer in range(self.layers):
+            codes = ci.pack_cells(lat_cells[layer][keep[layer]], lon_cells[layer][keep[layer]])
+
+            bounds = np.zeros(len(keep[layer]) + 1, dtype=np.int64)
+            np.cumsum(keep[layer], out=bounds[1:])
+            bounds = bounds[offsets].tolist()
+
+            for k, hash in enumerate(hashes):
+                hash.append(codes[bounds[k]:bounds[k+1]])
+
+        return hashes
+
+
     def _create_trajectory_hash(self, trajectory: list[list[float]]) -> list[list[str]]:
         """ Creates a hash for one trajectory for all layers, returns it as a list of length layers with a list for each hashed layer """
+        coordinates = np.asarray(trajectory, dtype=np.float64).reshape(-1, 2)
+        return self._create_block_hashes(coordinates, np.array([0, len(coordinates)]))[0]
 
-        # Snap trajectories to grid:
-        hashes = []
-        for layer in range(self.layers):
-            distortion = self.distortion[layer]
-            
-            lat_distort = td.get_latitude_difference(distortion)
-            lon_distort = td.get_longitude_difference(distortion, self.min_lat)
-            hash = []
-            # print(lat_res, lon_res)
-            for coordinate in trajectory:
-                lat, lon = coordinate
-                
-                # Normalise the coordinate over 0 and compute the corresponding cell in for eac direction
-                lat_hash = int((lat + lat_distort - self.min_lat) // self.lat_res)
-                lon_hash = int((lon + lon_distort - self.min_lon) // self.lon_res)
-                hash.append(an.get_alphabetical_value([lat_hash, lon_hash]))
-            hashes.append(hash)
-    
-        # Then remove consecutive duplicats and return result:
-        result = []
-        for hash in hashes:
-            result.append([el[0] for el in groupby(hash)])
-        
-        return result
+
+    def _create_trajectory_hash_integer(self, trajectory: list[list[float]]) -> list[np.ndarray]:
+        """ Same as above, but returns a uint32 array of packed cell ids for each hashed layer """
+        coordinates = np.asarray(trajectory, dtype=np.float64).reshape(-1, 2)
+        return self._create_block_hashes_integer(coordinates, np.array([0, len(coordinates)]))[0]
   
 
     def compute_dataset_hashes(self) -> dict[str,list]:
@@ -140,11 +230,21 @@ class GridLSH(LSHInterface):
         A dictionary containing the hashes
         """
         files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
+
+        # Hashing all trajectories at once, unless they are in the hash cache
+        self.hashes.update(self._get_cached_hashes("alphabetical", keys, coordinates, offsets, self._create_block_hashes))
+
+        return self.hashes
+
+
+
+    def compute_dataset_hashes_integer(self) -> dict[str, list[np.ndarray]]:
+        """ Same as above, but with integer hashes. Use utils.cell_id.export_hashes to get the alphabetical form """
+        files = mfh.read_meta_file(self.meta_file)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
 
-        # Starting to hash the trajectories
-        for key in trajectories:
-            self.hashes[key] = self._create_trajectory_hash(trajectories[key])
+        self.hashes.update(self._get_cached_hashes("integer", keys, coordinates, offsets, self._create_block_hashes_integer))
 
         return self.hashes
 
@@ -153,15 +253,14 @@ class GridLSH(LSHInterface):
     def measure_hash_computation(self, repeat: int, number: int) -> list:
         """ Method for measuring the computation time of the grid hashes. Does not change the object nor its attributes. """
         files = mfh.read_meta_file(self.meta_file)
-        trajectories = fh.load_trajectory_files(files, self.data_path)
+        keys, coordinates, offsets = fh.load_trajectory_block(files, self.data_path)
         hashes = dict()
-        def compute_hashes(trajectories, hashes):
-            #self.hashes.clear()
-            for key in trajectories:
-                hashes[key] = self._create_trajectory_hash(trajectories[key])
+        def compute_hashes(coordinates, offsets, hashes):
+            for key, hash in zip(keys, self._create_block_hashes(coordinates, offsets)):
+                hashes[key] = hash
             return
 
-        measures = ti.repeat(lambda: compute_hashes(trajectories, hashes), number=number, repeat=repeat, timer=time.process_time)
+        measures = ti.repeat(lambda: compute_hashes(coordinates, offsets, hashes), number=number, repeat=repeat, timer=time.process_time)
         return (measures, len(hashes))
 
 
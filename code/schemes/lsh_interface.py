@@ -2,9 +2,20 @@
 Superclass for LSHschemes
 """
 
+import hashlib
+import json
+
+import numpy as np
+
+from utils import hash_cache as hc
+
+
 class LSHInterface:
     """ Interface for LSH classes"""
 
+    # The on-disk cache checked before computing dataset hashes. No caching if None
+    hash_cache = None
+
     def _create_trajectory_hash(self, trajectory: list[list[float]]) -> list[list[str]]:
         """ Hash a single trajectory """
         pass
@@ -25,4 +36,76 @@ class LSHInterface:
         """ Method to set a schemes meta_file"""
         pass
 
-    
\ No newline at end of file
+    # Saving and loading schemes. Subclasses describe themselves through _get_params, _get_arrays and _set_arrays
+
+    # Parameters that does not affect the hashes, and are therefore left out of the fingerprint
+    _UNHASHED_PARAMS = ("name", "meta_file", "data_path", "seed")
+
+    def _get_params(self) -> dict:
+        """ Returns the keyword arguments that the scheme was constructed with """
+        pass
+
+    def _set_params(self, **params) -> None:
+        """ Sets the parameters returned by _get_params and the variables derived from them, without drawing the random state """
+        pass
+
+    def _get_arrays(self) -> dict[str, np.ndarray]:
+        """ Returns the random state of the scheme (distortions, disks) as arrays """
+        pass
+
+    def _get_index_arrays(self) -> dict[str, np.ndarray]:
+        """ Returns prebuilt index structures as arrays, so that they don't have to be rebuilt on load """
+        return dict()
+
+    def _set_arrays(self, arrays: dict[str, np.ndarray]) -> None:
+        """ Restores the random state and prebuilt indexes from the arrays written by save """
+        pass
+
+    def fingerprint(self) -> str:
+        """ Returns a hex digest that identifies the hash function, two schemes with the same fingerprint produce the same hashes """
+        params = {key: value for key, value in self._get_params().items() if key not in self._UNHASHED_PARAMS}
+        digest = hashlib.sha256(type(self).__name__.encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        for key, array in sorted(self._get_arrays().items()):
+            digest.update(key.encode())
+            digest.update(np.ascontiguousarray(array, dtype="<f8").tobytes())
+        return digest.hexdigest()
+
+    def save(self, file_path: str) -> None:
+        """ Saves the scheme parameters, random state and prebuilt indexes to a .npz file. The hashes are not saved """
+        arrays = {**self._get_arrays(), **self._get_index_arrays()}
+        with open(file_path, "wb") as file:
+            np.savez(file, scheme=np.array(type(self).__name__), params=np.array(json.dumps(self._get_params())), **arrays)
+
+    @classmethod
+    def load(cls, file_path: str):
+        """ Loads a scheme saved with save. The loaded scheme produces the same hashes as the saved one """
+        with np.load(file_path, allow_pickle=False) as data:
+            if str(data["scheme"]) != cls.__name__:
+                raise ValueError(f"{file_path} contains a {data['scheme']} scheme, not a {cls.__name__}")
+            params = json.loads(str(data["params"]))
+            arrays = {key: data[key] for key in data.files if key not in ("scheme", "params")}
+
+        # The constructor is bypassed, so that loading neither draws from the global random state nor builds the random state it replaces
+        scheme = cls.__new__(cls)
+        scheme._set_params(**params)
+        scheme._set_arrays(arrays)
+        return scheme
+
+    # Caching of dataset hashes
+
+    def set_hash_cache(self, hash_cache) -> None:
+        """ Sets the utils.hash_cache.HashCache used by compute_dataset_hashes. None disables caching """
+        self.hash_cache = hash_cache
+
+    def _get_cached_hashes(self, encoding: str, keys: list[str], coordinates: np.ndarray, offsets: np.ndarray, compute) -> dict[str, list]:
+        """ Returns the hashes of the trajectory block from the hash cache, or computes them with compute(coordinates, offsets) and caches them """
+        if self.hash_cache is None:
+            return dict(zip(keys, compute(coordinates, offsets)))
+
+        key = self.hash_cache.get_key(self.fingerprint(), encoding, hc.get_dataset_fingerprint(keys, coordinates, offsets))
+        hashes = self.hash_cache.get(key)
+        if hashes is None:
+            hashes = dict(zip(keys, compute(coordinates, offsets)))
+            self.hash_cache.put(key, hashes, encoding)
+        return hashes
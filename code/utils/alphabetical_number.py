@@ -50,6 +50,24 @@ def get_alphabetical_value(hash: list[int] | int) -> str:
 
 
 
+# Lookup tables with the two-character values of every valid key, used for converting many keys at once
+_UPPER_VALUES = [_get_char_value(key, "A") for key in range(676)]
+_LOWER_VALUES = [_get_char_value(key, "a") for key in range(676)]
+
+def get_alphabetical_values(lat_keys: list[int], lon_keys: list[int]) -> list[str]:
+    """ 
+    Returns the strings representing a sequence of [lat, lon] hash outputs
+    Same as calling get_alphabetical_value([lat, lon]) for each pair, but using lookup tables
+    """
+    if min(lat_keys, default=0) < 0 or min(lon_keys, default=0) < 0:
+        return [get_alphabetical_value([lat, lon]) for lat, lon in zip(lat_keys, lon_keys)]
+    if max(lat_keys, default=0) >= 676 or max(lon_keys, default=0) >= 676:
+        raise ValueError("Error: Too big number to be converted to alphabetic number")
+
+    return [_UPPER_VALUES[lat] + _LOWER_VALUES[lon] for lat, lon in zip(lat_keys, lon_keys)]
+
+
+
 if __name__=="__main__":
     assert get_alphabetical_value([1, 13]) == "ABan"
     assert get_alphabetical_value([5, 32]) == "AFbg"
@@ -60,5 +78,7 @@ if __name__=="__main__":
     assert get_alphabetical_value(1) == "AB"
     assert get_alphabetical_value(35) == "BJ"
     assert get_alphabetical_value(675) == "ZZ"
+    assert get_alphabetical_values([1, 5, 675], [13, 32, 675]) == ["ABan", "AFbg", "ZZzz"]
+    assert get_alphabetical_values([-1], [2]) == [get_alphabetical_value([-1, 2])]
 
     print("All tests returned true")
\ No newline at end of file
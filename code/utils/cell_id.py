@@ -0,0 +1,102 @@
+"""
+Sheet containing helpers for the integer hash representation
+
+Grid cells are packed into one uint32 as (lat_cell << 16) | lon_cell, which allows up to 65536 cells in each direction.
+Disks are represented by their index in the layer. The alphabetical string form is only produced when exporting.
+"""
+
+import numpy as np
+
+from . import alphabetical_number as an
+
+
+CELL_BITS = 16
+CELL_MASK = (1 << CELL_BITS) - 1
+MAX_CELLS = 1 << CELL_BITS
+
+
+def pack_cells(lat_cells: np.ndarray, lon_cells: np.ndarray) -> np.ndarray:
+    """ Packs arrays of lat and lon cell indices into uint32 cell ids """
+    lat_cells = np.asarray(lat_cells, dtype=np.int64)
+    lon_cells = np.asarray(lon_cells, dtype=np.int64)
+
+    if lat_cells.size and (min(lat_cells.min(), lon_cells.min()) < 0 or max(lat_cells.max(), lon_cells.max()) >= MAX_CELLS):
+        raise ValueError(f"Cell indices must be in the range [0, {MAX_CELLS}) to be packed. Is the trajectory outside the grid?")
+
+    return ((lat_cells << CELL_BITS) | lon_cells).astype(np.uint32)
+
+
+def unpack_cells(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Unpacks uint32 cell ids into lat and lon cell indices """
+    codes = np.asarray(codes, dtype=np.int64)
+    return codes >> CELL_BITS, codes & CELL_MASK
+
+
+def get_cell_distance(code_x: int, code_y: int) -> int:
+    """ Returns the Manhattan distance in cells between two packed cell ids """
+    code_x, code_y = int(code_x), int(code_y)
+    return abs((code_x >> CELL_BITS) - (code_y >> CELL_BITS)) + abs((code_x & CELL_MASK) - (code_y & CELL_MASK))
+
+
+def get_disk_index_dtype(num_disks: int) -> np.dtype:
+    """ Returns the smallest unsigned integer type that can hold the disk indices of a layer """
+    return np.dtype(np.uint16) if num_disks <= np.iinfo(np.uint16).max + 1 else np.dtype(np.uint32)
+
+
+def alphabetical_to_cells(hash: list[str]) -> np.ndarray:
+    """ Converts one layer of an alphabetical grid hash ("ABan") to packed cell ids """
+    if len(hash) == 0:
+        return np.zeros(0, dtype=np.uint32)
+
+    chars = np.array(hash, dtype="<U4").view(np.uint32).reshape(-1, 4).astype(np.int64)
+    lat_cells = (chars[:, 0] - ord("A")) * 26 + chars[:, 1] - ord("A")
+    lon_cells = (chars[:, 2] - ord("a")) * 26 + chars[:, 3] - ord("a")
+    return pack_cells(lat_cells, lon_cells)
+
+
+def export_grid_hash(hash: list[np.ndarray]) -> list[list[str]]:
+    """ Converts an integer grid hash (one array of cell ids per layer) to the alphabetical form """
+    result = []
+    for layer in hash:
+        lat_cells, lon_cells = unpack_cells(layer)
+        result.append(an.get_alphabetical_values(lat_cells.tolist(), lon_cells.tolist()))
+    return result
+
+
+def export_disk_hash(hash: list[np.ndarray]) -> list[list[str]]:
+    """ Converts an integer disk hash (one array of disk indices per layer) to the alphabetical form """
+    return [[an.get_alphabetical_value(disk) for disk in layer.tolist()] for layer in hash]
+
+
+def export_hashes(hashes: dict[str, list[np.ndarray]], scheme: str) -> dict[str, list[list[str]]]:
+    """
+    Converts integer dataset hashes to the alphabetical form
+
+    Params
+    ---
+    hashes : dict[str, list[np.ndarray]]
+        The integer hashes
+    scheme : str
+        "grid" | "disk"
+    """
+    match scheme.lower():
+        case "grid":
+            return {key: export_grid_hash(hash) for key, hash in hashes.items()}
+        case "disk":
+            return {key: export_disk_hash(hash) for key, hash in hashes.items()}
+        case _:
+            raise ValueError("Scheme must be either grid or disk")
+
+
+
+if __name__=="__main__":
+    codes = pack_cells([1, 5, 675], [13, 32, 675])
+    assert codes.dtype == np.uint32
+    assert [x.tolist() for x in unpack_cells(codes)] == [[1, 5, 675], [13, 32, 675]]
+    assert export_grid_hash([codes]) == [["ABan", "AFbg", "ZZzz"]]
+    assert alphabetical_to_cells(["ABan", "AFbg", "ZZzz"]).tolist() == codes.tolist()
+    assert get_cell_distance(codes[0], codes[1]) == 4 + 19
+    assert pack_cells([1000], [65535])[0] == (1000 << 16) + 65535
+    assert export_disk_hash([np.array([0, 35], dtype=np.uint16)]) == [["AA", "BJ"]]
+
+    print("All tests passed")
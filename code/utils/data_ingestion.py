@@ -0,0 +1,126 @@
+"""
+Sheet containing methods for streaming raw trajectory CSV files into a trajectory store
+
+The CSV is read in chunks and the polylines of a whole chunk are parsed in one vectorized operation, so memory use is bounded by the chunk size no matter how large the raw file is.
+"""
+
+import numpy as np
+import pandas as pd
+
+import global_variables
+
+from .trajectory_store import TrajectoryStoreWriter
+
+
+PORTO_BOUNDING_BOX = (global_variables.P_MIN_LAT, global_variables.P_MAX_LAT, global_variables.P_MIN_LON, global_variables.P_MAX_LON)
+
+
+def parse_polylines(polylines: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses a series of "[[lon, lat], [lon, lat], ...]" polylines in one vectorized operation
+
+    Params
+    ---
+    polylines : pd.Series[str]
+        The polylines as they are stored in the raw data
+
+    Returns
+    ---
+    (coordinates (n, 2) as (lat, lon), lengths) where lengths holds the number of points in each polyline
+    """
+    cleaned = polylines.astype(str).str.replace(r"[\[\]\s]", "", regex=True)
+    n_values = np.where(cleaned.str.len().to_numpy() > 0, cleaned.str.count(",").to_numpy() + 1, 0)
+
+    if n_values.sum() == 0:
+        return np.empty((0, 2), dtype=np.float64), np.zeros(len(cleaned), dtype=np.int64)
+
+    values = np.fromstring(",".join(cleaned[n_values > 0]), dtype=np.float64, sep=",")
+    if len(values) != n_values.sum() or np.any(n_values % 2):
+        raise ValueError("Unable to parse polylines, found malformed coordinates")
+
+    # The raw data is stored as (lon, lat)
+    coordinates = values.reshape(-1, 2)[:, ::-1]
+    return np.ascontiguousarray(coordinates), (n_values // 2).astype(np.int64)
+
+
+def _filter_trajectories(coordinates: np.ndarray, lengths: np.ndarray, min_points: int, bounding_box: tuple[float] | None) -> np.ndarray:
+    """ Returns a mask over the trajectories that are long enough and lie fully inside the bounding box """
+    keep = lengths >= min_points
+
+    if bounding_box is not None and len(coordinates):
+        min_lat, max_lat, min_lon, max_lon = bounding_box
+        lat, lon = coordinates[:, 0], coordinates[:, 1]
+        outside = (lat < min_lat) | (lat > max_lat) | (lon < min_lon) | (lon > max_lon)
+        trajectory_index = np.repeat(np.arange(len(lengths)), lengths)
+        keep &= np.bincount(trajectory_index, weights=outside, minlength=len(lengths)) == 0
+
+    return keep
+
+
+def ingest_csv(csv_path: str, store_path: str, id_column: str, polyline_column: str, min_points: int = global_variables.MIN_NUMBER_OF_POINTS, bounding_box: tuple[float] | None = PORTO_BOUNDING_BOX, max_trajectories: int | None = None, chunksize: int = 10000) -> list[str]:
+    """
+    Streams a raw trajectory CSV into a trajectory store
+
+    Params
+    ---
+    csv_path : str
+        The raw CSV file
+    store_path : str
+        The trajectory store that will be written
+    id_column : str
+        The column holding the trajectory ids
+    polyline_column : str
+        The column holding the "[[lon, lat], ...]" polylines
+    min_points : int
+        Trajectories with fewer points are skipped
+    bounding_box : (min_lat, max_lat, min_lon, max_lon) | None
+        Trajectories with points outside the box are skipped. No filtering if None
+    max_trajectories : int | None
+        Stops after this number of trajectories have been stored
+    chunksize : int
+        The number of CSV rows that are held in memory at once
+
+    Returns
+    ---
+    The ids of the stored trajectories
+    """
+    stored = []
+
+    with TrajectoryStoreWriter(store_path) as writer:
+        for chunk in pd.read_csv(csv_path, usecols=[id_column, polyline_column], chunksize=chunksize):
+            coordinates, lengths = parse_polylines(chunk[polyline_column])
+            keep = _filter_trajectories(coordinates, lengths, min_points, bounding_box)
+
+            if max_trajectories is not None:
+                keep &= np.cumsum(keep) <= max_trajectories - len(stored)
+
+            ids = chunk[id_column].astype(str).to_numpy()[keep].tolist()
+            writer.append_many(ids, coordinates[np.repeat(keep, lengths)], lengths[keep])
+            stored.extend(ids)
+
+            if max_trajectories is not None and len(stored) >= max_trajectories:
+                break
+
+    return stored
+
+
+def ingest_porto_csv(csv_path: str, store_path: str, max_trajectories: int | None = None, chunksize: int = 10000) -> list[str]:
+    """ Streams the Porto taxi data into a trajectory store, keeping the trajectories inside the Porto bounding box """
+    return ingest_csv(csv_path, store_path, "INDEX", "POLYLINE", max_trajectories=max_trajectories, chunksize=chunksize)
+
+
+def ingest_bus_csv(csv_path: str, store_path: str, chunksize: int = 10000) -> list[str]:
+    """ Streams the bus routes into a trajectory store. Bus routes are kept as is, without bounding box or length filtering """
+    return ingest_csv(csv_path, store_path, "name", "coordinates", min_points=1, bounding_box=None, chunksize=chunksize)
+
+
+
+if __name__=="__main__":
+    coordinates, lengths = parse_polylines(pd.Series(["[[-8.6,41.1],[-8.5,41.2]]", "[]", "[[-8.65, 41.15]]"]))
+    assert coordinates.tolist() == [[41.1, -8.6], [41.2, -8.5], [41.15, -8.65]]
+    assert lengths.tolist() == [2, 0, 1]
+
+    keep = _filter_trajectories(coordinates, lengths, 1, (41.0, 41.18, -9.0, -8.0))
+    assert keep.tolist() == [False, False, True]
+
+    print("All tests passed")
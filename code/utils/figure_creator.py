@@ -4,6 +4,9 @@ from matplotlib import colors
 import pandas as pd
 import numpy as np
 import os
+
+from utils.similarity_matrix import load_similarity_matrix, get_aligned_values
+
 COLOR_GRID_HASH = "#69b3a2"
 COLOR_DISK_HASH = "violet"
 COLOR_TRUE = "#3399e6"
@@ -137,21 +140,15 @@ def draw_similarity_correlation(hash_sim_path: str, city: str, hash_type: str, r
     ---
     ### Params:
     hash_sim_path : str (abspath)
-        The Path to the csv file containing the hashed similarities
+        The Path to the hashed similarity matrix (.npy, or a legacy .csv)
     city : str ("porto" | "rome")
         The city
     hash_type : str ("grid" | "disk")
         The hash method
     reference_measure : str ("dtw" | "frechet")
     """
-    # Defining helper functions:
-
-    def _mirrorDiagonal(M: np.ndarray ) -> np.ndarray:
-        """Flips and mirrors a two-dimenional np.array """
-        return M.values + np.rot90(np.fliplr(M.values))
-    
-    porto_dtw = _mirrorDiagonal(pd.read_csv(os.path.abspath("./benchmarks/similarities/porto-dtw.csv"), index_col=0)).flatten()
-    porto_fre = _mirrorDiagonal(pd.read_csv(os.path.abspath("./benchmarks/similarities/porto-frechet.csv"), index_col=0)).flatten()
+    porto_dtw = load_similarity_matrix(os.path.abspath("./benchmarks/similarities/porto-dtw.csv"))
+    porto_fre = load_similarity_matrix(os.path.abspath("./benchmarks/similarities/porto-frechet.csv"))
     true_sims = {
         "porto" : {
             "dtw" : porto_dtw,
@@ -172,16 +169,16 @@ def draw_similarity_correlation(hash_sim_path: str, city: str, hash_type: str, r
         }
     }
 
-    hash_sim = _mirrorDiagonal(pd.read_csv(hash_sim_path, index_col=0)).flatten()
-    corr = np.corrcoef(hash_sim, true_sims[city][reference_measure])[0][1]
-
-    print("Similarity correlation: ", np.corrcoef(hash_sim, true_sims[city][reference_measure])[0][1])
+    # The pairs below the diagonal of both matrices, in the same order
+    hash_sim = load_similarity_matrix(hash_sim_path)
+    x, y = get_aligned_values(hash_sim, true_sims[city][reference_measure])
+    corr = np.corrcoef(x, y)[0][1]
 
-    x = hash_sim
+    print("Similarity correlation: ", corr)
 
     fig, ax = plt.subplots(figsize=(10,8), dpi=300)
 
-    ax.hist2d(x, true_sims[city][reference_measure], bins=hist_arr[city][hash_type][reference_measure], cmap ="turbo")
+    ax.hist2d(x, y, bins=hist_arr[city][hash_type][reference_measure], cmap ="turbo")
     ax.set_ylabel(f"{reference_measure.upper()} distance", fontsize=18)
     ax.set_xlabel(f"{hash_type.capitalize()} scheme distance", fontsize=18)
     ax.tick_params(axis="both", which="major", labelsize=18)
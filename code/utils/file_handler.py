@@ -4,6 +4,18 @@ Sheet containing methods for reading trajectories
 
 import os, re
 
+import numpy as np
+
+from .trajectory_store import TrajectoryStore, write_trajectory_store
+from .hash_store import HashStore, write_hash_store
+
+
+# Name of the trajectory store inside a dataset folder. When present, it is used instead of the trajectory.txt files
+STORE_FILE_NAME = "trajectories.store"
+
+# Name of the hash store inside a folder of hashed data. When present, it is used instead of the hash.txt files
+HASH_STORE_FILE_NAME = "hashes.hstore"
+
 
 def read_trajectory_file(file_path: str) -> list[list[float]]:
     """
@@ -44,6 +56,10 @@ def load_trajectory_files(files: list[str], folder_path) -> dict:
     A dictionary containing the files and their coordinates with their filename as key
     """
 
+    store_path = get_trajectory_store_path(folder_path)
+    if store_path:
+        return load_trajectory_store(store_path, [os.path.splitext(file_name)[0] for file_name in files])
+
     file_list = files
     trajectories = dict()
 
@@ -71,6 +87,11 @@ def load_all_trajectory_files(folder_path: str, prefix: str) -> dict:
     A dictionary containing all files with their filename as key
     """
 
+    store_path = get_trajectory_store_path(folder_path)
+    if store_path:
+        store = TrajectoryStore(store_path)
+        return store.to_dict([key for key in store.keys() if key.startswith(prefix)])
+
     file_list = [file for file in os.listdir(folder_path) if re.match(r'\b' + re.escape(prefix) + r'[^\\]*\.txt$', file)]
 
     trajectories = dict()
@@ -84,6 +105,84 @@ def load_all_trajectory_files(folder_path: str, prefix: str) -> dict:
     return trajectories
 
 
+def get_trajectory_store_path(folder_path: str) -> str | None:
+    """ Returns the path to the trajectory store in the given folder, or None if the folder has no store """
+    store_path = os.path.join(folder_path, STORE_FILE_NAME)
+    return store_path if os.path.isfile(store_path) else None
+
+
+def load_trajectory_store(file_path: str, keys: list[str] | None = None) -> dict[str, np.ndarray]:
+    """
+    Loads the trajectories from a trajectory store and returns them as a dictionary
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the trajectory store
+    keys : list[str] | None
+        The trajectories that should be loaded, all trajectories if None
+
+    Returns
+    ---
+    A dictionary containing zero-copy (n, 2) views of the trajectories with their name as key
+    """
+    return TrajectoryStore(file_path).to_dict(keys)
+
+
+def load_trajectory_block(files: list[str], folder_path: str) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Loads the given trajectories as one coordinate block
+
+    Parameters
+    ----------
+    files : list[str]
+        A list of the files that should be read
+    folder_path : str
+        The folder where the trajectories are stored
+
+    Returns
+    ---
+    (keys, coordinates (n, 2), offsets) where trajectory k is coordinates[offsets[k]:offsets[k+1]]
+    """
+    keys = [os.path.splitext(file_name)[0] for file_name in files]
+
+    store_path = get_trajectory_store_path(folder_path)
+    if store_path:
+        return TrajectoryStore(store_path).select(keys)
+
+    trajectories = load_trajectory_files(files, folder_path)
+    lengths = [len(trajectories[key]) for key in keys]
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    coordinates = np.array([coordinate for key in keys for coordinate in trajectories[key]], dtype=np.float64).reshape(-1, 2)
+
+    return keys, coordinates, offsets
+
+
+def create_trajectory_store(files: list[str], folder_path: str) -> str:
+    """
+    Converts the given trajectory.txt files into a trajectory store in the same folder
+
+    Parameters
+    ----------
+    files : list[str]
+        A list of the files that should be converted
+    folder_path : str
+        The folder where the trajectories are stored
+
+    Returns
+    ---
+    The path to the created store
+    """
+    trajectories = dict()
+    for file_name in files:
+        trajectories[os.path.splitext(file_name)[0]] = read_trajectory_file(folder_path + file_name)
+
+    store_path = os.path.join(folder_path, STORE_FILE_NAME)
+    write_trajectory_store(trajectories, store_path)
+    return store_path
+
+
 def read_hash_file(file_path: str) -> list[list[float]]:
     """
     Reads a hash.txt file and returns the content as a list of hashes
@@ -122,6 +221,10 @@ def load_trajectory_hashes(files: list[str], folder_path: str) -> dict:
     A dictionary containing the files and their hashes with their filename as key
     """
 
+    store_path = get_hash_store_path(folder_path)
+    if store_path:
+        return load_hash_file(store_path, [os.path.splitext(file_name)[0] for file_name in files])
+
     file_list = files
     hashes = dict()
 
@@ -131,4 +234,44 @@ def load_trajectory_hashes(files: list[str], folder_path: str) -> dict:
         
         hashes[key] = hash
 
-    return hashes
\ No newline at end of file
+    return hashes
+
+
+def get_hash_store_path(folder_path: str) -> str | None:
+    """ Returns the path to the hash store in the given folder, or None if the folder has no hash store """
+    store_path = os.path.join(folder_path, HASH_STORE_FILE_NAME)
+    return store_path if os.path.isfile(store_path) else None
+
+
+def write_hash_file(hashes: dict[str, list], file_path: str, encoding: str | None = None) -> None:
+    """
+    Writes dataset hashes to a single, memory-mappable hash store
+
+    Parameters
+    ----------
+    hashes : dict[str, list]
+        The hashes with the trajectory names as keys
+    file_path : str
+        The path of the hash store
+    encoding : str | None
+        "alphabetical" | "numerical" | "integer". Inferred from the hashes if None
+    """
+    write_hash_store(hashes, file_path, encoding)
+
+
+def load_hash_file(file_path: str, keys: list[str] | None = None) -> dict[str, list]:
+    """
+    Loads the hashes from a hash store and returns them as a dictionary
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the hash store
+    keys : list[str] | None
+        The trajectories whose hashes should be loaded, all trajectories if None
+
+    Returns
+    ---
+    A dictionary containing the hashes with the trajectory names as keys
+    """
+    return HashStore(file_path).to_dict(keys)
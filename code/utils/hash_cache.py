@@ -0,0 +1,172 @@
+"""
+Sheet containing a content-addressed on-disk cache for computed dataset hashes
+
+An entry is keyed by the fingerprint of the scheme, the hash variant (encoding) and the fingerprint of the hashed trajectories,
+so a cached entry can never be returned for a changed scheme or dataset. Entries are stored as hash stores
+and are evicted by age and then by total size, least recently used first.
+"""
+
+import os
+import time
+import hashlib
+
+import numpy as np
+
+import global_variables
+
+from .hash_store import HashStore, write_hash_store
+
+
+# Entries are hash stores. The .npz entries of the earlier cache format are never read, but are still evicted and cleared
+_ENTRY_EXTENSIONS = (".hstore", ".npz")
+
+# Seconds after which a temporary file of an entry is taken to be left by a writer that was killed, and is evicted
+_TMP_MAX_AGE = 24 * 60 * 60
+
+
+def get_dataset_fingerprint(keys: list[str], coordinates: np.ndarray, offsets: np.ndarray) -> str:
+    """ Returns a hex digest of the trajectory ids and coordinates of a trajectory block """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update("\n".join(keys).encode("utf-8"))
+    digest.update(np.ascontiguousarray(offsets, dtype="<i8").tobytes())
+    digest.update(np.ascontiguousarray(coordinates, dtype="<f8").tobytes())
+    return digest.hexdigest()
+
+
+class HashCache:
+    """ On-disk cache of dataset hashes. Each entry is stored as one hash store (.hstore) in the cache folder """
+
+    def __init__(self, folder: str = global_variables.HASH_CACHE_FOLDER, max_bytes: int | None = global_variables.HASH_CACHE_MAX_BYTES, max_age: float | None = global_variables.HASH_CACHE_MAX_AGE) -> None:
+        """
+        Parameters
+        ----------
+        folder : str
+            The folder holding the cache entries. Created if it does not exist
+        max_bytes : int | None
+            The maximum total size of the cache. No size limit if None
+        max_age : float | None
+            Entries not used for this many seconds are evicted. No age limit if None
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(folder, exist_ok=True)
+
+
+    def get_key(self, scheme_fingerprint: str, variant: str, dataset_fingerprint: str) -> str:
+        """ Returns the cache key of a scheme, hash variant and dataset """
+        return hashlib.sha256(f"{scheme_fingerprint}:{variant}:{dataset_fingerprint}".encode()).hexdigest()
+
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.hstore")
+
+
+    def get(self, key: str) -> dict[str, list] | None:
+        """ Returns the cached hashes, or None if the key is not in the cache. An entry that can't be read is removed and counts as a miss """
+        path = self._get_path(key)
+        try:
+            hashes = HashStore(path).to_dict()
+            # Marks the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # Not cached, or evicted by another process while it was read
+            return None
+        except (ValueError, OSError):
+            # A truncated or foreign file, which is recomputed and overwritten
+            self._remove(path)
+            return None
+
+        return hashes
+
+
+    def put(self, key: str, hashes: dict[str, list], encoding: str) -> None:
+        """ Stores the hashes in the cache and evicts old entries if the cache is full """
+        write_hash_store(hashes, self._get_path(key), encoding)
+        self.evict()
+
+
+    def _remove(self, path: str) -> None:
+        """ Removes an entry, which may already have been removed by another process """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+    def evict(self) -> None:
+        """ Removes entries that are too old, then the least recently used entries until the cache is within max_bytes. Temporary files left by killed writers are removed too """
+        now = time.time()
+        entries = []
+        for file_name in os.listdir(self.folder):
+            if not file_name.endswith(_ENTRY_EXTENSIONS + (".tmp",)):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, file_name))
+            except FileNotFoundError:
+                continue
+            if file_name.endswith(".tmp"):
+                if now - stat.st_mtime > _TMP_MAX_AGE:
+                    self._remove(os.path.join(self.folder, file_name))
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, file_name in entries:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_large = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_large):
+                continue
+            self._remove(os.path.join(self.folder, file_name))
+            total -= size
+
+
+    def clear(self) -> None:
+        """ Removes all entries from the cache """
+        for file_name in os.listdir(self.folder):
+            if file_name.endswith(_ENTRY_EXTENSIONS):
+                self._remove(os.path.join(self.folder, file_name))
+
+
+
+if __name__=="__main__":
+    import tempfile
+
+    cache = HashCache(tempfile.mkdtemp(), max_bytes=None, max_age=None)
+    hashes = {
+        "alphabetical" : {"a": [["AA", "AB"], []], "b": [["ABcd"], ["ZZzz"]]},
+        "numerical" : {"a": [[np.array([41.1, -8.6])], []]},
+        "integer" : {"a": [np.array([1, 2], dtype=np.uint16), np.array([], dtype=np.uint16)]},
+    }
+    for encoding, hash in hashes.items():
+        key = cache.get_key("scheme", encoding, "dataset")
+        assert cache.get(key) is None
+        cache.put(key, hash, encoding)
+        cached = cache.get(key)
+        assert list(cached) == list(hash)
+        assert all(np.array_equal(x, y) for k in hash for x, y in zip(cached[k], hash[k]))
+    assert cache.get(cache.get_key("scheme", "alphabetical", "dataset")) == hashes["alphabetical"]
+
+    # A truncated entry is removed and recomputed instead of raising
+    key = cache.get_key("scheme", "numerical", "dataset")
+    with open(cache._get_path(key), "r+b") as file:
+        file.truncate(10)
+    assert cache.get(key) is None and not os.path.exists(cache._get_path(key))
+
+    # Entries of the earlier .npz format are evicted with the others
+    with open(os.path.join(cache.folder, "old.npz"), "wb") as file:
+        file.write(b"PK")
+
+    # A temporary file left by a killed writer is evicted once it is old, while one that may still be written is kept
+    stale_path, fresh_path = os.path.join(cache.folder, "stale.hstore.x.tmp"), os.path.join(cache.folder, "fresh.hstore.y.tmp")
+    for tmp_path in (stale_path, fresh_path):
+        with open(tmp_path, "wb") as file:
+            file.write(b"TRJ")
+    os.utime(stale_path, (time.time() - _TMP_MAX_AGE - 1,) * 2)
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert os.listdir(cache.folder) == ["fresh.hstore.y.tmp"]
+
+    print("All tests passed")
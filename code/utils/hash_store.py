@@ -0,0 +1,270 @@
+"""
+Sheet containing the memory-mapped hash container
+
+A hash store is a single binary file holding the hashes of every trajectory of a dataset:
+
+    header   : 64 bytes (magic, version, encoding, number of trajectories/layers/values and section offsets)
+    values   : the hashed values of all layers of all trajectories, stored back to back
+    offsets  : int64 (n_trajectories * n_layers + 1) where layer l of trajectory k is values[offsets[k*n_layers + l]:offsets[k*n_layers + l + 1]]
+    ids      : utf-8 encoded, newline separated trajectory ids
+
+The values are fixed width, depending on the encoding of the hashes:
+
+    alphabetical : "<U4" strings ("AB", "ABcd")
+    numerical    : float64 (n, 2) disk centers
+    integer      : uint16 or uint32 cell ids / disk indices
+"""
+
+import gc
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+
+HASH_STORE_MAGIC = b"TRJHASH\x00"
+HASH_STORE_VERSION = 1
+
+_HEADER_FORMAT = "<8sIIQQQQQQ"
+_HEADER_SIZE = 64
+
+# Encoding code -> (encoding, value dtype, values per hashed point)
+_VALUE_FORMATS = {
+    0 : ("alphabetical", np.dtype("<U4"), 1),
+    1 : ("numerical", np.dtype("<f8"), 2),
+    2 : ("integer", np.dtype("<u2"), 1),
+    3 : ("integer", np.dtype("<u4"), 1),
+}
+
+
+def infer_encoding(hashes: dict[str, list]) -> str:
+    """ Returns the encoding of the hashes, "alphabetical" | "numerical" | "integer" """
+    for hash in hashes.values():
+        for layer in hash:
+            if isinstance(layer, np.ndarray) and layer.ndim == 1:
+                return "integer"
+            if len(layer):
+                return "alphabetical" if isinstance(layer[0], str) else "numerical"
+    return "alphabetical"
+
+
+def _get_values(layers: list, encoding: str) -> tuple[int, np.ndarray]:
+    """ Returns the encoding code and the values of the layers as one fixed width array """
+    match encoding:
+        case "alphabetical":
+            values = np.array([value for layer in layers for value in layer], dtype=str)
+            if values.dtype.itemsize > _VALUE_FORMATS[0][1].itemsize:
+                raise ValueError("Alphabetical hashes can be at most 4 characters long")
+            return 0, values.astype(_VALUE_FORMATS[0][1])
+        case "numerical":
+            return 1, np.array([value for layer in layers for value in layer], dtype="<f8").reshape(-1, 2)
+        case "integer":
+            values = np.concatenate(layers) if layers else np.zeros(0, dtype="<u4")
+            if values.size and values.min() < 0:
+                raise ValueError("Integer hashes must be non-negative")
+            if values.size and values.max() > np.iinfo(np.uint32).max:
+                raise ValueError(f"Integer hashes must fit in uint32, got {values.max()}")
+            code = 2 if values.dtype.itemsize <= 2 and values.size and values.max() <= np.iinfo(np.uint16).max else 3
+            return code, values.astype(_VALUE_FORMATS[code][1])
+        case _:
+            raise ValueError(f"Unknown hash encoding {encoding}. Must be alphabetical, numerical or integer")
+
+
+def write_hash_store(hashes: dict[str, list], file_path: str, encoding: str | None = None) -> None:
+    """
+    Writes dataset hashes to a hash store
+
+    Params
+    ---
+    hashes : dict[str, list]
+        The hashes with the trajectory ids as keys. All trajectories must have the same number of layers
+    file_path : str
+        The path of the store. The file is written to a unique temporary file next to it and moved in place when done,
+        so processes writing the same store at the same time don't get in each other's way
+    encoding : str | None
+        "alphabetical" | "numerical" | "integer". Inferred from the hashes if None
+    """
+    encoding = encoding or infer_encoding(hashes)
+    num_layers = len(next(iter(hashes.values()))) if hashes else 0
+
+    layers = []
+    for key, hash in hashes.items():
+        if "\n" in key:
+            raise ValueError(f"Trajectory id can't contain newlines: {key!r}")
+        if len(hash) != num_layers:
+            raise ValueError(f"Trajectory {key} has {len(hash)} layers, expected {num_layers}")
+        layers.extend(hash)
+
+    code, values = _get_values(layers, encoding)
+    offsets = np.zeros(len(layers) + 1, dtype="<i8")
+    np.cumsum(np.fromiter(map(len, layers), dtype=np.int64, count=len(layers)), out=offsets[1:])
+
+    ids = "\n".join(hashes.keys()).encode("utf-8")
+    offsets_start = _HEADER_SIZE + values.nbytes
+    ids_start = offsets_start + offsets.nbytes
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(struct.pack(_HEADER_FORMAT, HASH_STORE_MAGIC, HASH_STORE_VERSION, code, len(hashes), num_layers, len(values), offsets_start, ids_start, len(ids)))
+            file.write(np.ascontiguousarray(values).tobytes())
+            file.write(offsets.tobytes())
+            file.write(ids)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+
+class HashStore:
+    """ Read-only, memory-mapped view of a hash store """
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Parameters
+        ----------
+        file_path : str
+            The path of the store that should be opened
+        """
+        self.file_path = file_path
+
+        with open(file_path, "rb") as file:
+            header = file.read(_HEADER_SIZE)
+            if len(header) != _HEADER_SIZE:
+                raise ValueError(f"{file_path} is not a hash store")
+
+            magic, version, code, n_trajectories, n_layers, n_values, offsets_start, ids_start, ids_nbytes = struct.unpack(_HEADER_FORMAT, header)
+            if magic != HASH_STORE_MAGIC:
+                raise ValueError(f"{file_path} is not a hash store")
+            if version != HASH_STORE_VERSION:
+                raise ValueError(f"Unsupported hash store version {version}")
+
+            file.seek(ids_start)
+            ids = file.read(ids_nbytes).decode("utf-8")
+
+        self.encoding, dtype, width = _VALUE_FORMATS[code]
+        self.layers = n_layers
+        self.ids = ids.split("\n") if n_trajectories else []
+        self.offsets = np.memmap(file_path, dtype="<i8", mode="r", offset=offsets_start, shape=(n_trajectories * n_layers + 1,))
+
+        shape = (n_values, width) if width > 1 else (n_values,)
+        if n_values:
+            self.values = np.memmap(file_path, dtype=dtype, mode="r", offset=_HEADER_SIZE, shape=shape)
+        else:
+            self.values = np.empty(shape, dtype=dtype)
+
+        self._index = {trajectory_id: i for i, trajectory_id in enumerate(self.ids)}
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    def __contains__(self, trajectory_id: str) -> bool:
+        return trajectory_id in self._index
+
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+    def keys(self) -> list[str]:
+        return list(self.ids)
+
+
+    def _get_layer(self, values, start: int, end: int) -> list:
+        """ Returns one hashed layer in the same form as the schemes produce it """
+        if self.encoding == "numerical":
+            return list(values[start:end])
+        return values[start:end]
+
+
+    def __getitem__(self, trajectory_id: str) -> list:
+        """ Returns the hash of a trajectory. Integer hashes are zero-copy views into the store """
+        i = self._index[trajectory_id]
+        bounds = self.offsets[i*self.layers:(i+1)*self.layers + 1].tolist()
+        values = np.asarray(self.values)[bounds[0]:bounds[-1]]
+        if self.encoding == "alphabetical":
+            values = values.tolist()
+        return [self._get_layer(values, bounds[l] - bounds[0], bounds[l+1] - bounds[0]) for l in range(self.layers)]
+
+
+    def items(self):
+        for trajectory_id in self.ids:
+            yield trajectory_id, self[trajectory_id]
+
+
+    def to_dict(self, keys: list[str] | None = None) -> dict[str, list]:
+        """ Returns the hashes as a dictionary, optionally restricted to the given keys """
+        keys = self.ids if keys is None else list(keys)
+        offsets = self.offsets.tolist()
+
+        # All values are converted in one go, alphabetical values are much faster to slice as a list
+        values = self.values.tolist() if self.encoding == "alphabetical" else np.asarray(self.values)
+
+        # The garbage collector is paused while the many small layer lists are created, as it would otherwise run repeatedly
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if self.encoding == "numerical":
+                layers = [list(values[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+            else:
+                layers = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+            hashes = dict()
+            for key in keys:
+                start = self._index[key] * self.layers
+                hashes[key] = layers[start:start + self.layers]
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return hashes
+
+
+def _write_repeatedly(hashes: dict[str, list], file_path: str) -> None:
+    for _ in range(100):
+        write_hash_store(hashes, file_path)
+
+
+
+if __name__=="__main__":
+    from multiprocessing import Process
+
+    path = os.path.join(tempfile.mkdtemp(), "test.hstore")
+    hashes = {
+        "alphabetical" : {"a": [["AA", "AB"], []], "b": [["ABcd"], ["ZZzz"]]},
+        "numerical" : {"a": [[np.array([41.1, -8.6])], []]},
+        "integer" : {"a": [np.array([1, 2], dtype=np.uint16), np.array([], dtype=np.uint16)], "b": [np.array([7], dtype=np.uint16), np.array([3], dtype=np.uint16)]},
+    }
+    for encoding, hash in hashes.items():
+        write_hash_store(hash, path)
+        store = HashStore(path)
+        assert store.encoding == encoding and store.keys() == list(hash)
+        for loaded in (store.to_dict(), store.to_dict(list(hash)[::-1])):
+            assert all(np.array_equal(x, y) for key in hash for x, y in zip(loaded[key], hash[key]))
+    assert HashStore(path).values.dtype == np.uint16
+    assert HashStore(path)["b"][1].tolist() == [3]
+
+    write_hash_store(hashes["alphabetical"], path)
+    assert HashStore(path).to_dict() == hashes["alphabetical"]
+
+    # Integer ids that don't fit in uint32 must not be wrapped around
+    try:
+        write_hash_store({"a": [np.array([2**32], dtype=np.int64)]}, path)
+        assert False, "Expected a ValueError"
+    except ValueError:
+        pass
+
+    # Processes writing the same store at the same time, as seeded runs sharing a cache entry do, all succeed and leave no temporary files
+    writers = [Process(target=_write_repeatedly, args=(hashes["integer"], path)) for _ in range(4)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join()
+    assert [process.exitcode for process in writers] == [0] * 4 and os.listdir(os.path.dirname(path)) == ["test.hstore"]
+    assert HashStore(path).to_dict()["b"][0].tolist() == [7]
+
+    print("All tests passed")
@@ -35,6 +35,29 @@ def create_meta_file(path_to_files: str, data_prefix: str, prefix: str = "META")
 
 
 
+def create_meta_file_from_ids(path_to_files: str, ids: list[str], prefix: str = "META") -> None:
+    """
+    Function that creates a metafile listing the given trajectory ids. Used for datasets stored in a trajectory store
+
+    Parameters
+    ----------
+    path_to_files : str
+        The path to the data folder
+    ids : list[str]
+        The trajectory ids that will be listed
+    prefix: str (default "META")
+        The prefix of the meta_file
+    """
+
+    with open(f'{path_to_files}/{prefix}.txt','w') as file:
+        for trajectory_id in ids:
+            file.write("%s\n" % (trajectory_id))
+        file.close()
+    
+    return
+
+
+
 def get_meta_file(path_to_files: str, prefix: str = "META") -> list:
     """
     Function that returns the metafile in the given folder
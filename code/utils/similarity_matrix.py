@@ -0,0 +1,337 @@
+"""
+Sheet containing the condensed, memory-mapped similarity matrix container
+
+A similarity matrix is stored as two files next to each other:
+
+    <name>.npy : float32 (n*(n-1)/2,) the strictly lower triangle, where pair (i, j), j < i, is at index i*(i-1)/2 + j
+    <name>.ids : utf-8 encoded, newline separated trajectory ids, in the order of the rows
+
+This is the order in which pairwise.PairwiseEngine computes the pairs, and is the upper triangle read column by column.
+The matrices are symmetric with a zero diagonal, so the diagonal is not stored.
+The .npy file is memory-mapped when loaded, and SquareView gives n x n indexing into it without building the square matrix.
+Correlations between matrices are computed on the condensed values (get_correlation), only clustering needs the dense square matrix.
+Matrices written as csv by the older notebooks (n x n dataframe with the lower triangle filled in) are still read by load_similarity_matrix.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+MATRIX_DTYPE = np.float32
+
+
+def get_condensed_size(n: int) -> int:
+    """ Returns the number of pairs in the strictly lower triangle of an n x n matrix """
+    return n * (n - 1) // 2
+
+
+def get_matrix_paths(file_path: str) -> tuple[str, str]:
+    """ Returns the paths of the (.npy, .ids) files of a matrix, given the path of either of them, of the legacy csv or without extension """
+    base, extension = os.path.splitext(file_path)
+    if extension not in (".npy", ".ids", ".csv"):
+        base = file_path
+    return base + ".npy", base + ".ids"
+
+
+
+class SquareView:
+    """ Read-only n x n view of a condensed matrix. Single entries and rows are read from the condensed values, nothing is copied up front """
+
+    def __init__(self, condensed: np.ndarray, n: int) -> None:
+        self.condensed = condensed
+        self.shape = (n, n)
+        self.dtype = condensed.dtype
+
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+
+    def _get_entry(self, i: int, j: int):
+        if i == j:
+            return self.dtype.type(0)
+        if j > i:
+            i, j = j, i
+        return self.condensed[i * (i - 1) // 2 + j]
+
+
+    def get_row(self, i: int) -> np.ndarray:
+        """ Returns row i of the square matrix. The part left of the diagonal is contiguous in the condensed values, the part right of it is gathered """
+        n = self.shape[0]
+        row = np.empty(n, dtype=self.dtype)
+        start = i * (i - 1) // 2
+        row[:i] = self.condensed[start:start + i]
+        row[i] = 0
+        rows = np.arange(i + 1, n)
+        row[i + 1:] = self.condensed[rows * (rows - 1) // 2 + i]
+        return row
+
+
+    def __getitem__(self, key):
+        n = self.shape[0]
+        if isinstance(key, tuple):
+            i, j = key
+            if i < 0: i += n
+            if j < 0: j += n
+            if not (0 <= i < n and 0 <= j < n):
+                raise IndexError(f"Index {key} is out of bounds for a {n}x{n} matrix")
+            return self._get_entry(i, j)
+
+        i = key + n if key < 0 else key
+        if not 0 <= i < n:
+            raise IndexError(f"Index {key} is out of bounds for a {n}x{n} matrix")
+        return self.get_row(i)
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return to_square(self.condensed, self.shape[0], dtype or self.dtype)
+
+
+    def flatten(self) -> np.ndarray:
+        """ Returns the square matrix flattened row by row, as np.ndarray.flatten """
+        return np.asarray(self).flatten()
+
+
+
+def to_square(condensed: np.ndarray, n: int, dtype=np.float64) -> np.ndarray:
+    """ Returns the symmetric n x n matrix of a condensed matrix with a zero diagonal """
+    M = np.zeros((n, n), dtype=dtype)
+    for i in range(1, n):
+        start = i * (i - 1) // 2
+        M[i, :i] = condensed[start:start + i]
+        M[:i, i] = condensed[start:start + i]
+    return M
+
+
+def to_condensed(M: np.ndarray, dtype=MATRIX_DTYPE) -> np.ndarray:
+    """ Returns the strictly lower triangle of a square matrix in condensed order """
+    n = len(M)
+    condensed = np.empty(get_condensed_size(n), dtype=dtype)
+    for i in range(1, n):
+        start = i * (i - 1) // 2
+        condensed[start:start + i] = M[i, :i]
+    return condensed
+
+
+
+class SimilarityMatrix:
+    """ A condensed similarity matrix with the trajectory ids of its rows """
+
+    def __init__(self, keys: list[str], condensed: np.ndarray) -> None:
+        """
+        Parameters
+        ----------
+        keys : list[str]
+            The trajectory ids, in the order of the rows
+        condensed : np.ndarray
+            The strictly lower triangle in condensed order, see the top of this sheet
+        """
+        if len(condensed) != get_condensed_size(len(keys)):
+            raise ValueError(f"A matrix of {len(keys)} trajectories has {get_condensed_size(len(keys))} pairs, got {len(condensed)} values")
+
+        self.keys = list(keys)
+        self.condensed = condensed
+        self._index = {key: i for i, key in enumerate(self.keys)}
+
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+    @property
+    def square(self) -> SquareView:
+        """ The n x n view of the matrix """
+        return SquareView(self.condensed, len(self.keys))
+
+
+    def get(self, key_x: str, key_y: str) -> float:
+        """ Returns the similarity of two trajectories by id """
+        return float(self.square[self._index[key_x], self._index[key_y]])
+
+
+    def to_square(self, dtype=np.float64) -> np.ndarray:
+        """ Returns the symmetric n x n matrix, as the consumers previously got from mirroring the csv """
+        return to_square(self.condensed, len(self.keys), dtype)
+
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ Returns the matrix as the n x n dataframe with the lower triangle filled in, as written to csv by the older notebooks """
+        M = to_square(self.condensed, len(self.keys))
+        return pd.DataFrame(np.tril(M), index=self.keys, columns=self.keys)
+
+
+    def select(self, keys: list[str]):
+        """ Returns the matrix of the given trajectories in the given order, copying only their pairs """
+        positions = np.array([self._index[key] for key in keys], dtype=np.int64)
+        condensed = np.empty(get_condensed_size(len(keys)), dtype=self.condensed.dtype)
+        for i in range(1, len(keys)):
+            high = np.maximum(positions[i], positions[:i])
+            low = np.minimum(positions[i], positions[:i])
+            start = i * (i - 1) // 2
+            condensed[start:start + i] = self.condensed[high * (high - 1) // 2 + low]
+        return SimilarityMatrix(keys, condensed)
+
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame):
+        """ Creates a matrix from an n x n dataframe with the lower triangle filled in, as produced by distance.py and the benchmarks """
+        return cls([str(key) for key in df.index], to_condensed(df.values))
+
+
+
+def compute_similarity_matrix(items: dict[str, object], measure) -> SimilarityMatrix:
+    """
+    Computes the similarity of all pairs of items in the calling process, in condensed order
+
+    Params
+    ---
+    items : dict[str, object]
+        The items to compare (hashes or trajectories) with the trajectory ids as keys
+    measure : (x, y) -> float
+        The similarity measure
+
+    Returns
+    ---
+    The pairwise similarities with the keys sorted
+    """
+    keys = sorted(items.keys())
+    values = [items[key] for key in keys]
+
+    condensed = np.empty(get_condensed_size(len(keys)), dtype=np.float64)
+    k = 0
+    for i in range(1, len(keys)):
+        for j in range(i):
+            condensed[k] = measure(values[i], values[j])
+            k += 1
+
+    return SimilarityMatrix(keys, condensed)
+
+
+
+def write_similarity_matrix(matrix: SimilarityMatrix | pd.DataFrame, file_path: str, legacy_csv: bool = False) -> None:
+    """
+    Writes a similarity matrix as condensed float32 values with a sidecar id list
+
+    Params
+    ---
+    matrix : SimilarityMatrix | pd.DataFrame
+        The matrix, or an n x n dataframe with the lower triangle filled in
+    file_path : str
+        The path of the matrix. The .npy and .ids files are written next to each other, see get_matrix_paths
+    legacy_csv : bool
+        Also writes the matrix as csv, for notebooks that still read the csv
+    """
+    if isinstance(matrix, pd.DataFrame):
+        matrix = SimilarityMatrix.from_dataframe(matrix)
+
+    for key in matrix.keys:
+        if "\n" in key:
+            raise ValueError(f"Trajectory id can't contain newlines: {key!r}")
+
+    npy_path, ids_path = get_matrix_paths(file_path)
+
+    # Written to temporary files and moved in place when done, ids last so a matrix is never found with the wrong ids
+    with open(npy_path + ".tmp", "wb") as file:
+        np.save(file, np.ascontiguousarray(matrix.condensed, dtype=MATRIX_DTYPE))
+    with open(ids_path + ".tmp", "w", encoding="utf-8") as file:
+        file.write("\n".join(matrix.keys))
+    os.replace(npy_path + ".tmp", npy_path)
+    os.replace(ids_path + ".tmp", ids_path)
+
+    if legacy_csv:
+        matrix.to_dataframe().to_csv(os.path.splitext(npy_path)[0] + ".csv")
+
+
+def load_similarity_matrix(file_path: str, mmap: bool = True) -> SimilarityMatrix:
+    """
+    Loads a similarity matrix. The condensed .npy is used if it exists, unless file_path is a legacy csv that was written after it
+
+    Params
+    ---
+    file_path : str
+        The path of the matrix, with or without extension (.npy | .ids | .csv)
+    mmap : bool
+        Memory-maps the condensed values instead of reading them into memory
+    """
+    npy_path, ids_path = get_matrix_paths(file_path)
+    has_csv = file_path.endswith(".csv") and os.path.exists(file_path)
+
+    # A csv written after the condensed matrix, e.g. by a notebook that still writes csv, is newer and is read instead
+    if os.path.exists(npy_path) and not (has_csv and os.path.getmtime(file_path) > os.path.getmtime(npy_path)):
+        with open(ids_path, encoding="utf-8") as file:
+            ids = file.read()
+        condensed = np.load(npy_path, mmap_mode="r" if mmap else None)
+        return SimilarityMatrix(ids.split("\n") if ids else [], condensed)
+
+    if has_csv:
+        return SimilarityMatrix.from_dataframe(pd.read_csv(file_path, index_col=0))
+
+    raise FileNotFoundError(f"No similarity matrix found at {file_path}")
+
+
+def get_aligned_values(x: SimilarityMatrix, y: SimilarityMatrix) -> tuple[np.ndarray, np.ndarray]:
+    """ Returns the condensed values of two matrices of the same trajectories as float64, with y reordered to the rows of x if needed """
+    if x.keys != y.keys:
+        y = y.select(x.keys)
+    return np.asarray(x.condensed, dtype=np.float64), np.asarray(y.condensed, dtype=np.float64)
+
+
+def get_correlation(x: SimilarityMatrix, y: SimilarityMatrix) -> float:
+    """ Returns the Pearson correlation of the pairwise similarities of two matrices of the same trajectories """
+    return float(np.corrcoef(*get_aligned_values(x, y))[0][1])
+
+
+def convert_csv(csv_path: str) -> SimilarityMatrix:
+    """ Converts a legacy csv matrix to the condensed format next to it, and returns it """
+    matrix = SimilarityMatrix.from_dataframe(pd.read_csv(csv_path, index_col=0))
+    write_similarity_matrix(matrix, csv_path)
+    return load_similarity_matrix(csv_path)
+
+
+
+if __name__=="__main__":
+    import tempfile
+
+    keys = ["a", "b", "c", "d"]
+    M = np.array([[0, 0, 0, 0], [1, 0, 0, 0], [2, 3, 0, 0], [4, 5, 6, 0]], dtype=np.float64)
+    df = pd.DataFrame(M, index=keys, columns=keys)
+
+    matrix = SimilarityMatrix.from_dataframe(df)
+    assert matrix.condensed.tolist() == [1, 2, 3, 4, 5, 6]
+    assert np.array_equal(matrix.to_square(), M + M.T)
+    assert matrix.get("b", "d") == 5 and matrix.get("d", "b") == 5 and matrix.get("c", "c") == 0
+    assert matrix.square[1].tolist() == [1, 0, 3, 5] and matrix.square[-1].tolist() == [4, 5, 6, 0]
+    assert np.array_equal(np.asarray(matrix.square), M + M.T)
+
+    folder = tempfile.mkdtemp()
+    csv_path = os.path.join(folder, "test.csv")
+    df.to_csv(csv_path)
+    assert np.array_equal(load_similarity_matrix(csv_path).to_square(), M + M.T)
+
+    converted = convert_csv(csv_path)
+    assert isinstance(converted.condensed, np.memmap) and converted.condensed.dtype == MATRIX_DTYPE
+    assert converted.keys == keys and np.array_equal(converted.to_square(), M + M.T)
+    assert load_similarity_matrix(os.path.join(folder, "test")).keys == keys
+
+    # A csv written after the condensed matrix is newer and is read instead
+    df.iloc[3, 0] = 9
+    df.to_csv(csv_path)
+    os.utime(csv_path, (os.path.getmtime(csv_path) + 10,) * 2)
+    assert load_similarity_matrix(csv_path).get("d", "a") == 9 and load_similarity_matrix(os.path.join(folder, "test")).get("d", "a") == 4
+
+    reordered = matrix.select(["d", "b", "a", "c"])
+    assert reordered.get("a", "d") == 4 and reordered.get("b", "c") == 3 and reordered.condensed.tolist() == [5, 4, 1, 6, 3, 2]
+    assert abs(get_correlation(matrix, reordered) - 1) < 1e-12 and abs(get_correlation(matrix, SimilarityMatrix(keys, -matrix.condensed)) + 1) < 1e-12
+
+    write_similarity_matrix(SimilarityMatrix(["x"], np.zeros(0)), os.path.join(folder, "single"), legacy_csv=True)
+    assert load_similarity_matrix(os.path.join(folder, "single.npy")).to_square().shape == (1, 1)
+    assert pd.read_csv(os.path.join(folder, "single.csv"), index_col=0).shape == (1, 1)
+
+    # Pairs computed serially are in the condensed order of the sorted keys
+    matrix = compute_similarity_matrix({"c": 3, "a": 1, "b": 2, "d": 4}, lambda x, y: x * 10 + y)
+    assert matrix.keys == keys and matrix.condensed.tolist() == [21, 31, 32, 41, 42, 43]
+    assert len(compute_similarity_matrix({"a": 1}, lambda x, y: 0.0).condensed) == 0
+
+    print("All tests passed")
@@ -1,18 +1,53 @@
 import numpy as np
-import pandas as pd
-import collections as co
+import functools
 
-from multiprocessing import Pool
 import timeit as ti
 import time
 
-from .py.edit_distance import edit_distance as p_ed
+from . import kernels
+from .py.edit_distance import edit_distance_batch, get_codes
 
-from .py.edit_distance_penalty import edit_distance_penalty as p_edp
+from ..similarity_matrix import SimilarityMatrix, compute_similarity_matrix, get_condensed_size
+from .pairwise import PairwiseEngine
 
-from .py.dtw import dtw as p_dtw
 
-def py_edit_distance(hashes: dict[str, list[list[str]]]) -> pd.DataFrame:
+def _compute_parallell(hashes: dict[str, list], kernel, encoding: str | None, prepare, engine: PairwiseEngine | None, checkpoint_folder: str | None, shard: str | None) -> SimilarityMatrix | None:
+    """ Computes all pairs on the engine (a temporary one if None) as a condensed matrix, or only the given shard into checkpoint_folder """
+    if shard is not None and checkpoint_folder is None:
+        raise ValueError("A shard is written to the checkpoint folder, which must be given")
+    if engine is None:
+        with PairwiseEngine() as engine:
+            return _compute_parallell(hashes, kernel, encoding, prepare, engine, checkpoint_folder, shard)
+
+    if shard is not None:
+        engine.compute_shard(hashes, kernel, shard, checkpoint_folder, encoding, prepare)
+        return None
+    # The diagonal is not part of a similarity matrix, see utils/similarity_matrix.py
+    keys, condensed, _ = engine.compute(hashes, kernel, encoding, prepare, checkpoint_folder)
+    return SimilarityMatrix(keys, condensed)
+
+
+def _check_warping(band: float | None, radius: int | None) -> None:
+    """ Raises if both the banded and the approximate warping are asked for """
+    if band is not None and radius is not None:
+        raise ValueError("The warping is either banded (band) or approximate (radius), not both")
+    if band is not None and not 0 <= band <= 1:
+        raise ValueError(f"The band is a fraction of the longest layer and must be in [0, 1], got {band}")
+    if radius is not None and radius < 0:
+        raise ValueError(f"The radius must be non-negative, got {radius}")
+
+
+def _get_dtw_kernel(band: float | None, radius: int | None):
+    """ Returns the exact, banded (band) or approximate (radius) dtw kernel, see py/warping.py """
+    _check_warping(band, radius)
+    if band is not None:
+        return functools.partial(kernels.dtw_banded, band=band)
+    if radius is not None:
+        return functools.partial(kernels.dtw_fast, radius=radius)
+    return kernels.dtw
+
+
+def py_edit_distance(hashes: dict[str, list[list[str]]]) -> SimilarityMatrix:
     """
     Method for computing Edit distance similarity between hashes generated by the grid and disk LSH using python.
 
@@ -23,111 +58,151 @@ def py_edit_distance(hashes: dict[str, list[list[str]]]) -> pd.DataFrame:
 
     Returns
     ---
-    A NxN pandas dataframe containing the pairwise similarities
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py)
     """
 
-    sorted_hashes = co.OrderedDict(sorted(hashes.items()))
-    num_hashes = len(sorted_hashes)
+    # Without numba, each row is computed against all earlier hashes in one vectorized sweep per layer
+    if not kernels.NUMBA_AVAILABLE:
+        keys = sorted(hashes.keys())
+        codes = [[get_codes(layer) for layer in hashes[key]] for key in keys]
+        condensed = np.empty(get_condensed_size(len(keys)), dtype=np.float64)
+        for i in range(1, len(keys)):
+            start = i * (i - 1) // 2
+            condensed[start:start + i] = edit_distance_batch(codes[i], codes[:i])[0]
+        return SimilarityMatrix(keys, condensed)
 
-    M = np.zeros((num_hashes, num_hashes))
-    for i, hash_i in enumerate(sorted_hashes.keys()):
-        for j, hash_j in enumerate(sorted_hashes.keys()):
-            X = np.array(sorted_hashes[hash_i], dtype=object)
-            Y = np.array(sorted_hashes[hash_j], dtype=object)
-            e_dist = p_ed(X, Y)[0]
-            M[i,j] = e_dist
-            if i == j:
-                break
+    # Each hash is converted once for the numba kernel
+    prepared = {key: kernels.prepare_hash(hash, "ed") for key, hash in hashes.items()}
+    return compute_similarity_matrix(prepared, lambda x, y: kernels.edit_distance(x, y)[0])
 
-    df = pd.DataFrame(M, index=sorted_hashes.keys(), columns=sorted_hashes.keys())
 
-    return df
+def py_edit_distance_penalty(hashes: dict[str, list[list[str]]], band: float | None = None, radius: int | None = None) -> SimilarityMatrix:
+    """ Test method Edit distance penalty, as a condensed SimilarityMatrix. Banded within a band of the longest layer, or approximated with FastDTW of a radius, see py/warping.py """
+    # Each hash is converted once for the fastest available kernel
+    prepared = {key: kernels.prepare_hash(hash, "edp") for key, hash in hashes.items()}
+    return compute_similarity_matrix(prepared, _get_edp_kernel(band, radius))
 
 
-def py_edit_distance_penalty(hashes: dict[str, list[list[str]]]) -> pd.DataFrame:
-    """ Test method Edit distance penalty"""
-    sorted_hashes = co.OrderedDict(sorted(hashes.items()))
-    num_hashes = len(sorted_hashes)
+def _edp_kernel(hash_x, hash_y) -> float:
+    return kernels.edit_distance_penalty(hash_x, hash_y)[0]
 
-    M = np.zeros((num_hashes, num_hashes))
-    for i, hash_i in enumerate(sorted_hashes.keys()):
-        for j, hash_j in enumerate(sorted_hashes.keys()):
-            X = np.array(sorted_hashes[hash_i], dtype=object)
-            Y = np.array(sorted_hashes[hash_j], dtype=object)
-            e_dist = p_edp(X, Y)[0]
-            M[i,j] = e_dist
-            if i == j:
-                break
+def _edp_banded_kernel(hash_x, hash_y, band: float) -> float:
+    return kernels.edit_distance_penalty_banded(hash_x, hash_y, band)[0]
 
-    df = pd.DataFrame(M, index=sorted_hashes.keys(), columns=sorted_hashes.keys())
+def _edp_fast_kernel(hash_x, hash_y, radius: int) -> float:
+    return kernels.edit_distance_penalty_fast(hash_x, hash_y, radius)[0]
 
-    return df
+def _get_edp_kernel(band: float | None, radius: int | None):
+    """ Returns the exact, banded (band) or approximate (radius) edit distance penalty kernel, see py/warping.py """
+    _check_warping(band, radius)
+    if band is not None:
+        return functools.partial(_edp_banded_kernel, band=band)
+    if radius is not None:
+        return functools.partial(_edp_fast_kernel, radius=radius)
+    return _edp_kernel
 
+def py_edit_distance_penalty_parallell(hashes: dict[str, list[list[str]]], engine: PairwiseEngine | None = None, checkpoint_folder: str | None = None, shard: str | None = None, band: float | None = None, radius: int | None = None) -> SimilarityMatrix | None:
+    """
+    Edit distance penalty for hashes computed in parallell
 
-def _fun_wrapper_edpp(args):
-        x,y,j = args
-        e_dist = p_edp(x,y)[0]
-        return e_dist, j
+    Params
+    ---
+    hashes : dict[str, list[list[str]]]
+        A dictionary containing the trajectory hashes
+    engine : PairwiseEngine | None
+        The engine whose worker pool is used. A temporary engine using all available cpus if None
+    checkpoint_folder : str | None
+        Keeps the finished tiles in this folder, so a stopped computation is resumed when run again. See PairwiseEngine.compute
+    shard : str | None
+        Only computes this shard ("i/k") into checkpoint_folder and returns None. The shards are assembled with merge-shards.py
+    band : float | None
+        Only warps within a Sakoe-Chiba band of this fraction of the longest layer
+    radius : int | None
+        Approximates the warping with FastDTW of this radius instead
 
-def py_edit_distance_penalty_parallell(hashes: dict[str, list[list[str]]]) -> pd.DataFrame:
-    """Edit distance penalty for hashes computed in parallell"""
-    sorted_hashes = co.OrderedDict(sorted(hashes.items()))
-    num_hashes = len(sorted_hashes)
-    M = np.zeros((num_hashes, num_hashes))
-    pool = Pool(12)
-    for i, hash_i in enumerate(sorted_hashes.keys()):
-        elements = pool.map(_fun_wrapper_edpp, [(np.array(sorted_hashes[hash_i], dtype=object), np.array(sorted_hashes[traj_j], dtype=object), j) for j, traj_j in enumerate(sorted_hashes.keys()) if i>=j])
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py), or None for a shard
+    """
+    return _compute_parallell(hashes, _get_edp_kernel(band, radius), None, kernels.prepare_hash_edp, engine, checkpoint_folder, shard)
 
-        for element in elements:
-            M[i, element[1]] = element[0]
-    df = pd.DataFrame(M, index=sorted_hashes.keys(), columns=sorted_hashes.keys())
 
-    return df 
+def py_dtw(hashes: dict[str, list[list[float]]], band: float | None = None, radius: int | None = None) -> SimilarityMatrix:
+    """ Coordinate dtw as hashes, as a condensed SimilarityMatrix. Banded within a band of the longest layer, or approximated with FastDTW of a radius, see py/warping.py """
+    # Each hash is converted once for the fastest available kernel
+    prepared = {key: kernels.prepare_hash(hash, "dtw") for key, hash in hashes.items()}
+    return compute_similarity_matrix(prepared, _get_dtw_kernel(band, radius))
 
 
-def py_dtw(hashes: dict[str, list[list[float]]]) -> pd.DataFrame:
-    """ Coordinate dtw as hashes"""
-    sorted_hashes = co.OrderedDict(sorted(hashes.items()))
-    num_hashes = len(sorted_hashes)
+def py_dtw_parallell(hashes: dict[str, list[list[float]]], engine: PairwiseEngine | None = None, checkpoint_folder: str | None = None, shard: str | None = None, band: float | None = None, radius: int | None = None) -> SimilarityMatrix | None:
+    """
+    Coordinate dtw for hashes computed in parallell
 
-    M = np.zeros((num_hashes, num_hashes))
-    for i, hash_i in enumerate(sorted_hashes.keys()):
-        for j, hash_j in enumerate(sorted_hashes.keys()):
-            X = np.array(sorted_hashes[hash_i], dtype=object)
-            Y = np.array(sorted_hashes[hash_j], dtype=object)
-            e_dist = p_dtw(X, Y)
-            M[i,j] = e_dist
-            if i == j:
-                break
+    Params
+    ---
+    hashes : dict[str, list[list[float]]]
+        A dictionary containing the trajectory hashes as disk centers
+    engine : PairwiseEngine | None
+        The engine whose worker pool is used. A temporary engine using all available cpus if None
+    checkpoint_folder : str | None
+        Keeps the finished tiles in this folder, so a stopped computation is resumed when run again. See PairwiseEngine.compute
+    shard : str | None
+        Only computes this shard ("i/k") into checkpoint_folder and returns None. The shards are assembled with merge-shards.py
+    band : float | None
+        Only warps within a Sakoe-Chiba band of this fraction of the longest layer
+    radius : int | None
+        Approximates the warping with FastDTW of this radius instead
 
-    df = pd.DataFrame(M, index=sorted_hashes.keys(), columns=sorted_hashes.keys())
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py), or None for a shard
+    """
+    return _compute_parallell(hashes, _get_dtw_kernel(band, radius), "numerical", kernels.prepare_hash_dtw, engine, checkpoint_folder, shard)
 
-    return df
 
 
-def _fun_wrapper_dtw(args):
-        x,y,j = args
-        e_dist = p_dtw(x,y)
-        return e_dist, j
+def py_dtw_indexed(hashes: dict[str, list[np.ndarray]], tables: np.ndarray) -> SimilarityMatrix:
+    """
+    Dtw for integer disk hashes, with the disk distances looked up in tables
 
-def py_dtw_parallell(hashes: dict[str, list[list[str]]]) -> pd.DataFrame:
-    """Edit distance penalty for hashes computed in parallell"""
- 
-    sorted_hashes = co.OrderedDict(sorted(hashes.items()))
-    num_hashes = len(sorted_hashes)
+    Params
+    ---
+    hashes : dict[str, list[np.ndarray]]
+        A dictionary containing the trajectory hashes as disk indices
+    tables : np.ndarray (layers, num_disks, num_disks)
+        The distances between the disk centers of each layer, see DiskLSH.distance_tables
 
-    M = np.zeros((num_hashes, num_hashes))
-    pool = Pool(12)
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py)
+    """
+    prepared = {key: kernels.prepare_hash(hash, "dtw_indexed") for key, hash in hashes.items()}
+    return compute_similarity_matrix(prepared, functools.partial(kernels.dtw_indexed, tables=tables))
 
-    for i, hash_i in enumerate(sorted_hashes.keys()):
-        elements = pool.map(_fun_wrapper_dtw, [(np.array(sorted_hashes[hash_i], dtype=object), np.array(sorted_hashes[traj_j], dtype=object), j) for j, traj_j in enumerate(sorted_hashes.keys()) if i>=j])
 
-        for element in elements:
-            M[i, element[1]] = element[0]
+def py_dtw_indexed_parallell(hashes: dict[str, list[np.ndarray]], tables: np.ndarray, engine: PairwiseEngine | None = None, checkpoint_folder: str | None = None, shard: str | None = None) -> SimilarityMatrix | None:
+    """
+    Dtw for integer disk hashes computed in parallell, with the disk distances looked up in tables
 
-    df = pd.DataFrame(M, index=sorted_hashes.keys(), columns=sorted_hashes.keys())
+    Params
+    ---
+    hashes : dict[str, list[np.ndarray]]
+        A dictionary containing the trajectory hashes as disk indices
+    tables : np.ndarray (layers, num_disks, num_disks)
+        The distances between the disk centers of each layer. Sent with every tile, which is cheap for the usual number of disks
+    engine : PairwiseEngine | None
+        The engine whose worker pool is used. A temporary engine using all available cpus if None
+    checkpoint_folder : str | None
+        Keeps the finished tiles in this folder, so a stopped computation is resumed when run again. See PairwiseEngine.compute
+    shard : str | None
+        Only computes this shard ("i/k") into checkpoint_folder and returns None. The shards are assembled with merge-shards.py
 
-    return df 
+    Returns
+    ---
+    The pairwise similarities as a condensed SimilarityMatrix (see utils/similarity_matrix.py), or None for a shard
+    """
+    kernel = functools.partial(kernels.dtw_indexed, tables=tables)
+    return _compute_parallell(hashes, kernel, "integer", kernels.prepare_hash_dtw_indexed, engine, checkpoint_folder, shard)
 
 
 
@@ -149,7 +224,7 @@ def measure_py_ed(args):
 if __name__=="__main__":
     d = {"a" : [["a","b","c","d"], ["a","b","c"]], 
         "b" : [["a", "c", "d"], ["a", "b", "d"]]    }
-    print(py_edit_distance(d))
+    print(py_edit_distance(d).to_dataframe())
 
     t = ti.repeat(lambda: py_edit_distance(d),repeat=3,number=10000)
     print(t)
@@ -0,0 +1,345 @@
+"""
+Sheet that selects the fastest available implementation of the hash similarity kernels
+
+The numba kernels in nb/ are used when numba is installed, otherwise the python kernels in py/ are used.
+The edit distance uses Myers' bit-parallel algorithm in both cases.
+Both give the same results, up to rounding in the last bit for dtw. The numba kernels work on flat arrays, so a hash can be converted once with prepare_hash
+and then be compared with many other hashes without being converted again.
+
+The numba kernels keep two rows of the DP matrix in a workspace that is owned by a KernelContext and reused for every pair,
+so no arrays are allocated per comparison. Each thread gets its own context through get_context, which the module level
+functions use, and a worker can hold its own context to keep the workspace across calls.
+"""
+
+import threading
+
+from typing import NamedTuple
+
+import numpy as np
+
+from ..cell_id import alphabetical_to_cells
+
+from .py.edit_distance import edit_distance as py_edit_distance, edit_distance_bounded as py_edit_distance_bounded, get_codes
+from .py.edit_distance_bitparallel import edit_distance_bitparallel as py_edit_distance_bitparallel
+from .py.edit_distance_penalty import edit_distance_penalty as py_edit_distance_penalty, edit_distance_penalty_bounded as py_edit_distance_penalty_bounded
+from .py.edit_distance_penalty import edit_distance_penalty_banded as py_edit_distance_penalty_banded, edit_distance_penalty_fast as py_edit_distance_penalty_fast
+from .py.dtw import dtw as py_dtw, dtw_bounded as py_dtw_bounded, dtw_indexed as py_dtw_indexed, dtw_banded as py_dtw_banded, dtw_fast as py_dtw_fast
+
+try:
+    from .nb.edit_distance import edit_distance as nb_edit_distance, edit_distance_bounded as nb_edit_distance_bounded
+    from .nb.edit_distance_penalty import edit_distance_penalty as nb_edit_distance_penalty, edit_distance_penalty_bounded as nb_edit_distance_penalty_bounded
+    from .nb.edit_distance_penalty import edit_distance_penalty_banded as nb_edit_distance_penalty_banded, edit_distance_penalty_fast as nb_edit_distance_penalty_fast
+    from .nb.dtw import dtw as nb_dtw, dtw_bounded as nb_dtw_bounded, dtw_indexed as nb_dtw_indexed, dtw_banded as nb_dtw_banded, dtw_fast as nb_dtw_fast
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+class PreparedHash(NamedTuple):
+    """ A hash converted for the numba kernels. Layer l is values[offsets[l]:offsets[l+1]] """
+    values: np.ndarray
+    offsets: np.ndarray
+
+
+def _get_offsets(hash: list) -> np.ndarray:
+    offsets = np.zeros(len(hash) + 1, dtype=np.int64)
+    np.cumsum([len(layer) for layer in hash], out=offsets[1:])
+    return offsets
+
+
+def _to_cells(layer) -> np.ndarray:
+    """ Converts a grid layer to packed cell ids """
+    if isinstance(layer, np.ndarray) and np.issubdtype(layer.dtype, np.integer):
+        return layer.astype(np.int64)
+    return alphabetical_to_cells(list(layer)).astype(np.int64)
+
+
+def prepare_hash(hash: list, measure: str) -> PreparedHash | list:
+    """
+    Converts a hash for the numba kernels. Without numba, grid hashes for "edp" are converted to packed cell ids
+    so that the python kernel does not convert the alphabetical cells for every pair, and other hashes are returned unchanged
+
+    Params
+    ---
+    hash : list
+        The layers of a trajectory hash
+    measure : str
+        The measure the hash will be used with: "ed" | "edp" | "dtw" | "dtw_indexed"
+    """
+    if isinstance(hash, PreparedHash):
+        return hash
+    if not NUMBA_AVAILABLE:
+        return [_to_cells(layer) for layer in hash] if measure == "edp" else hash
+
+    match measure:
+        case "ed" | "dtw_indexed":
+            layers = [get_codes(layer) for layer in hash]
+            values = np.concatenate(layers) if layers else np.zeros(0, dtype=np.int64)
+        case "edp":
+            layers = [_to_cells(layer) for layer in hash]
+            values = np.concatenate(layers) if layers else np.zeros(0, dtype=np.int64)
+        case "dtw":
+            values = np.array([point for layer in hash for point in layer], dtype=np.float64).reshape(-1, 2)
+        case _:
+            raise ValueError(f"Unknown measure {measure}. Must be ed, edp, dtw or dtw_indexed")
+
+    return PreparedHash(values, _get_offsets(hash))
+
+
+def prepare_hash_ed(hash: list) -> PreparedHash | list:
+    return prepare_hash(hash, "ed")
+
+
+def prepare_hash_edp(hash: list) -> PreparedHash | list:
+    return prepare_hash(hash, "edp")
+
+
+def prepare_hash_dtw(hash: list) -> PreparedHash | list:
+    return prepare_hash(hash, "dtw")
+
+
+def prepare_hash_dtw_indexed(hash: list) -> PreparedHash | list:
+    return prepare_hash(hash, "dtw_indexed")
+
+
+class KernelContext:
+    """ Owns the DP workspace of the numba kernels, which is grown when a longer hash is seen and reused otherwise. Not thread safe """
+
+    # The number of rows in the workspace. The bounded edit distance with penalty uses four rows, the other kernels two
+    ROWS = 4
+
+    def __init__(self, size: int = 64) -> None:
+        """
+        Parameters
+        ----------
+        size : int
+            The initial number of columns of the workspace
+        """
+        self.workspace = np.empty((self.ROWS, size), dtype=np.float64)
+
+
+    def get_workspace(self, x: PreparedHash, y: PreparedHash) -> np.ndarray:
+        """ Returns the workspace, grown to more columns than the longest layer of the hashes """
+        length = max(len(x.values), len(y.values)) + 2
+        if length > self.workspace.shape[1]:
+            self.workspace = np.empty((self.ROWS, max(length, 2 * self.workspace.shape[1])), dtype=np.float64)
+        return self.workspace
+
+
+    def edit_distance(self, hash_x, hash_y) -> tuple[float, float]:
+        """ Edit distance between two hashes (raw or prepared), see py/edit_distance.py """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_bitparallel(hash_x, hash_y)
+        x, y = prepare_hash(hash_x, "ed"), prepare_hash(hash_y, "ed")
+        return nb_edit_distance(*x, *y, self.get_workspace(x, y))
+
+
+    def edit_distance_penalty(self, hash_x, hash_y) -> tuple[float, float]:
+        """ Edit distance with penalty between two grid hashes (raw or prepared), see py/edit_distance_penalty.py """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_penalty(hash_x, hash_y)
+        x, y = prepare_hash(hash_x, "edp"), prepare_hash(hash_y, "edp")
+        return nb_edit_distance_penalty(*x, *y, self.get_workspace(x, y))
+
+
+    def edit_distance_bounded(self, hash_x, hash_y, max_cost: float) -> tuple[float, float]:
+        """ Edit distance between two hashes (raw or prepared), or (inf, inf) as soon as it exceeds max_cost """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_bounded(hash_x, hash_y, max_cost)
+        x, y = prepare_hash(hash_x, "ed"), prepare_hash(hash_y, "ed")
+        return nb_edit_distance_bounded(*x, *y, float(max_cost), self.get_workspace(x, y))
+
+
+    def edit_distance_penalty_bounded(self, hash_x, hash_y, max_cost: float) -> tuple[float, float]:
+        """ Edit distance with penalty between two grid hashes (raw or prepared), or (inf, inf) as soon as it exceeds max_cost """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_penalty_bounded(hash_x, hash_y, max_cost)
+        x, y = prepare_hash(hash_x, "edp"), prepare_hash(hash_y, "edp")
+        return nb_edit_distance_penalty_bounded(*x, *y, float(max_cost), self.get_workspace(x, y))
+
+
+    def dtw(self, hash_x, hash_y) -> float:
+        """ Dtw between two disk hashes of disk centers (raw or prepared), see py/dtw.py """
+        if not NUMBA_AVAILABLE:
+            return py_dtw(hash_x, hash_y)
+        x, y = prepare_hash(hash_x, "dtw"), prepare_hash(hash_y, "dtw")
+        return nb_dtw(*x, *y, self.get_workspace(x, y))
+
+
+    def dtw_indexed(self, hash_x, hash_y, tables: np.ndarray) -> float:
+        """ Dtw between two integer disk hashes (raw or prepared), with the disk distances looked up in tables. See py/dtw.py """
+        if not NUMBA_AVAILABLE:
+            return py_dtw_indexed(hash_x, hash_y, tables)
+        x, y = prepare_hash(hash_x, "dtw_indexed"), prepare_hash(hash_y, "dtw_indexed")
+        return nb_dtw_indexed(*x, *y, tables, self.get_workspace(x, y))
+
+
+    def dtw_bounded(self, hash_x, hash_y, max_cost: float) -> float:
+        """ Dtw between two disk hashes of disk centers (raw or prepared), or inf as soon as it exceeds max_cost """
+        if not NUMBA_AVAILABLE:
+            return py_dtw_bounded(hash_x, hash_y, max_cost)
+        x, y = prepare_hash(hash_x, "dtw"), prepare_hash(hash_y, "dtw")
+        return nb_dtw_bounded(*x, *y, float(max_cost), self.get_workspace(x, y))
+
+
+    def edit_distance_penalty_banded(self, hash_x, hash_y, band: float) -> tuple[float, float]:
+        """ Edit distance with penalty between two grid hashes (raw or prepared) within a Sakoe-Chiba band, see py/warping.py """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_penalty_banded(hash_x, hash_y, band)
+        x, y = prepare_hash(hash_x, "edp"), prepare_hash(hash_y, "edp")
+        return nb_edit_distance_penalty_banded(*x, *y, float(band), self.get_workspace(x, y))
+
+
+    def edit_distance_penalty_fast(self, hash_x, hash_y, radius: int) -> tuple[float, float]:
+        """ Edit distance with penalty between two grid hashes (raw or prepared) approximated with FastDTW, see py/warping.py """
+        if not NUMBA_AVAILABLE:
+            return py_edit_distance_penalty_fast(hash_x, hash_y, radius)
+        x, y = prepare_hash(hash_x, "edp"), prepare_hash(hash_y, "edp")
+        return nb_edit_distance_penalty_fast(*x, *y, int(radius), self.get_workspace(x, y))
+
+
+    def dtw_banded(self, hash_x, hash_y, band: float) -> float:
+        """ Dtw between two disk hashes of disk centers (raw or prepared) within a Sakoe-Chiba band, see py/warping.py """
+        if not NUMBA_AVAILABLE:
+            return py_dtw_banded(hash_x, hash_y, band)
+        x, y = prepare_hash(hash_x, "dtw"), prepare_hash(hash_y, "dtw")
+        return nb_dtw_banded(*x, *y, float(band), self.get_workspace(x, y))
+
+
+    def dtw_fast(self, hash_x, hash_y, radius: int) -> float:
+        """ Dtw between two disk hashes of disk centers (raw or prepared) approximated with FastDTW, see py/warping.py """
+        if not NUMBA_AVAILABLE:
+            return py_dtw_fast(hash_x, hash_y, radius)
+        x, y = prepare_hash(hash_x, "dtw"), prepare_hash(hash_y, "dtw")
+        return nb_dtw_fast(*x, *y, int(radius), self.get_workspace(x, y))
+
+
+
+_LOCAL = threading.local()
+
+
+def get_context() -> KernelContext:
+    """ Returns the kernel context of the current thread, which is created on first use """
+    context = getattr(_LOCAL, "context", None)
+    if context is None:
+        context = _LOCAL.context = KernelContext()
+    return context
+
+
+def edit_distance(hash_x, hash_y) -> tuple[float, float]:
+    """ Edit distance between two hashes (raw or prepared), see py/edit_distance.py """
+    return get_context().edit_distance(hash_x, hash_y)
+
+
+def edit_distance_penalty(hash_x, hash_y) -> tuple[float, float]:
+    """ Edit distance with penalty between two grid hashes (raw or prepared), see py/edit_distance_penalty.py """
+    return get_context().edit_distance_penalty(hash_x, hash_y)
+
+
+def edit_distance_bounded(hash_x, hash_y, max_cost: float) -> tuple[float, float]:
+    """ Edit distance between two hashes (raw or prepared), or (inf, inf) as soon as it exceeds max_cost """
+    return get_context().edit_distance_bounded(hash_x, hash_y, max_cost)
+
+
+def edit_distance_penalty_bounded(hash_x, hash_y, max_cost: float) -> tuple[float, float]:
+    """ Edit distance with penalty between two grid hashes (raw or prepared), or (inf, inf) as soon as it exceeds max_cost """
+    return get_context().edit_distance_penalty_bounded(hash_x, hash_y, max_cost)
+
+
+def dtw(hash_x, hash_y) -> float:
+    """ Dtw between two disk hashes of disk centers (raw or prepared), see py/dtw.py """
+    return get_context().dtw(hash_x, hash_y)
+
+
+def dtw_indexed(hash_x, hash_y, tables: np.ndarray) -> float:
+    """ Dtw between two integer disk hashes (raw or prepared), with the disk distances looked up in tables. See py/dtw.py """
+    return get_context().dtw_indexed(hash_x, hash_y, tables)
+
+
+def dtw_bounded(hash_x, hash_y, max_cost: float) -> float:
+    """ Dtw between two disk hashes of disk centers (raw or prepared), or inf as soon as it exceeds max_cost """
+    return get_context().dtw_bounded(hash_x, hash_y, max_cost)
+
+
+def edit_distance_penalty_banded(hash_x, hash_y, band: float) -> tuple[float, float]:
+    """ Edit distance with penalty between two grid hashes (raw or prepared) within a Sakoe-Chiba band, see py/warping.py """
+    return get_context().edit_distance_penalty_banded(hash_x, hash_y, band)
+
+
+def edit_distance_penalty_fast(hash_x, hash_y, radius: int) -> tuple[float, float]:
+    """ Edit distance with penalty between two grid hashes (raw or prepared) approximated with FastDTW, see py/warping.py """
+    return get_context().edit_distance_penalty_fast(hash_x, hash_y, radius)
+
+
+def dtw_banded(hash_x, hash_y, band: float) -> float:
+    """ Dtw between two disk hashes of disk centers (raw or prepared) within a Sakoe-Chiba band, see py/warping.py """
+    return get_context().dtw_banded(hash_x, hash_y, band)
+
+
+def dtw_fast(hash_x, hash_y, radius: int) -> float:
+    """ Dtw between two disk hashes of disk centers (raw or prepared) approximated with FastDTW, see py/warping.py """
+    return get_context().dtw_fast(hash_x, hash_y, radius)
+
+
+
+if __name__=="__main__":
+    import math
+    import random
+
+    # The kernels must give the same results as the python reference kernels
+    ed_cases = [
+        ([["AAaa","ABab","ACac","ADad"], ["AAaa","ABaa","ACac"]], [["AAaa", "ABab", "ADad"], ["AAaa", "ABaa", "ACab"]]),
+        ([["s","u","n","d","a","y"]], [["s","a","t","u,","r","d","a","y"]]),
+        ([["A","b"], ["a","b","c","d"]], [[], ["a", "c", "d"]]),
+        ([["a"]], [[]]),
+        ([[]], [[]]),
+        ([["b", "a","b","a"]], [["a", "b","a","b"]]),
+        ([["a"]], [["b"]*5]),
+        ([np.array([2, 1, 2], dtype=np.uint32)], [np.array([1, 2, 1], dtype=np.uint32)]),
+    ]
+    for x, y in ed_cases:
+        assert edit_distance(x, y) == py_edit_distance(x, y)
+
+    random.seed(1)
+    cells = ["ACad", "ABan", "BCai", "ABam", "ACan", "AAaa", "ZZzz"]
+    for _ in range(200):
+        x = [random.choices(cells, k=random.randint(0, 6)) for _ in range(3)]
+        y = [random.choices(cells, k=random.randint(0, 6)) for _ in range(3)]
+        assert edit_distance(x, y) == py_edit_distance(x, y)
+        assert edit_distance_penalty(x, y) == py_edit_distance_penalty(x, y)
+        assert edit_distance_penalty([alphabetical_to_cells(l) for l in x], y) == py_edit_distance_penalty(x, y)
+        for max_cost in (0.5, 2, 20):
+            assert edit_distance_bounded(x, y, max_cost) == py_edit_distance_bounded(x, y, max_cost)
+            assert edit_distance_penalty_bounded(x, y, max_cost) == py_edit_distance_penalty_bounded(x, y, max_cost)
+        for band, radius in ((0.1, 1), (0.5, 2), (1, 6)):
+            assert edit_distance_penalty_banded(x, y, band) == py_edit_distance_penalty_banded(x, y, band)
+            assert edit_distance_penalty_fast(x, y, radius) == py_edit_distance_penalty_fast(x, y, radius)
+
+        x = [list(np.random.rand(random.randint(0, 6), 2)) for _ in range(3)]
+        y = [list(np.random.rand(random.randint(0, 6), 2)) for _ in range(3)]
+        # Python computes d**2 with pow while numba multiplies, so the distances can differ in the last bit
+        assert math.isclose(dtw(x, y), py_dtw(x, y), rel_tol=1e-12)
+        assert math.isclose(dtw(prepare_hash(x, "dtw"), y), py_dtw(x, y), rel_tol=1e-12)
+        assert dtw_bounded(x, y, 1.5) == (dtw(x, y) if dtw(x, y) <= 1.5 else math.inf)
+        for band, radius in ((0.1, 1), (0.5, 2)):
+            assert math.isclose(dtw_banded(x, y, band), py_dtw_banded(x, y, band), rel_tol=1e-12)
+            assert math.isclose(dtw_fast(x, y, radius), py_dtw_fast(x, y, radius), rel_tol=1e-12)
+        assert math.isclose(dtw_banded(x, y, 1), dtw(x, y), rel_tol=1e-12) and math.isclose(dtw_fast(x, y, 6), dtw(x, y), rel_tol=1e-12)
+
+        disks = np.random.rand(3, 8, 2)
+        tables = np.sqrt(((disks[:, :, np.newaxis, :] - disks[:, np.newaxis, :, :]) ** 2).sum(axis=3))
+        x = [np.random.randint(0, 8, random.randint(0, 6)).astype(np.uint16) for _ in range(3)]
+        y = [np.random.randint(0, 8, random.randint(0, 6)).astype(np.uint16) for _ in range(3)]
+        assert math.isclose(dtw_indexed(x, y, tables), py_dtw_indexed(x, y, tables), rel_tol=1e-12)
+        assert math.isclose(dtw_indexed(x, y, tables), py_dtw([list(disks[l][x[l]]) for l in range(3)], [list(disks[l][y[l]]) for l in range(3)]), rel_tol=1e-12)
+
+    # The workspace grows for longer hashes and gives the same results as a fresh one afterwards
+    context = KernelContext(size=2)
+    x = [random.choices(cells, k=40) for _ in range(2)]
+    y = [random.choices(cells, k=70) for _ in range(2)]
+    assert context.edit_distance(x, y) == py_edit_distance(x, y) and context.edit_distance_penalty(x, y) == py_edit_distance_penalty(x, y)
+    assert context.workspace.shape[1] >= 72
+    assert context.edit_distance(y[:1], x[:1]) == py_edit_distance(y[:1], x[:1])
+    assert get_context() is get_context()
+
+    print(f"All tests passed (numba available: {NUMBA_AVAILABLE})")
@@ -0,0 +1,203 @@
+""" Sheet containing the numba version of the dtw over disk hashes. See py/dtw.py for the reference implementation """
+
+import math
+
+import numpy as np
+
+from numba import njit
+
+from . import warping
+
+
+@njit(nogil=True, cache=True)
+def dtw_layer(X: np.ndarray, Y: np.ndarray, rows: np.ndarray) -> float:
+    """ Returns the dtw between two non-empty layers of (lat, lon) coordinates, keeping two rows of the DP matrix in rows[0] and rows[1] """
+    X_len = len(X)
+    Y_len = len(Y)
+    previous = rows[0]
+    current = rows[1]
+    previous[0] = 0
+    previous[1:Y_len + 1] = np.inf
+
+    for i in range(1, X_len + 1):
+        current[0] = np.inf
+        for j in range(1, Y_len + 1):
+            s = math.sqrt((X[i-1, 0] - Y[j-1, 0])**2 + (X[i-1, 1] - Y[j-1, 1])**2)
+
+            current[j] = s + min(current[j-1], previous[j], previous[j-1])
+        previous, current = current, previous
+
+    return previous[Y_len]
+
+
+@njit(nogil=True, cache=True)
+def dtw(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, rows: np.ndarray) -> float:
+    """
+    Computes the dtw between two trajectory hashes given as disk centers
+
+    Param
+    ---
+    x_values, y_values : np.ndarray[float64] (n, 2)
+        The disk centers of all layers of the hash, stored back to back
+    x_offsets, y_offsets : np.ndarray[int64]
+        Layer l is values[offsets[l]:offsets[l+1]]
+    rows : np.ndarray (2, n)
+        Reused DP workspace with more columns than the longest layer, see kernels.KernelContext
+
+    Returns
+    ---
+    Their dtw
+    """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+
+        if len(X) == 0 or len(Y) == 0:
+            cost += 0.5
+            continue
+
+        cost += dtw_layer(X, Y, rows)
+
+    return cost
+
+
+@njit(nogil=True, cache=True)
+def dtw_bounded(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, max_cost: float, rows: np.ndarray) -> float:
+    """ Computes the dtw between two hashes of disk centers, returning inf as soon as it exceeds max_cost. See py/dtw.py """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        if X_len == 0 or Y_len == 0:
+            cost += 0.5
+        else:
+            previous = rows[0]
+            current = rows[1]
+            previous[0] = 0
+            previous[1:Y_len + 1] = np.inf
+
+            for i in range(1, X_len + 1):
+                current[0] = np.inf
+                row_min = np.inf
+                for j in range(1, Y_len + 1):
+                    s = math.sqrt((X[i-1, 0] - Y[j-1, 0])**2 + (X[i-1, 1] - Y[j-1, 1])**2)
+
+                    current[j] = s + min(current[j-1], previous[j], previous[j-1])
+                    row_min = min(row_min, current[j])
+
+                if cost + row_min > max_cost:
+                    return np.inf
+                previous, current = current, previous
+            cost += previous[Y_len]
+
+        if cost > max_cost:
+            return np.inf
+
+    return cost
+
+
+@njit(nogil=True, cache=True)
+def dtw_indexed(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, tables: np.ndarray, rows: np.ndarray) -> float:
+    """
+    Computes the dtw between two trajectory hashes given as disk indices, looking the distances up in tables
+
+    Param
+    ---
+    x_values, y_values : np.ndarray[int64]
+        The disk indices of all layers of the hash, stored back to back
+    x_offsets, y_offsets : np.ndarray[int64]
+        Layer l is values[offsets[l]:offsets[l+1]]
+    tables : np.ndarray (layers, num_disks, num_disks)
+        The distances between the disk centers of each layer
+    rows : np.ndarray (2, n)
+        Reused DP workspace with more columns than the longest layer, see kernels.KernelContext
+
+    Returns
+    ---
+    Their dtw
+    """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        if X_len == 0 or Y_len == 0:
+            cost += 0.5
+            continue
+
+        table = tables[layer]
+        previous = rows[0]
+        current = rows[1]
+        previous[0] = 0
+        previous[1:Y_len + 1] = np.inf
+
+        for i in range(1, X_len + 1):
+            current[0] = np.inf
+            row = table[X[i-1]]
+            for j in range(1, Y_len + 1):
+                current[j] = row[Y[j-1]] + min(current[j-1], previous[j], previous[j-1])
+            previous, current = current, previous
+
+        cost += previous[Y_len]
+
+    return cost
+
+
+@njit(nogil=True, cache=True)
+def dtw_banded(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, band: float, rows: np.ndarray) -> float:
+    """ Computes the dtw between two hashes of disk centers within a Sakoe-Chiba band of a fraction of the longest layer. See py/dtw.py """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+
+        if len(X) == 0 or len(Y) == 0:
+            cost += 0.5
+            continue
+
+        cost += warping.warp_band(X, Y, band, False, False, rows)
+
+    return cost
+
+
+@njit(nogil=True, cache=True)
+def dtw_fast(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, radius: int, rows: np.ndarray) -> float:
+    """ Approximates the dtw between two hashes of disk centers with FastDTW of the given radius. See py/dtw.py """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+
+        if len(X) == 0 or len(Y) == 0:
+            cost += 0.5
+            continue
+
+        cost += warping.fast_warp(X, Y, radius, False, False, rows)
+
+    return cost
@@ -0,0 +1,173 @@
+""" Sheet containing the numba version of the edit distance that will be applied to the hashes. See py/edit_distance.py for the reference implementation """
+
+import numpy as np
+
+from numba import njit
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_layer(X: np.ndarray, Y: np.ndarray, rows: np.ndarray) -> float:
+    """
+    Returns the number of edits between two non-empty layers of integer codes, with the same boundary values as the python version
+
+    Only two rows of the DP matrix are kept, in rows[0] and rows[1] (workspace of at least len(Y) + 1 columns).
+    The python version writes the first row and column just after they are read, so the first row sees 0 above it
+    and j-1 on its diagonal, and the first column sees 0 to its left and i-1 on its diagonal
+    """
+    X_len = len(X)
+    Y_len = len(Y)
+    previous = rows[0]
+    current = rows[1]
+
+    for i in range(1, X_len + 1):
+        for j in range(1, Y_len + 1):
+            subcost = 0 if X[i-1] == Y[j-1] else 1
+
+            left = 0.0 if j == 1 else current[j-1]
+            up = 0.0 if i == 1 else previous[j]
+            if i == 1:
+                diagonal = float(j-1)
+            elif j == 1:
+                diagonal = float(i-1)
+            else:
+                diagonal = previous[j-1]
+
+            current[j] = min(left + 1, up + 1, diagonal + subcost)
+        previous, current = current, previous
+
+    return previous[Y_len]
+
+
+# The longest pattern that fits in one machine word. Longer layers fall back to the DP
+WORD_SIZE = 64
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_layer_bitparallel(X: np.ndarray, Y: np.ndarray, rows: np.ndarray) -> float:
+    """ Returns the number of edits between two non-empty layers of integer codes with Myers' algorithm, see py/edit_distance_bitparallel.py. Falls back to the DP for longer layers """
+    if len(X) > len(Y):
+        X, Y = Y, X
+
+    m = len(X)
+    n = len(Y)
+    subcost = 0 if X[0] == Y[0] else 1
+    if m == 1:
+        return float(subcost if n == 1 else 1)
+    if m - 1 > WORD_SIZE:
+        return edit_distance_layer(X, Y, rows)
+
+    one = np.uint64(1)
+    mask = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(WORD_SIZE - (m - 1))
+    last = one << np.uint64(m - 2)
+
+    pv = np.uint64(1 - subcost)
+    mv = np.uint64(0)
+    score = 1
+
+    for j in range(1, n):
+        # The pattern fits in a word, so its matches are found with a short scan instead of a lookup table
+        eq = np.uint64(0)
+        for i in range(m - 1):
+            if X[i+1] == Y[j]:
+                eq |= one << np.uint64(i)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        ph = (ph << one) & mask
+        mh = (mh << one) & mask
+        if j == 1 and subcost == 0:
+            ph |= one
+
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return float(score)
+
+
+@njit(nogil=True, cache=True)
+def edit_distance(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, rows: np.ndarray) -> tuple[float, float]:
+    """
+    Computes the edit distance between two trajectory hashes given as integer codes
+
+    Param
+    ---
+    x_values, y_values : np.ndarray[int64]
+        The codes of all layers of the hash, stored back to back
+    x_offsets, y_offsets : np.ndarray[int64]
+        Layer l is values[offsets[l]:offsets[l+1]]
+    rows : np.ndarray (2, n)
+        Reused DP workspace with more columns than the longest layer, see kernels.KernelContext
+
+    Returns
+    ---
+    Their combined edit distance (sum of number of edits divided by longest sequence) and total number of edits (float, float)
+    """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+            continue
+        # Edge case if both hashes are empty
+        if X_len == 0 and Y_len == 0:
+            continue
+
+        edits = edit_distance_layer_bitparallel(X, Y, rows)
+        cost += edits / max(X_len, Y_len)
+        c += edits
+
+    return cost, c
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_bounded(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, max_cost: float, rows: np.ndarray) -> tuple[float, float]:
+    """
+    Computes the edit distance between two hashes of integer codes, returning (inf, inf) as soon as the cost exceeds max_cost
+
+    The bit-parallel layer kernel is already linear in the layer length, so the remaining layers are skipped once the bound
+    is exceeded, rather than banding the DP as in py/edit_distance.py
+    """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            edits = edit_distance_layer_bitparallel(X, Y, rows)
+            cost += edits / max(X_len, Y_len)
+            c += edits
+
+        if cost > max_cost:
+            return np.inf, np.inf
+
+    return cost, c
@@ -0,0 +1,232 @@
+""" Sheet containing the numba version of the edit distance with penalty (dtw over grid cells). See py/edit_distance_penalty.py for the reference implementation """
+
+import numpy as np
+
+from numba import njit
+
+from utils.cell_id import CELL_BITS, CELL_MASK
+
+from . import warping
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty_layer(X: np.ndarray, Y: np.ndarray, rows: np.ndarray) -> float:
+    """
+    Returns the accumulated cell distance between two non-empty layers of packed cell ids, with the same boundary values as the python version
+
+    Only two rows of the DP matrix are kept, in rows[0] and rows[1] (workspace of at least len(Y) + 1 columns).
+    In the python version the first row and column only hold the cell distance, as the cells they are compared with are still 0
+    """
+    X_len = len(X)
+    Y_len = len(Y)
+    previous = rows[0]
+    current = rows[1]
+
+    for i in range(1, X_len + 1):
+        for j in range(1, Y_len + 1):
+            s = abs((X[i-1] >> CELL_BITS) - (Y[j-1] >> CELL_BITS)) + abs((X[i-1] & CELL_MASK) - (Y[j-1] & CELL_MASK))
+
+            if i == 1 or j == 1:
+                current[j] = s
+            else:
+                current[j] = s + min(current[j-1], previous[j], previous[j-1])
+        previous, current = current, previous
+
+    return previous[Y_len]
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, rows: np.ndarray) -> tuple[float, float]:
+    """
+    Computes the edit distance with penalty between two trajectory hashes given as packed cell ids
+
+    Param
+    ---
+    x_values, y_values : np.ndarray[int64]
+        The packed cell ids of all layers of the hash, stored back to back
+    x_offsets, y_offsets : np.ndarray[int64]
+        Layer l is values[offsets[l]:offsets[l+1]]
+    rows : np.ndarray (4, n)
+        Reused DP workspace with more columns than the longest layer, see kernels.KernelContext
+
+    Returns
+    ---
+    Their combined edit distance (sum of number of edits divided by longest sequence) and total number of edits (float, float)
+    """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+            continue
+        # Edge case if both hashes are empty
+        if X_len == 0 and Y_len == 0:
+            continue
+
+        edits = edit_distance_penalty_layer(X, Y, rows)
+        cost += edits / max(X_len, Y_len)
+        c += edits
+
+    return cost, c
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty_layer_bounded(X: np.ndarray, Y: np.ndarray, bound: float, rows: np.ndarray) -> float:
+    """ Returns the accumulated cell distance between two non-empty layers of packed cell ids, or inf as soon as it exceeds bound. See py/edit_distance_penalty.py """
+    X_len = len(X)
+    Y_len = len(Y)
+    previous = rows[0]
+    current = rows[1]
+    starts = rows[2]
+    later_starts = rows[3]
+
+    # M[i][1] for each row, and the smallest of them in row i or later
+    for i in range(X_len):
+        starts[i] = abs((X[i] >> CELL_BITS) - (Y[0] >> CELL_BITS)) + abs((X[i] & CELL_MASK) - (Y[0] & CELL_MASK))
+    later_starts[X_len] = np.inf
+    for i in range(X_len - 1, -1, -1):
+        later_starts[i] = min(starts[i], later_starts[i+1])
+
+    # The first row only holds new starts, M[1][j] = s(0, j-1). first and last are the columns of the kept cells, 0 if none
+    previous[:Y_len + 1] = np.inf
+    first, last = 0, 0
+    for j in range(1, Y_len + 1):
+        s = abs((X[0] >> CELL_BITS) - (Y[j-1] >> CELL_BITS)) + abs((X[0] & CELL_MASK) - (Y[j-1] & CELL_MASK))
+        if s <= bound:
+            previous[j] = s
+            first = j if first == 0 else first
+            last = j
+
+    for i in range(2, X_len + 1):
+        if first == 0 and later_starts[i-1] > bound:
+            return np.inf
+
+        current[:Y_len + 1] = np.inf
+        if starts[i-1] <= bound:
+            current[1] = starts[i-1]
+
+        j = 2 if current[1] != np.inf or first == 0 else max(2, first)
+        end = last + 1 if first != 0 else 1
+        first, last = (1, 1) if current[1] != np.inf else (0, 0)
+        while j <= Y_len and (j <= end or current[j-1] != np.inf):
+            s = abs((X[i-1] >> CELL_BITS) - (Y[j-1] >> CELL_BITS)) + abs((X[i-1] & CELL_MASK) - (Y[j-1] & CELL_MASK))
+            value = s + min(current[j-1], previous[j], previous[j-1])
+            if value <= bound:
+                current[j] = value
+                first = j if first == 0 else first
+                last = j
+            j += 1
+
+        previous, current = current, previous
+
+    return previous[Y_len]
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty_bounded(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, max_cost: float, rows: np.ndarray) -> tuple[float, float]:
+    """ Computes the edit distance with penalty between two hashes of packed cell ids, returning (inf, inf) as soon as the cost exceeds max_cost """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            edits = edit_distance_penalty_layer_bounded(X, Y, (max_cost - cost) * max(X_len, Y_len) + 1e-9, rows)
+            if edits == np.inf:
+                return np.inf, np.inf
+            cost += edits / max(X_len, Y_len)
+            c += edits
+
+        if cost > max_cost:
+            return np.inf, np.inf
+
+    return cost, c
+
+
+@njit(nogil=True, cache=True)
+def get_cell_points(X: np.ndarray) -> np.ndarray:
+    """ Returns the (lat, lon) cell indices of a layer of packed cell ids as a (n, 2) float array, as used by nb/warping.py """
+    points = np.empty((len(X), 2), dtype=np.float64)
+    for i in range(len(X)):
+        points[i, 0] = X[i] >> CELL_BITS
+        points[i, 1] = X[i] & CELL_MASK
+    return points
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty_banded(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, band: float, rows: np.ndarray) -> tuple[float, float]:
+    """ Computes the edit distance with penalty between two hashes of packed cell ids within a Sakoe-Chiba band of a fraction of the longest layer. See py/edit_distance_penalty.py """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            edits = warping.warp_band(get_cell_points(X), get_cell_points(Y), band, True, True, rows)
+            cost += edits / max(X_len, Y_len)
+            c += edits
+
+    return cost, c
+
+
+@njit(nogil=True, cache=True)
+def edit_distance_penalty_fast(x_values: np.ndarray, x_offsets: np.ndarray, y_values: np.ndarray, y_offsets: np.ndarray, radius: int, rows: np.ndarray) -> tuple[float, float]:
+    """ Approximates the edit distance with penalty between two hashes of packed cell ids with FastDTW of the given radius. See py/edit_distance_penalty.py """
+    if len(x_offsets) != len(y_offsets):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0.0
+    c = 0.0
+
+    for layer in range(len(x_offsets) - 1):
+        X = x_values[x_offsets[layer]:x_offsets[layer+1]]
+        Y = y_values[y_offsets[layer]:y_offsets[layer+1]]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            edits = warping.fast_warp(get_cell_points(X), get_cell_points(Y), radius, True, True, rows)
+            cost += edits / max(X_len, Y_len)
+            c += edits
+
+    return cost, c
@@ -0,0 +1,170 @@
+""" Sheet containing the numba version of the banded and approximate (FastDTW) warping recursion. See py/warping.py for the reference implementation """
+
+import math
+
+import numpy as np
+
+from numba import njit
+
+
+@njit(nogil=True, cache=True)
+def point_distance(X: np.ndarray, i: int, Y: np.ndarray, j: int, manhattan: bool) -> float:
+    if manhattan:
+        return abs(X[i, 0] - Y[j, 0]) + abs(X[i, 1] - Y[j, 1])
+    return math.sqrt((X[i, 0] - Y[j, 0])**2 + (X[i, 1] - Y[j, 1])**2)
+
+
+@njit(nogil=True, cache=True)
+def get_band_window(X_len: int, Y_len: int, band: float) -> int:
+    return max(int(math.ceil(band * max(X_len, Y_len))), abs(X_len - Y_len))
+
+
+@njit(nogil=True, cache=True)
+def fill_row(X: np.ndarray, Y: np.ndarray, i: int, start: int, end: int, previous: np.ndarray, previous_shift: int, previous_start: int, previous_end: int, current: np.ndarray, current_shift: int, manhattan: bool, free_start: bool) -> None:
+    """
+    Fills the columns [start, end) of row i from the columns [previous_start, previous_end) of row i-1.
+    Column j of a row is stored at index j - shift of its array
+    """
+    for j in range(start, end):
+        d = point_distance(X, i, Y, j, manhattan)
+        if free_start and (i == 0 or j == 0):
+            current[j - current_shift] = d
+            continue
+
+        best = current[j - 1 - current_shift] if j > start else np.inf
+        if i == 0:
+            if j == 0:
+                best = 0.0
+        else:
+            if previous_start <= j < previous_end:
+                best = min(best, previous[j - previous_shift])
+            if previous_start <= j - 1 < previous_end:
+                best = min(best, previous[j - 1 - previous_shift])
+        current[j - current_shift] = d + best
+
+
+@njit(nogil=True, cache=True)
+def warp_band(X: np.ndarray, Y: np.ndarray, band: float, manhattan: bool, free_start: bool, rows: np.ndarray) -> float:
+    """ Returns the warping cost of two non-empty layers within the Sakoe-Chiba band of a fraction of the longest layer, keeping two rows in rows[0] and rows[1] """
+    X_len = len(X)
+    Y_len = len(Y)
+    window = get_band_window(X_len, Y_len, band)
+    previous = rows[0]
+    current = rows[1]
+    previous_start = previous_end = 0
+
+    for i in range(X_len):
+        start = max(i - window, 0)
+        end = min(i + window + 1, Y_len)
+        fill_row(X, Y, i, start, end, previous, 0, previous_start, previous_end, current, 0, manhattan, free_start)
+        previous, current = current, previous
+        previous_start, previous_end = start, end
+
+    return previous[Y_len - 1]
+
+
+@njit(nogil=True, cache=True)
+def warp_window(X: np.ndarray, Y: np.ndarray, starts: np.ndarray, ends: np.ndarray, manhattan: bool, free_start: bool, rows: np.ndarray) -> float:
+    """ Returns the warping cost of two non-empty layers within the columns [starts[i], ends[i]) of each row, keeping two rows in rows[0] and rows[1] """
+    previous = rows[0]
+    current = rows[1]
+    previous_start = previous_end = 0
+
+    for i in range(len(X)):
+        fill_row(X, Y, i, starts[i], ends[i], previous, 0, previous_start, previous_end, current, 0, manhattan, free_start)
+        previous, current = current, previous
+        previous_start, previous_end = starts[i], ends[i]
+
+    return previous[len(Y) - 1]
+
+
+@njit(nogil=True, cache=True)
+def get_path_ranges(X: np.ndarray, Y: np.ndarray, starts: np.ndarray, ends: np.ndarray, manhattan: bool, free_start: bool) -> tuple[np.ndarray, np.ndarray]:
+    """ Fills the window keeping all its cells, and returns the first and last column the warping path visits in every row, see py/warping.py """
+    X_len = len(X)
+    offsets = np.zeros(X_len + 1, dtype=np.int64)
+    for i in range(X_len):
+        offsets[i+1] = offsets[i] + ends[i] - starts[i]
+
+    # Column j of row i is kept at costs[offsets[i] + j - starts[i]]
+    costs = np.empty(offsets[X_len], dtype=np.float64)
+    for i in range(X_len):
+        previous_start, previous_end = (starts[i-1], ends[i-1]) if i > 0 else (0, 0)
+        previous_shift = starts[i-1] - offsets[i-1] if i > 0 else 0
+        fill_row(X, Y, i, starts[i], ends[i], costs, previous_shift, previous_start, previous_end, costs, starts[i] - offsets[i], manhattan, free_start)
+
+    lowest = np.zeros(X_len, dtype=np.int64)
+    highest = np.zeros(X_len, dtype=np.int64)
+    i = X_len - 1
+    j = ends[i] - 1
+    lowest[i] = highest[i] = j
+    while i > 0 or j > 0:
+        row = i
+        if free_start and (i == 0 or j == 0):
+            if i == 0:
+                j -= 1
+            else:
+                i -= 1
+        else:
+            # Diagonal steps are preferred on ties, as in FastDTW
+            best = np.inf
+            best_i, best_j = i, j
+            for step_i, step_j in ((i-1, j-1), (i-1, j), (i, j-1)):
+                if step_i >= 0 and step_j >= 0 and starts[step_i] <= step_j < ends[step_i]:
+                    cost = costs[offsets[step_i] + step_j - starts[step_i]]
+                    if cost < best:
+                        best, best_i, best_j = cost, step_i, step_j
+            i, j = best_i, best_j
+        if i != row:
+            highest[i] = j
+        lowest[i] = j
+
+    return lowest, highest
+
+
+@njit(nogil=True, cache=True)
+def coarsen(X: np.ndarray) -> np.ndarray:
+    half = len(X) // 2
+    coarse = np.empty(((len(X) + 1) // 2, 2), dtype=np.float64)
+    for k in range(half):
+        coarse[k, 0] = (X[2*k, 0] + X[2*k+1, 0]) / 2
+        coarse[k, 1] = (X[2*k, 1] + X[2*k+1, 1]) / 2
+    if len(X) % 2:
+        coarse[half, 0] = X[len(X) - 1, 0]
+        coarse[half, 1] = X[len(X) - 1, 1]
+    return coarse
+
+
+@njit(nogil=True, cache=True)
+def expand_ranges(lowest: np.ndarray, highest: np.ndarray, radius: int, X_len: int, Y_len: int) -> tuple[np.ndarray, np.ndarray]:
+    coarse_len = len(lowest)
+    starts = np.empty(X_len, dtype=np.int64)
+    ends = np.empty(X_len, dtype=np.int64)
+    for i in range(coarse_len):
+        first = max(0, i - radius)
+        last = min(coarse_len, i + radius + 1)
+        start = max(0, 2 * (lowest[first:last].min() - radius))
+        end = min(Y_len, 2 * (highest[first:last].max() + radius) + 2)
+        for row in range(2*i, min(2*i + 2, X_len)):
+            starts[row] = start
+            ends[row] = end
+    return starts, ends
+
+
+@njit(nogil=True, cache=True)
+def fast_warp(X: np.ndarray, Y: np.ndarray, radius: int, manhattan: bool, free_start: bool, rows: np.ndarray) -> float:
+    """ Approximates the warping cost of two non-empty layers with FastDTW, see py/warping.py """
+    levels_x = [np.ascontiguousarray(X)]
+    levels_y = [np.ascontiguousarray(Y)]
+    while min(len(levels_x[-1]), len(levels_y[-1])) > radius + 2:
+        levels_x.append(coarsen(levels_x[-1]))
+        levels_y.append(coarsen(levels_y[-1]))
+
+    top = len(levels_x) - 1
+    starts = np.zeros(len(levels_x[top]), dtype=np.int64)
+    ends = np.full(len(levels_x[top]), len(levels_y[top]), dtype=np.int64)
+    for level in range(top, 0, -1):
+        lowest, highest = get_path_ranges(levels_x[level], levels_y[level], starts, ends, manhattan, free_start)
+        starts, ends = expand_ranges(lowest, highest, radius, len(levels_x[level-1]), len(levels_y[level-1]))
+
+    return warp_window(levels_x[0], levels_y[0], starts, ends, manhattan, free_start, rows)
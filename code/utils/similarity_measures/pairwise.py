@@ -0,0 +1,802 @@
+"""
+Sheet containing a tiled, shared-memory engine for computing pairwise hash similarities
+
+The strictly lower triangle of the similarity matrix is stored condensed, where pair (i, j), j < i, is at index i*(i-1)/2 + j.
+It is split into tiles of contiguous condensed indices, so all tiles hold the same number of pairs no matter which rows they span.
+The diagonal is computed as separate tiles and stored after the condensed pairs.
+
+The hashes are written once to a hash store in a job folder, and the workers write their results directly into a shared
+memory output, so neither hashes nor results are pickled per pair. Hashes prepared for the numba kernels are prepared once
+by the parent and written as flat arrays to the job folder, which every worker memory-maps and slices, so the workers share
+one copy of them. Other hashes (python kernels) are read from the hash store by each worker into its own copy.
+
+With a checkpoint folder, each finished tile is also written to its own file, and the tiles that are done are recorded in a
+manifest. A computation that is stopped (e.g. by the SLURM time limit) and started again with the same checkpoint folder
+only computes the tiles that are missing.
+
+A computation can also be split into shards (shard i of k) that run as separate jobs, e.g. a SLURM job array.
+Shard i computes the tiles whose index is i modulo k into its own checkpoint folder, and merge_shards assembles them.
+"""
+
+import os
+import json
+import queue
+import math
+import functools
+import time
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from typing import NamedTuple
+from threading import BrokenBarrierError
+from multiprocessing import Barrier, Pool, Queue, TimeoutError, shared_memory
+
+from ..hash_store import HashStore, write_hash_store
+from .kernels import PreparedHash
+from .progress import METRICS_INTERVAL, ProgressMonitor, get_max_rss_mb
+
+
+# The number of tiles each process gets on average. More tiles gives better load balancing, fewer gives less overhead
+TILES_PER_PROCESS = 16
+
+CHECKPOINT_VERSION = 1
+
+# The average number of tiles per shard. The tile size of a sharded computation only depends on the number of shards, so all shards agree on it
+TILES_PER_SHARD = 1024
+
+# Seconds a worker waits for the other workers when the job is released, before it gives up on them
+RELEASE_TIMEOUT = 60.0
+
+# The job the current worker process has opened: (job_folder, keys, hashes, shared memory, output array)
+_WORKER_JOB = None
+
+# The barrier all workers of the pool wait on when a job is released, and the queue the workers report started tiles to, set by _init_worker
+_WORKER_BARRIER = None
+_WORKER_EVENTS = None
+
+
+def get_available_cpus() -> int:
+    """ Returns the number of cpus this process may run on, which respects SLURM and taskset cpu binding """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_condensed_size(n: int) -> int:
+    """ Returns the number of pairs in the strictly lower triangle of an n x n matrix """
+    return n * (n - 1) // 2
+
+
+def get_pair(k: int) -> tuple[int, int]:
+    """ Returns the pair (i, j), j < i, stored at condensed index k """
+    i = (1 + math.isqrt(1 + 8 * k)) // 2
+    return i, k - i * (i - 1) // 2
+
+
+def get_tiles(n: int, tile_size: int) -> list[tuple[str, int, int]]:
+    """ Splits the pairs and the diagonal of an n x n matrix into tiles of at most tile_size entries """
+    pairs = get_condensed_size(n)
+    tiles = [("pairs", start, min(start + tile_size, pairs)) for start in range(0, pairs, tile_size)]
+    tiles += [("diagonal", start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+    return tiles
+
+
+def _write_prepared(hashes: dict[str, list], keys: list[str], prepare, job_folder: str) -> bool:
+    """
+    Prepares the hashes once and writes them to the job folder as flat arrays for the workers to memory-map:
+    the values of all hashes back to back, the start of each hash in them and the layer offsets of each hash.
+    Returns False, writing nothing, if prepare is None or does not give PreparedHash (the python kernels without numba)
+    """
+    if prepare is None:
+        return False
+    prepared = [prepare(hashes[key]) for key in keys]
+    if not prepared or not all(isinstance(hash, PreparedHash) for hash in prepared):
+        return False
+
+    starts = np.zeros(len(prepared) + 1, dtype=np.int64)
+    np.cumsum([len(hash.values) for hash in prepared], out=starts[1:])
+    np.save(os.path.join(job_folder, "prepared-values.npy"), np.concatenate([hash.values for hash in prepared]))
+    np.save(os.path.join(job_folder, "prepared-starts.npy"), starts)
+    # All hashes have the same number of layers, as checked by write_hash_store
+    np.save(os.path.join(job_folder, "prepared-offsets.npy"), np.array([hash.offsets for hash in prepared], dtype=np.int64))
+    return True
+
+
+def _load_prepared(job_folder: str, keys: list[str]) -> dict[str, PreparedHash]:
+    """ Returns the prepared hashes of a job as views into the memory-mapped arrays written by _write_prepared """
+    values, starts, offsets = (np.load(os.path.join(job_folder, f"prepared-{name}.npy"), mmap_mode="r") for name in ("values", "starts", "offsets"))
+    values, offsets, starts = np.asarray(values), np.asarray(offsets), starts.tolist()
+    return {key: PreparedHash(values[starts[k]:starts[k + 1]], offsets[k]) for k, key in enumerate(keys)}
+
+
+def _open_job(job_folder: str, shm_name: str, n: int, prepare=None) -> tuple:
+    """
+    Opens the hashes and the shared output of a job in the current process, reusing them if the job is already open.
+    Prepared hashes written to the job folder are memory-mapped. Otherwise the process reads and prepares its own copy of the hashes
+    """
+    global _WORKER_JOB
+
+    if _WORKER_JOB is not None and _WORKER_JOB[0] == job_folder:
+        return _WORKER_JOB
+
+    if _WORKER_JOB is not None:
+        _close_job(_WORKER_JOB[0])
+
+    store = HashStore(os.path.join(job_folder, "hashes.hstore"))
+    keys = store.keys()
+    if os.path.exists(os.path.join(job_folder, "prepared-values.npy")):
+        hashes = _load_prepared(job_folder, keys)
+    else:
+        hashes = store.to_dict()
+        if prepare is not None:
+            hashes = {key: prepare(hash) for key, hash in hashes.items()}
+    shm = output = None
+    if shm_name is not None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        output = np.ndarray((get_condensed_size(n) + n,), dtype=np.float64, buffer=shm.buf)
+
+    _WORKER_JOB = (job_folder, keys, hashes, shm, output)
+    return _WORKER_JOB
+
+
+def _close_job(job_folder: str) -> None:
+    """ Releases the shared output of a job if it is open in the current process """
+    global _WORKER_JOB
+
+    if _WORKER_JOB is not None and _WORKER_JOB[0] == job_folder:
+        # The output array must be released before the shared memory can be closed
+        shm = _WORKER_JOB[3]
+        _WORKER_JOB = None
+        if shm is not None:
+            shm.close()
+
+
+def _init_worker(barrier, events) -> None:
+    global _WORKER_BARRIER, _WORKER_EVENTS
+    _WORKER_BARRIER = barrier
+    _WORKER_EVENTS = events
+
+
+def _release_job(job_folder: str) -> None:
+    """
+    Closes the job in the worker that runs this task, then waits for the other workers.
+    One task is sent per worker, and as no worker can take a second task before all have taken one, every worker closes the job
+    """
+    _close_job(job_folder)
+    try:
+        _WORKER_BARRIER.wait(RELEASE_TIMEOUT)
+    except BrokenBarrierError:
+        pass
+
+
+def _get_output_range(n: int, tile: tuple[str, int, int]) -> tuple[int, int]:
+    """ Returns the range of the shared output a tile is written to """
+    region, start, end = tile
+    offset = get_condensed_size(n) if region == "diagonal" else 0
+    return offset + start, offset + end
+
+
+def _write_file(file_path: str, write) -> None:
+    """
+    Writes a file through a temporary file that is moved in place when done, so a partly written file is never found.
+    The temporary file is unique, as shards running at the same time write the same shared files
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _compute_tile(args) -> tuple[int, int, int, float, float | None]:
+    """
+    Computes one tile, writes it to the shared output if there is one and to its checkpoint file if given.
+    Returns (tile index, worker pid, computed entries, seconds, peak memory of the worker in MB) for the progress monitor
+    """
+    job_folder, shm_name, n, kernel, prepare, index, (region, start, end), tile_path = args
+    if _WORKER_EVENTS is not None:
+        _WORKER_EVENTS.put((job_folder, index, os.getpid(), time.time()))
+    _, keys, hashes, _, output = _open_job(job_folder, shm_name, n, prepare)
+    tile_start = time.perf_counter()
+
+    values = np.empty(end - start, dtype=np.float64)
+    if region == "diagonal":
+        for k, i in enumerate(range(start, end)):
+            hash = hashes[keys[i]]
+            values[k] = kernel(hash, hash)
+    else:
+        i, j = get_pair(start)
+        hash_i = hashes[keys[i]]
+        for k in range(end - start):
+            values[k] = kernel(hash_i, hashes[keys[j]])
+            j += 1
+            if j == i:
+                i, j = i + 1, 0
+                hash_i = hashes[keys[i]] if i < n else None
+
+    if output is not None:
+        output_start, output_end = _get_output_range(n, (region, start, end))
+        output[output_start:output_end] = values
+    if tile_path is not None:
+        _write_file(tile_path, lambda file: np.save(file, values))
+    return index, os.getpid(), end - start, time.perf_counter() - tile_start, get_max_rss_mb()
+
+
+
+class Checkpoint:
+    """ The finished tiles of a pairwise computation in a folder: one .npy file per tile and a manifest.json listing the finished tiles """
+
+    def __init__(self, folder: str, fingerprint: str, n: int, tile_size: int) -> None:
+        """
+        Parameters
+        ----------
+        folder : str
+            The checkpoint folder. Created if it does not exist
+        fingerprint : str
+            Identifies the hashes and the kernel. A checkpoint of another computation is never resumed
+        n : int
+            The number of hashes
+        tile_size : int
+            The tile size of a new checkpoint. A resumed checkpoint keeps its own tile size, so the tiles match
+        """
+        self.folder = folder
+        self.fingerprint = fingerprint
+        self.n = n
+        self.tile_size = tile_size
+        self.done = set()
+
+        os.makedirs(os.path.join(folder, "tiles"), exist_ok=True)
+        manifest = self._read_manifest()
+        if manifest is None:
+            self._write_manifest()
+            return
+
+        if manifest.get("version") != CHECKPOINT_VERSION or manifest.get("fingerprint") != fingerprint or manifest.get("n") != n:
+            raise ValueError(f"The checkpoint in {folder} belongs to another computation. Use another folder or remove it")
+        self.tile_size = manifest["tile_size"]
+        # Tiles whose file is missing are computed again
+        self.done = {index for index in manifest["done"] if os.path.exists(self.get_tile_path(index))}
+
+
+    @classmethod
+    def open(cls, folder: str):
+        """ Opens an existing checkpoint without knowing its computation. Raises FileNotFoundError if there is none """
+        with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as file:
+            manifest = json.load(file)
+        return cls(folder, manifest["fingerprint"], manifest["n"], manifest["tile_size"])
+
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.folder, "manifest.json")
+
+
+    def get_tile_path(self, index: int) -> str:
+        return os.path.join(self.folder, "tiles", f"{index}.npy")
+
+
+    def _read_manifest(self) -> dict | None:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+
+    def _write_manifest(self) -> None:
+        manifest = {"version": CHECKPOINT_VERSION, "fingerprint": self.fingerprint, "n": self.n, "tile_size": self.tile_size, "done": sorted(self.done)}
+        _write_file(self.manifest_path, lambda file: file.write(json.dumps(manifest).encode("utf-8")))
+
+
+    def mark_done(self, index: int) -> None:
+        """ Records a tile as finished. Its file must already be written """
+        self.done.add(index)
+        self._write_manifest()
+
+
+    def load(self, tiles: list[tuple[str, int, int]], output: np.ndarray) -> None:
+        """ Copies the finished tiles into the output """
+        for index in sorted(self.done):
+            start, end = _get_output_range(self.n, tiles[index])
+            values = np.load(self.get_tile_path(index))
+            if len(values) != end - start:
+                raise ValueError(f"Tile {index} in {self.folder} has {len(values)} values, expected {end - start}")
+            output[start:end] = values
+
+
+
+class Shard(NamedTuple):
+    """ Shard index of count, 0 <= index < count """
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, spec: str):
+        """ Parses a shard spec "i/k", e.g. "0/4" for the first of four shards """
+        try:
+            index, count = (int(part) for part in spec.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard {spec!r}. Must be i/k, e.g. 0/4")
+        if not 0 <= index < count:
+            raise ValueError(f"Invalid shard {spec!r}. The index must be in the range [0, {count})")
+        return cls(index, count)
+
+
+    def get_folder(self, folder: str) -> str:
+        """ Returns the checkpoint folder of the shard in the folder of a sharded computation """
+        return os.path.join(folder, f"shard-{self.index}-of-{self.count}")
+
+
+    def get_tile_indices(self, num_tiles: int) -> list[int]:
+        """ Returns the tiles of the shard. Tiles are dealt out in turn, so the shards get the same number of pairs give or take one tile """
+        return list(range(self.index, num_tiles, self.count))
+
+
+def get_shard_tile_size(n: int, shards: int) -> int:
+    """ Returns the tile size of an n x n matrix computed in the given number of shards """
+    return max(1, math.ceil((get_condensed_size(n) + n) / (shards * TILES_PER_SHARD)))
+
+
+def _write_ids(keys: list[str], file_path: str) -> None:
+    _write_file(file_path, lambda file: file.write("\n".join(keys).encode("utf-8")))
+
+
+def merge_shards(folder: str) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Assembles the matrix of a sharded computation from the checkpoint folders of its shards
+
+    Params
+    ---
+    folder : str
+        The folder the shards were computed into, see PairwiseEngine.compute_shard
+
+    Returns
+    ---
+    (keys, condensed, diagonal) as returned by PairwiseEngine.compute. Raises ValueError if a shard is missing or not finished
+    """
+    shards = []
+    for name in os.listdir(folder):
+        parts = name.split("-")
+        if len(parts) == 4 and parts[0] == "shard" and parts[2] == "of":
+            shards.append(Shard(int(parts[1]), int(parts[3])))
+
+    counts = {shard.count for shard in shards}
+    if len(counts) != 1:
+        raise ValueError(f"Found no shards or shards of different splits in {folder}: {sorted(shards)}")
+    count = counts.pop()
+    missing = sorted(set(range(count)) - {shard.index for shard in shards})
+    if missing:
+        raise ValueError(f"Shards {', '.join(f'{index}/{count}' for index in missing)} are missing in {folder}")
+
+    checkpoints = [Checkpoint.open(shard.get_folder(folder)) for shard in sorted(shards)]
+    first = checkpoints[0]
+    for checkpoint in checkpoints[1:]:
+        if (checkpoint.fingerprint, checkpoint.n, checkpoint.tile_size) != (first.fingerprint, first.n, first.tile_size):
+            raise ValueError(f"The shards in {folder} belong to different computations")
+
+    with open(os.path.join(folder, "ids"), encoding="utf-8") as file:
+        ids = file.read()
+    keys = ids.split("\n") if first.n else []
+
+    n = first.n
+    size = get_condensed_size(n) + n
+    tiles = get_tiles(n, first.tile_size)
+    output = np.empty(size, dtype=np.float64)
+    for shard, checkpoint in zip(sorted(shards), checkpoints):
+        unfinished = set(shard.get_tile_indices(len(tiles))) - checkpoint.done
+        if unfinished:
+            raise ValueError(f"Shard {shard.index}/{shard.count} is not finished, {len(unfinished)} of its tiles are missing")
+        checkpoint.load(tiles, output)
+
+    return keys, output[:size - n], output[size - n:]
+
+
+def get_fingerprint(hash_store_path: str, kernel) -> str:
+    """ Returns a hex digest of the hash store and the name of the kernel, which identifies a pairwise computation """
+    digest = hashlib.blake2b(digest_size=20)
+    while isinstance(kernel, functools.partial):
+        # The bound arguments tell the computations of one kernel apart, e.g. the band of a banded dtw
+        for value in (*kernel.args, *(value for _, value in sorted(kernel.keywords.items()))):
+            digest.update(value.tobytes() if isinstance(value, np.ndarray) else repr(value).encode())
+        digest.update(repr(sorted(kernel.keywords)).encode())
+        kernel = kernel.func
+    digest.update(f"{getattr(kernel, '__module__', '')}.{getattr(kernel, '__qualname__', repr(kernel))}".encode())
+    with open(hash_store_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+
+class PairwiseEngine:
+    """ Computes pairwise hash similarities over a persistent pool of worker processes. Use as a context manager or call close() when done """
+
+    def __init__(self, processes: int | None = None, tiles_per_process: int = TILES_PER_PROCESS, job_folder: str | None = None, metrics_path: str | None = None, progress: bool = False, metrics_interval: float = METRICS_INTERVAL) -> None:
+        """
+        Parameters
+        ----------
+        processes : int | None
+            The number of worker processes. Uses all available cpus if None. Computes in the calling process if 1
+        tiles_per_process : int
+            The average number of tiles per process
+        job_folder : str | None
+            The folder where the job files (hash stores) are written. A temporary folder if None
+        metrics_path : str | None
+            Appends throughput, tile latency and ETA snapshots of every computation to this JSON-lines file (see progress.py)
+        progress : bool
+            Shows a progress line with the throughput and ETA in stderr
+        metrics_interval : float
+            Seconds between two snapshots
+        """
+        self.processes = processes or get_available_cpus()
+        self.tiles_per_process = tiles_per_process
+        self.job_folder = job_folder
+        self.metrics_path = metrics_path
+        self.progress = progress
+        self.metrics_interval = metrics_interval
+        self._pool = None
+        self._events = None
+        self._barrier = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+    def _get_pool(self):
+        """ Returns the worker pool, which is started on first use and reused for all later computations """
+        if self._pool is None:
+            self._events = Queue()
+            self._barrier = Barrier(self.processes)
+            self._pool = Pool(self.processes, initializer=_init_worker, initargs=(self._barrier, self._events))
+        return self._pool
+
+
+    def close(self) -> None:
+        """ Stops the worker pool """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._events.close()
+            self._events = None
+            self._barrier = None
+
+
+    def _read_started(self, job_folder: str, monitor: ProgressMonitor) -> None:
+        """ Passes the tiles of the job that the workers reported as started to the monitor """
+        while True:
+            try:
+                event_job_folder, index, pid, started = self._events.get_nowait()
+            except queue.Empty:
+                return
+            # Starts reported late by an earlier job are dropped
+            if event_job_folder == job_folder:
+                monitor.start_tile(index, pid, started)
+
+
+    def _release_job(self, job_folder: str) -> None:
+        """
+        Releases the job in every worker of the pool. A broken barrier lets the workers through without waiting,
+        so it is reset before the round, and after it if a worker timed out, for the next round to reach every worker again
+        """
+        if self._barrier.broken:
+            self._barrier.reset()
+        self._get_pool().map(_release_job, [job_folder] * self.processes, chunksize=1)
+        if self._barrier.broken:
+            self._barrier.reset()
+
+
+    def _compute_tiles(self, job_folder: str, shm_name: str | None, n: int, kernel, prepare, tiles: list, indices: list[int], checkpoint: Checkpoint | None, label: str | None = None) -> None:
+        """ Computes the given tiles of an open job, records each finished tile in the checkpoint and reports the progress """
+        tasks = [(job_folder, shm_name, n, kernel, prepare, index, tiles[index], checkpoint.get_tile_path(index) if checkpoint else None) for index in indices]
+
+        monitor = None
+        if self.metrics_path is not None or self.progress:
+            pairs = sum(tiles[index][2] - tiles[index][1] for index in indices)
+            monitor = ProgressMonitor(pairs, len(indices), self.processes, self.metrics_path, self.progress, self.metrics_interval, label)
+
+        def finish(index: int, pid: int, pairs: int, seconds: float, max_rss_mb: float | None) -> None:
+            if checkpoint is not None:
+                checkpoint.mark_done(index)
+            if monitor is not None:
+                monitor.update(pid, pairs, seconds, max_rss_mb, index)
+
+        if self.processes == 1:
+            for task in tasks:
+                if monitor is not None:
+                    monitor.start_tile(task[5], os.getpid())
+                finish(*_compute_tile(task))
+        else:
+            results = self._get_pool().imap_unordered(_compute_tile, tasks)
+            for _ in range(len(tasks)):
+                # With a monitor, a snapshot is also written when no tile finishes within the interval, so a straggling or stuck tile still shows up
+                while True:
+                    try:
+                        result = results.next(timeout=self.metrics_interval if monitor is not None else None)
+                        break
+                    except TimeoutError:
+                        self._read_started(job_folder, monitor)
+                        monitor.tick()
+                if monitor is not None:
+                    self._read_started(job_folder, monitor)
+                finish(*result)
+        # The workers release the hashes and the shared output of the job, which would otherwise stay mapped until the next job
+        if self.processes == 1:
+            _close_job(job_folder)
+        else:
+            self._release_job(job_folder)
+        if monitor is not None:
+            monitor.close()
+
+
+    def compute(self, hashes: dict[str, list], kernel, encoding: str | None = None, prepare=None, checkpoint_folder: str | None = None) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """
+        Computes the similarity of all pairs of hashes
+
+        Params
+        ---
+        hashes : dict[str, list]
+            The trajectory hashes
+        kernel : (hash_x, hash_y) -> float
+            The similarity measure. Must be a module level function so that it can be sent to the workers
+        encoding : str | None
+            The encoding of the hashes, "alphabetical" | "numerical" | "integer". Inferred if None
+        prepare : hash -> object | None
+            Converts each hash once before it is passed to the kernel (see kernels.prepare_hash). Hashes prepared as PreparedHash are
+            memory-mapped by all workers, other prepared hashes are computed by every worker into its own copy. Must be a module level function
+        checkpoint_folder : str | None
+            Writes the finished tiles to this folder, and skips the tiles already there when the computation is run again.
+            The folder may only be used for one computation (hashes and kernel), and is kept when done
+
+        Returns
+        ---
+        (keys, condensed, diagonal) where keys are sorted and condensed[i*(i-1)/2 + j] holds the similarity of keys i and j, j < i
+        """
+        keys = sorted(hashes.keys())
+        n = len(keys)
+        size = get_condensed_size(n) + n
+
+        job_folder = tempfile.mkdtemp(prefix="pairwise-", dir=self.job_folder)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 8)
+        try:
+            hash_store_path = os.path.join(job_folder, "hashes.hstore")
+            write_hash_store({key: hashes[key] for key in keys}, hash_store_path, encoding)
+            _write_prepared(hashes, keys, prepare, job_folder)
+            output = np.ndarray((size,), dtype=np.float64, buffer=shm.buf)
+
+            tile_size = max(1, math.ceil(size / (self.processes * self.tiles_per_process)))
+            checkpoint = None
+            if checkpoint_folder is not None:
+                checkpoint = Checkpoint(checkpoint_folder, get_fingerprint(hash_store_path, kernel), n, tile_size)
+                tile_size = checkpoint.tile_size
+
+            tiles = get_tiles(n, tile_size)
+            if checkpoint is not None:
+                checkpoint.load(tiles, output)
+
+            indices = [index for index in range(len(tiles)) if checkpoint is None or index not in checkpoint.done]
+            self._compute_tiles(job_folder, shm.name, n, kernel, prepare, tiles, indices, checkpoint)
+
+            output = output.copy()
+        finally:
+            shm.close()
+            shm.unlink()
+            shutil.rmtree(job_folder, ignore_errors=True)
+
+        return keys, output[:size - n], output[size - n:]
+
+
+    def compute_shard(self, hashes: dict[str, list], kernel, shard: Shard | str, folder: str, encoding: str | None = None, prepare=None) -> None:
+        """
+        Computes one shard of the similarities of all pairs of hashes. Every shard must be given the same hashes and kernel.
+        A shard that is run again resumes from its checkpoint. When all shards are done, merge_shards assembles the matrix
+
+        Params
+        ---
+        hashes : dict[str, list]
+            The trajectory hashes
+        kernel : (hash_x, hash_y) -> float
+            The similarity measure. Must be a module level function so that it can be sent to the workers
+        shard : Shard | str
+            The shard that is computed, e.g. Shard(0, 4) or "0/4"
+        folder : str
+            The folder shared by all shards of the computation. The shard writes its tiles to its own checkpoint folder in it
+        encoding : str | None
+            The encoding of the hashes, "alphabetical" | "numerical" | "integer". Inferred if None
+        prepare : hash -> object | None
+            Converts each hash once before it is passed to the kernel (see kernels.prepare_hash). Hashes prepared as PreparedHash are
+            memory-mapped by all workers, other prepared hashes are computed by every worker into its own copy. Must be a module level function
+        """
+        shard = Shard.parse(shard) if isinstance(shard, str) else shard
+        keys = sorted(hashes.keys())
+        n = len(keys)
+
+        job_folder = tempfile.mkdtemp(prefix="pairwise-", dir=self.job_folder)
+        try:
+            hash_store_path = os.path.join(job_folder, "hashes.hstore")
+            write_hash_store({key: hashes[key] for key in keys}, hash_store_path, encoding)
+            _write_prepared(hashes, keys, prepare, job_folder)
+
+            checkpoint = Checkpoint(shard.get_folder(folder), get_fingerprint(hash_store_path, kernel), n, get_shard_tile_size(n, shard.count))
+            _write_ids(keys, os.path.join(folder, "ids"))
+
+            tiles = get_tiles(n, checkpoint.tile_size)
+            indices = [index for index in shard.get_tile_indices(len(tiles)) if index not in checkpoint.done]
+            self._compute_tiles(job_folder, None, n, kernel, prepare, tiles, indices, checkpoint, f"shard {shard.index}/{shard.count}")
+        finally:
+            shutil.rmtree(job_folder, ignore_errors=True)
+
+
+
+def to_lower_triangular(keys: list[str], condensed: np.ndarray, diagonal: np.ndarray) -> pd.DataFrame:
+    """ Returns the similarities as a NxN dataframe with the lower triangle and the diagonal filled in, as produced by distance.py """
+    n = len(keys)
+    M = np.zeros((n, n))
+    rows, columns = np.tril_indices(n, -1)
+    M[rows, columns] = condensed
+    M[np.arange(n), np.arange(n)] = diagonal
+    return pd.DataFrame(M, index=keys, columns=keys)
+
+
+
+def _slow_kernel(x, y) -> float:
+    time.sleep(0.05)
+    return float(len(x[0]) * 10 + len(y[0]))
+
+
+def _get_open_job(_) -> tuple[int, str | None]:
+    # Waits for the other workers like _release_job, so that every worker reports
+    job_folder = None if _WORKER_JOB is None else _WORKER_JOB[0]
+    _WORKER_BARRIER.wait(RELEASE_TIMEOUT)
+    return os.getpid(), job_folder
+
+
+def _write_ids_repeatedly(file_path: str) -> None:
+    for _ in range(200):
+        _write_ids(["a", "b", "c"], file_path)
+
+
+if __name__=="__main__":
+    assert [get_pair(k) for k in range(6)] == [(1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (3, 2)]
+    assert sum(end - start for _, start, end in get_tiles(7, 4)) == get_condensed_size(7) + 7
+
+    def _length_kernel(x, y):
+        return float(len(x[0]) * 10 + len(y[0]))
+
+    hashes = {key: [["AA"] * length] for key, length in zip("dcbae", [4, 3, 2, 1, 5])}
+    keys, condensed, diagonal = PairwiseEngine(processes=1, tiles_per_process=3).compute(hashes, _length_kernel)
+    df = to_lower_triangular(keys, condensed, diagonal)
+    assert keys == ["a", "b", "c", "d", "e"]
+    assert df.loc["c", "a"] == 31 and df.loc["e", "d"] == 54 and df.loc["a", "c"] == 0 and df.loc["b", "b"] == 22
+
+    # A computation that is stopped part way is resumed from its checkpoint and only computes the missing tiles
+    checkpoint_folder = tempfile.mkdtemp()
+    calls = []
+
+    def _counting_kernel(x, y):
+        calls.append(1)
+        return _length_kernel(x, y)
+
+    engine = PairwiseEngine(processes=1, tiles_per_process=3)
+    _, expected, _ = engine.compute(hashes, _length_kernel)
+    _, condensed, _ = engine.compute(hashes, _counting_kernel, checkpoint_folder=checkpoint_folder)
+    assert np.array_equal(condensed, expected) and len(calls) == 15
+
+    with open(os.path.join(checkpoint_folder, "manifest.json")) as file:
+        manifest = json.load(file)
+    os.remove(os.path.join(checkpoint_folder, "tiles", f"{manifest['done'][0]}.npy"))
+    manifest["done"] = manifest["done"][:2]
+    with open(os.path.join(checkpoint_folder, "manifest.json"), "w") as file:
+        json.dump(manifest, file)
+
+    calls.clear()
+    _, condensed, diagonal = PairwiseEngine(processes=1, tiles_per_process=1).compute(hashes, _counting_kernel, checkpoint_folder=checkpoint_folder)
+    assert np.array_equal(condensed, expected) and diagonal.tolist() == [11, 22, 33, 44, 55]
+    assert 0 < len(calls) < 15
+
+    calls.clear()
+    engine.compute(hashes, _counting_kernel, checkpoint_folder=checkpoint_folder)
+    assert len(calls) == 0
+
+    try:
+        engine.compute({**hashes, "f": [["AA"]]}, _counting_kernel, checkpoint_folder=checkpoint_folder)
+        assert False
+    except ValueError:
+        pass
+
+    # The shards run as separate processes, as they would in a job array, and are merged into the full matrix
+    from multiprocessing import Process
+
+    shard_folder = tempfile.mkdtemp()
+    shards = [Process(target=PairwiseEngine(processes=1).compute_shard, args=(hashes, _length_kernel, f"{i}/3", shard_folder)) for i in range(3)]
+    try:
+        merge_shards(shard_folder)
+        assert False
+    except ValueError:
+        pass
+    for process in shards:
+        process.start()
+    for process in shards:
+        process.join()
+    keys, condensed, diagonal = merge_shards(shard_folder)
+    assert keys == ["a", "b", "c", "d", "e"] and np.array_equal(condensed, expected) and diagonal.tolist() == [11, 22, 33, 44, 55]
+
+    # The shards write the shared ids at the same time without getting in each other's way
+    writers = [Process(target=_write_ids_repeatedly, args=(os.path.join(shard_folder, "ids"),)) for _ in range(4)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join()
+    assert [process.exitcode for process in writers] == [0] * 4 and not [name for name in os.listdir(shard_folder) if name.endswith(".tmp")]
+    assert Shard.parse("2/3") == Shard(2, 3) and sum(len(Shard(i, 3).get_tile_indices(10)) for i in range(3)) == 10
+
+    # The workers of a persistent pool release each job when its computation is done
+    with PairwiseEngine(processes=2, tiles_per_process=3) as pool_engine:
+        _, condensed, _ = pool_engine.compute(hashes, _length_kernel)
+        assert np.array_equal(condensed, expected)
+        open_jobs = dict(pool_engine._get_pool().map(_get_open_job, range(2), chunksize=1))
+        assert len(open_jobs) == 2 and list(open_jobs.values()) == [None] * 2
+
+    # A release that times out breaks the barrier, which is reset so the release of the next job still reaches every worker
+    RELEASE_TIMEOUT = 0.5
+    with PairwiseEngine(processes=2, tiles_per_process=3) as pool_engine:
+        pool_engine._get_pool().apply(_release_job, ("no job",))
+        assert pool_engine._barrier.broken
+        pool_engine.compute(hashes, _slow_kernel)
+        assert not pool_engine._barrier.broken
+        open_jobs = dict(pool_engine._get_pool().map(_get_open_job, range(2), chunksize=1))
+        assert len(open_jobs) == 2 and list(open_jobs.values()) == [None] * 2
+    RELEASE_TIMEOUT = 60.0
+
+    # The metrics file gets a snapshot per finished tile with an interval of 0, the last of them covering all pairs
+    metrics_path = os.path.join(tempfile.mkdtemp(), "metrics.jsonl")
+    PairwiseEngine(processes=1, tiles_per_process=3, metrics_path=metrics_path, metrics_interval=0).compute(hashes, _length_kernel)
+    with open(metrics_path) as file:
+        snapshots = [json.loads(line) for line in file]
+    assert snapshots[-1]["done"] and snapshots[-1]["pairs_done"] == snapshots[-1]["pairs_total"] == 15
+    assert len(snapshots) == snapshots[-1]["tiles_total"] + 1 and list(snapshots[-1]["workers"]) == [str(os.getpid())]
+
+    # With a pool, the snapshots keep coming while a slow tile runs, and the running tiles are the ones the workers started
+    metrics_path = os.path.join(tempfile.mkdtemp(), "metrics.jsonl")
+    with PairwiseEngine(processes=2, tiles_per_process=1, metrics_path=metrics_path, metrics_interval=0.05) as pool_engine:
+        pool_engine.compute(hashes, _slow_kernel)
+    with open(metrics_path) as file:
+        snapshots = [json.loads(line) for line in file]
+    assert snapshots[-1]["done"] and snapshots[-1]["running_tiles"] == 0 and snapshots[-1]["pairs_done"] == 15
+    assert any(previous["tiles_done"] == snapshot["tiles_done"] for previous, snapshot in zip(snapshots, snapshots[1:]))
+    assert any(snapshot["running_tiles"] > 0 and snapshot["longest_running_seconds"] > 0 for snapshot in snapshots)
+
+    # Hashes prepared for the numba kernels are prepared once and the workers get read-only views of the memory-mapped arrays
+    from . import kernels
+
+    np.random.seed(1)
+    dtw_hashes = {f"t{k}": [list(np.random.rand(3 + k, 2)), list(np.random.rand(2 + k % 3, 2))] for k in range(8)}
+    dtw_keys = sorted(dtw_hashes)
+    prepared_folder = tempfile.mkdtemp()
+    assert not _write_prepared(dtw_hashes, dtw_keys, None, prepared_folder)
+    if _write_prepared(dtw_hashes, dtw_keys, kernels.prepare_hash_dtw, prepared_folder):
+        prepared = _load_prepared(prepared_folder, dtw_keys)
+        for key in dtw_keys:
+            expected_hash = kernels.prepare_hash_dtw(dtw_hashes[key])
+            assert np.array_equal(prepared[key].values, expected_hash.values) and np.array_equal(prepared[key].offsets, expected_hash.offsets)
+            assert not prepared[key].values.flags.owndata and not prepared[key].values.flags.writeable
+
+    _, raw_condensed, _ = PairwiseEngine(processes=1).compute(dtw_hashes, kernels.dtw, "numerical")
+    with PairwiseEngine(processes=2) as pool_engine:
+        _, prepared_condensed, _ = pool_engine.compute(dtw_hashes, kernels.dtw, "numerical", kernels.prepare_hash_dtw)
+    assert np.allclose(raw_condensed, prepared_condensed, rtol=1e-12)
+
+    print("All tests passed")
@@ -0,0 +1,228 @@
+"""
+Sheet containing the progress monitor of the pairwise engine
+
+The monitor is updated in the main process each time a worker starts or finishes a tile, and writes a snapshot of the
+counters every interval, also while no tile finishes, as one JSON object per line to a metrics file and/or as a progress line to stderr.
+A snapshot holds:
+
+    pairs_done, pairs_total, tiles_done, tiles_total : the work done in this run (tiles resumed from a checkpoint are not counted)
+    pairs_per_second, eta_seconds                    : the overall throughput of this run and the time left at that rate
+    running_tiles, queued_tiles                      : the tiles the workers have started and not finished, and the tiles not started yet
+    longest_running_seconds                          : how long the oldest running tile has been running
+    tile_seconds                                     : percentiles (p50, p90, p99, max) of the time the workers spent per finished tile
+    workers                                          : per worker process the pairs and tiles done, its pairs per second, its peak memory
+                                                       and how long its current tile has been running (None if idle)
+
+A worker that is much slower than the others (pairs_per_second), whose memory keeps growing (max_rss_mb) or that is stuck on a
+tile (running_seconds) stands out in the per-worker counters.
+"""
+
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Seconds between two snapshots
+METRICS_INTERVAL = 10.0
+
+
+def get_max_rss_mb() -> float | None:
+    """ Returns the peak memory of the current process in MB, or None if it can't be read on this platform """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes on Linux
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+def _format_seconds(seconds: float | None) -> str:
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+
+class ProgressMonitor:
+    """ Counts the finished tiles of a pairwise computation and reports throughput and ETA """
+
+    def __init__(self, pairs_total: int, tiles_total: int, processes: int, metrics_path: str | None = None, show: bool = False, interval: float = METRICS_INTERVAL, label: str | None = None) -> None:
+        """
+        Parameters
+        ----------
+        pairs_total : int
+            The number of pairs (including diagonal entries) that will be computed in this run
+        tiles_total : int
+            The number of tiles that will be computed in this run
+        processes : int
+            The number of worker processes
+        metrics_path : str | None
+            Appends the snapshots to this JSON-lines file if given
+        show : bool
+            Shows the progress on a single line in stderr
+        interval : float
+            Seconds between two snapshots. The last snapshot is always written
+        label : str | None
+            Added to every snapshot to tell computations apart, e.g. the shard
+        """
+        self.pairs_total = pairs_total
+        self.tiles_total = tiles_total
+        self.processes = processes
+        self.metrics_path = metrics_path
+        self.show = show
+        self.interval = interval
+        self.label = label
+
+        self.pairs_done = 0
+        self.tiles_done = 0
+        self.tile_seconds = []
+        self.workers = dict()
+        # The running tiles by index as (pid, start time), and the finished tiles, whose start may be reported after they finish
+        self.running = dict()
+        self._finished = set()
+
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+
+    def _get_worker(self, pid: int) -> dict:
+        return self.workers.setdefault(pid, {"pairs": 0, "tiles": 0, "seconds": 0.0, "max_rss_mb": None})
+
+
+    def start_tile(self, index: int, pid: int, started: float | None = None) -> None:
+        """ Records that a worker started a tile at the time.time() started, now if None """
+        if index not in self._finished:
+            self.running[index] = (pid, time.time() if started is None else started)
+            self._get_worker(pid)
+
+
+    def update(self, pid: int, pairs: int, seconds: float, max_rss_mb: float | None = None, index: int | None = None) -> None:
+        """ Records a finished tile, and writes a snapshot if the interval has passed """
+        self.pairs_done += pairs
+        self.tiles_done += 1
+        self.tile_seconds.append(seconds)
+        if index is not None:
+            self.running.pop(index, None)
+            self._finished.add(index)
+
+        worker = self._get_worker(pid)
+        worker["pairs"] += pairs
+        worker["tiles"] += 1
+        worker["seconds"] += seconds
+        worker["max_rss_mb"] = max_rss_mb
+
+        self.tick()
+
+
+    def tick(self) -> None:
+        """ Writes a snapshot if the interval has passed since the last one. Called on a timer while waiting for tiles """
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+
+    def get_snapshot(self) -> dict:
+        """ Returns the current counters """
+        elapsed = time.perf_counter() - self.start
+        rate = self.pairs_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.tiles_total - self.tiles_done
+        now = time.time()
+        running_seconds = {pid: now - started for pid, started in self.running.values()}
+        percentiles = np.percentile(self.tile_seconds, [50, 90, 99]).tolist() if self.tile_seconds else [None] * 3
+
+        snapshot = {
+            "time": time.time(),
+            "elapsed_seconds": elapsed,
+            "pairs_done": self.pairs_done,
+            "pairs_total": self.pairs_total,
+            "tiles_done": self.tiles_done,
+            "tiles_total": self.tiles_total,
+            "pairs_per_second": rate,
+            "eta_seconds": (self.pairs_total - self.pairs_done) / rate if rate > 0 else None,
+            "running_tiles": len(self.running),
+            "queued_tiles": max(remaining - len(self.running), 0),
+            "longest_running_seconds": max(running_seconds.values(), default=None),
+            "tile_seconds": {"p50": percentiles[0], "p90": percentiles[1], "p99": percentiles[2], "max": max(self.tile_seconds, default=None)},
+            "workers": {
+                str(pid): {
+                    "pairs": worker["pairs"],
+                    "tiles": worker["tiles"],
+                    "pairs_per_second": worker["pairs"] / worker["seconds"] if worker["seconds"] > 0 else None,
+                    "max_rss_mb": worker["max_rss_mb"],
+                    "running_seconds": running_seconds.get(pid),
+                }
+                for pid, worker in self.workers.items()
+            },
+            "done": remaining == 0,
+        }
+        if self.label is not None:
+            snapshot["label"] = self.label
+        return snapshot
+
+
+    def report(self) -> dict:
+        """ Writes a snapshot to the metrics file and the progress line, and returns it """
+        snapshot = self.get_snapshot()
+
+        if self.metrics_path is not None:
+            with open(self.metrics_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(snapshot) + "\n")
+
+        if self.show:
+            share = snapshot["pairs_done"] / snapshot["pairs_total"] if snapshot["pairs_total"] else 1.0
+            line = f"{share:6.1%} {snapshot['pairs_done']}/{snapshot['pairs_total']} pairs, {snapshot['pairs_per_second']:.0f} pairs/s, ETA {_format_seconds(snapshot['eta_seconds'])}"
+            if self.label is not None:
+                line = f"[{self.label}] {line}"
+            print("\r" + line, end="\n" if snapshot["done"] else "", file=sys.stderr, flush=True)
+
+        return snapshot
+
+
+    def close(self) -> dict:
+        """ Writes the last snapshot and returns it """
+        return self.report()
+
+
+
+if __name__=="__main__":
+    import tempfile
+
+    metrics_path = os.path.join(tempfile.mkdtemp(), "metrics.jsonl")
+    monitor = ProgressMonitor(pairs_total=100, tiles_total=4, processes=2, metrics_path=metrics_path, interval=0)
+
+    snapshot = monitor.get_snapshot()
+    assert snapshot["eta_seconds"] is None and snapshot["queued_tiles"] == 4 and snapshot["running_tiles"] == 0 and snapshot["tile_seconds"]["p50"] is None
+
+    # Tile 0 has been running for a minute when the first snapshot is taken, and the start of tile 3 is only reported after it finished
+    monitor.start_tile(0, 1, time.time() - 60)
+    monitor.start_tile(1, 2)
+    snapshot = monitor.get_snapshot()
+    assert snapshot["running_tiles"] == 2 and snapshot["queued_tiles"] == 2 and snapshot["longest_running_seconds"] >= 60
+    assert snapshot["workers"]["1"]["running_seconds"] >= 60 and snapshot["workers"]["1"]["tiles"] == 0
+
+    for index, pid, seconds in ((0, 1, 0.1), (1, 2, 0.2), (2, 1, 0.1), (3, 2, 0.4)):
+        monitor.update(pid, 25, seconds, 12.5, index)
+    monitor.start_tile(3, 2)
+    monitor.tick()
+    snapshot = monitor.close()
+
+    with open(metrics_path) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 6 and lines[-1] == json.loads(json.dumps(snapshot))
+    assert lines[0]["pairs_done"] == 25 and lines[0]["running_tiles"] == 1 and lines[0]["queued_tiles"] == 2
+    assert snapshot["running_tiles"] == 0 and snapshot["longest_running_seconds"] is None and snapshot["workers"]["2"]["running_seconds"] is None
+    assert snapshot["done"] and snapshot["pairs_done"] == 100 and snapshot["eta_seconds"] == 0
+    assert snapshot["workers"]["1"]["pairs_per_second"] == 250 and snapshot["workers"]["2"]["tiles"] == 2
+    assert abs(snapshot["tile_seconds"]["max"] - 0.4) < 1e-12
+
+    print("All tests passed")
@@ -1,6 +1,8 @@
 import numpy as np
 from utils import trajectory_distance as td
 
+from .warping import get_band_window, get_band_ranges, warp, fast_warp
+
 # DTW for hashes
 
 def dtw(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
@@ -58,3 +60,255 @@ def dtw(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
     return cost
 
 
+
+def dtw_indexed(hash_x: list, hash_y: list, tables: np.ndarray) -> float:
+    """
+    Computes the dtw between two integer disk hashes, looking the distances between the disks up in a table
+
+    Gives the same result as dtw over the numerical hashes of the same disks, up to rounding
+
+    Param
+    ---
+    hash_x : list(np.ndarray)
+        The full hash of trajectory x as the disk indices of each layer
+    hash_y : list(np.ndarray)
+        The full hash of trajectory y as the disk indices of each layer
+    tables : np.ndarray (layers, num_disks, num_disks)
+        The distances between the disk centers of each layer, see DiskLSH.distance_tables
+
+    Returns
+    ---
+    Their dtw
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+
+    for layer in range(len(hash_x)):
+        X = hash_x[layer]
+        Y = hash_y[layer]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        if (X_len == 0 or Y_len == 0):
+            cost += 0.5
+            continue
+
+        S = tables[layer][np.ix_(X, Y)].tolist()
+        M = np.zeros((X_len + 1, Y_len + 1))
+        M[1:, 0] = float('inf')
+        M[0, 1:] = float('inf')
+
+        for i in range(1, X_len + 1):
+            for j in range(1, Y_len + 1):
+                M[i,j] = S[i-1][j-1] + min(M[i][j-1], M[i-1][j], M[i-1][j-1])
+        cost += float(M[X_len][Y_len])
+
+    return cost
+
+
+def get_layer_points(layer) -> np.ndarray:
+    """ Returns a layer of disk centers as a (n, 2) float array """
+    return np.asarray(layer, dtype=np.float64).reshape(-1, 2)
+
+
+def lb_kim(X: np.ndarray, Y: np.ndarray) -> float:
+    """ Lower bound of the dtw between two non-empty layers: every warping path starts in the first and ends in the last pair of points """
+    first = td.get_euclidean_distance(X[0], Y[0])
+    if len(X) == 1 and len(Y) == 1:
+        return first
+    return first + td.get_euclidean_distance(X[-1], Y[-1])
+
+
+def lb_keogh(X: np.ndarray, Y: np.ndarray, window: int | None = None) -> float:
+    """
+    Lower bound of the dtw between two non-empty layers: every point of X is matched with at least one point of Y within
+    the warping window, so it costs at least its distance to the bounding box (envelope) of those points
+
+    Params
+    ---
+    X, Y : np.ndarray (n, 2)
+        The disk centers of the two layers
+    window : int | None
+        Points i and j may only be matched if |i - j| <= window. None for the unconstrained dtw, where the envelope is the bounding box of Y
+    """
+    if window is None:
+        lower = np.broadcast_to(Y.min(axis=0), X.shape)
+        upper = np.broadcast_to(Y.max(axis=0), X.shape)
+    else:
+        # Sliding minimum and maximum over Y[i - window : i + window + 1], padded so that every point of X has a window
+        padding = (window, max(window, len(X) - len(Y) + window))
+        lower = np.pad(Y, (padding, (0, 0)), constant_values=np.inf)
+        upper = np.pad(Y, (padding, (0, 0)), constant_values=-np.inf)
+        lower = np.lib.stride_tricks.sliding_window_view(lower, 2 * window + 1, axis=0)[:len(X)].min(axis=2)
+        upper = np.lib.stride_tricks.sliding_window_view(upper, 2 * window + 1, axis=0)[:len(X)].max(axis=2)
+
+    outside = np.maximum(np.maximum(lower - X, X - upper), 0)
+    return float(np.sqrt((outside ** 2).sum(axis=1)).sum())
+
+
+def dtw_lower_bound(hash_x: list, hash_y: list, window: int | None = None) -> float:
+    """
+    Computes a lower bound of the dtw between two trajectory hashes in linear time
+
+    Param
+    ---
+    hash_x, hash_y : list(np.ndarray)
+        The hashes as layers of disk centers, see get_layer_points
+    window : int | None
+        The warping window of the dtw, see lb_keogh
+
+    Returns
+    ---
+    The sum over the layers of the largest of LB_Kim and LB_Keogh in both directions
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    bound = 0
+    for X, Y in zip(hash_x, hash_y):
+        if len(X) == 0 or len(Y) == 0:
+            bound += 0.5
+            continue
+        bound += max(lb_kim(X, Y), lb_keogh(X, Y, window), lb_keogh(Y, X, window))
+    return bound
+
+
+def dtw_bounded(hash_x: list, hash_y: list, max_cost: float) -> float:
+    """
+    Computes the dtw between two trajectory hashes, stopping as soon as it is known to exceed max_cost
+
+    Returns
+    ---
+    The same value as dtw if it is at most max_cost, otherwise inf
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+
+    for layer in range(len(hash_x)):
+        X = hash_x[layer]
+        Y = hash_y[layer]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        if (X_len == 0 or Y_len == 0):
+            cost += 0.5
+        else:
+            M = np.zeros((X_len + 1, Y_len + 1))
+            M[1:, 0] = float('inf')
+            M[0, 1:] = float('inf')
+
+            for i in range(1, X_len + 1):
+                for j in range(1, Y_len + 1):
+                    s = td.get_euclidean_distance(X[i-1], Y[j-1])
+
+                    M[i,j] = s + min(M[i][j-1], M[i-1][j], M[i-1][j-1])
+
+                # The distances are non-negative, so the rest of the matrix can't get below the smallest value of a row
+                if cost + M[i, 1:].min() > max_cost:
+                    return float('inf')
+            cost += float(M[X_len][Y_len])
+
+        if cost > max_cost:
+            return float('inf')
+
+    return cost
+
+
+def dtw_banded(hash_x: list, hash_y: list, band: float) -> float:
+    """
+    Computes the dtw between two trajectory hashes within a Sakoe-Chiba band\n
+    Runs in layers x O(n * band * n) time, see py/warping.py
+
+    Param
+    ---
+    hash_x, hash_y : list
+        The hashes as layers of disk centers
+    band : float
+        The width of the band as a fraction of the longest layer, 1 gives the exact dtw
+
+    Returns
+    ---
+    Their banded dtw, at least as large as their dtw
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+    for X, Y in zip(hash_x, hash_y):
+        if len(X) == 0 or len(Y) == 0:
+            cost += 0.5
+            continue
+        X, Y = get_layer_points(X), get_layer_points(Y)
+        starts, ends = get_band_ranges(len(X), len(Y), get_band_window(len(X), len(Y), band))
+        cost += float(warp(X, Y, starts, ends, "euclidean", False))
+    return cost
+
+
+def dtw_fast(hash_x: list, hash_y: list, radius: int) -> float:
+    """
+    Approximates the dtw between two trajectory hashes with FastDTW\n
+    Runs in layers x O(n * radius) time, see py/warping.py
+
+    Param
+    ---
+    hash_x, hash_y : list
+        The hashes as layers of disk centers
+    radius : int
+        The number of cells the path found at a coarser resolution is widened by
+
+    Returns
+    ---
+    Their approximate dtw, at least as large as their dtw
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+    for X, Y in zip(hash_x, hash_y):
+        if len(X) == 0 or len(Y) == 0:
+            cost += 0.5
+            continue
+        cost += float(fast_warp(get_layer_points(X), get_layer_points(Y), radius, "euclidean", False))
+    return cost
+
+
+
+if __name__=="__main__":
+    import random
+
+    random.seed(1)
+    np.random.seed(1)
+    for _ in range(300):
+        x = [list(np.random.rand(random.randint(0, 6), 2)) for _ in range(3)]
+        y = [list(np.random.rand(random.randint(0, 6), 2)) for _ in range(3)]
+        expected = dtw(x, y)
+
+        bound = dtw_lower_bound([get_layer_points(l) for l in x], [get_layer_points(l) for l in y])
+        assert bound <= expected
+
+        max_cost = random.random() * 5
+        assert dtw_bounded(x, y, max_cost) == (expected if expected <= max_cost else float('inf'))
+        assert dtw_bounded(x, y, expected) == expected
+
+        assert abs(dtw_banded(x, y, 1) - expected) < 1e-9 and abs(dtw_fast(x, y, 6) - expected) < 1e-9
+        assert dtw_banded(x, y, 0.2) >= expected - 1e-9 and dtw_fast(x, y, 1) >= expected - 1e-9
+
+    # Looking the distances up in a table gives the same dtw as the disk centers
+    disks = np.random.rand(3, 10, 2)
+    tables = np.sqrt(((disks[:, :, np.newaxis, :] - disks[:, np.newaxis, :, :]) ** 2).sum(axis=3))
+    for _ in range(100):
+        x = [np.random.randint(0, 10, random.randint(0, 6)) for _ in range(3)]
+        y = [np.random.randint(0, 10, random.randint(0, 6)) for _ in range(3)]
+        expected = dtw([list(disks[layer][x[layer]]) for layer in range(3)], [list(disks[layer][y[layer]]) for layer in range(3)])
+        assert abs(dtw_indexed(x, y, tables) - expected) < 1e-12
+
+    # The windowed envelope is never looser than the bounding box
+    X, Y = np.random.rand(8, 2), np.random.rand(5, 2)
+    assert lb_keogh(X, Y) <= lb_keogh(X, Y, 3)
+    assert lb_keogh(X, X, 0) == 0 and lb_kim(X, X) == 0
+
+    print("All tests passed")
@@ -2,6 +2,43 @@
 
 import numpy as np
 
+
+def get_codes(layer) -> np.ndarray:
+    """ Converts a hashed layer to int64 codes that are equal exactly when the hashed values are equal """
+    if isinstance(layer, np.ndarray) and np.issubdtype(layer.dtype, np.integer):
+        return np.asarray(layer, dtype=np.int64)
+
+    values = np.array(layer, dtype=str)
+    if values.dtype.itemsize > 16:
+        raise ValueError("Alphabetical hashes can be at most 4 characters long")
+
+    # The (at most) four characters are packed into one integer
+    chars = values.astype("<U4").view(np.uint32).reshape(-1, 4).astype(np.int64)
+    return (chars[:, 0] << 48) | (chars[:, 1] << 32) | (chars[:, 2] << 16) | chars[:, 3]
+
+
+def edit_distance_layer(X, Y) -> float:
+    """ Returns the number of edits between two non-empty layers """
+    X_len = len(X)
+    Y_len = len(Y)
+    M = np.zeros((X_len + 1, Y_len + 1))
+
+    for i in range(1, X_len + 1):
+        for j in range(1, Y_len + 1):
+
+            if i == 1:
+                M[i-1][j-1] = j-1
+            elif j == 1:
+                M[i-1][j-1] = i-1
+
+            if X[i-1] == Y[j-1]: subcost = 0
+            else: subcost = 1
+
+            M[i,j] = min(M[i][j-1] + 1, M[i-1][j] + 1, M[i-1][j-1] + subcost)
+    #print(M)
+    return M[X_len][Y_len]
+
+
 def edit_distance(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
     """
     Computes the edit distance between two trajectory hashes (Grid | Disk hash)\n
@@ -9,10 +46,10 @@ def edit_distance(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
 
     Param
     ---
-    hash_x : np array list(list(str))
-        The full hash of trajectory x
-    hash_y : np array list(list(str))
-        The full hash of trajectory y
+    hash_x : np array list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or integer (cell ids | disk indices)
+    hash_y : np array list(list(str)) | list(np.ndarray)
+        The full hash of trajectory y, either alphabetical or integer (cell ids | disk indices)
     
     Returns
     ---
@@ -37,9 +74,7 @@ def edit_distance(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
         Y = hash_y[layer]
         X_len = len(X)
         Y_len = len(Y)
-        M = np.zeros((X_len + 1, Y_len + 1))
-        
-        
+
         # Edge case if one of hashes is empty
         if (X_len == 0 or Y_len == 0) and X_len != Y_len:
             cost += 1
@@ -50,22 +85,203 @@ def edit_distance(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
             cost += 0
             continue
         
-        for i in range(1, X_len + 1):
-            for j in range(1, Y_len + 1):
+        edits = edit_distance_layer(X, Y)
+        cost += float(edits) / max([X_len, Y_len])
+        c += float(edits)
+    
+    return cost, c
 
-                if i == 1:
-                    M[i-1][j-1] = j-1
-                elif j == 1:
-                    M[i-1][j-1] = i-1
 
-                if X[i-1] == Y[j-1]: subcost = 0
-                else: subcost = 1
 
-                M[i,j] = min(M[i][j-1] + 1, M[i-1][j] + 1, M[i-1][j-1] + subcost)
-        #print(M)
-        cost += float(M[X_len][Y_len]) / max([X_len, Y_len])
-        c += float(M[X_len][Y_len])
-    
+def edit_distance_layer_bounded(X, Y, bound: float) -> float:
+    """
+    Returns the number of edits between two non-empty layers, or inf as soon as it is known to exceed bound
+
+    Only the band of cells that can end within bound edits is filled (Ukkonen), as M[i][j] + |(X_len - i) - (Y_len - j)|
+    is a lower bound for the result. The first row and column of edit_distance make M[i][1] = 1 a new start in every row,
+    so the DP is only abandoned on an empty row once no later row can start a path within the bound.
+    """
+    X_len = len(X)
+    Y_len = len(Y)
+    inf = float("inf")
+    band = int(min(bound, X_len + Y_len))
+    shift = Y_len - X_len
+
+    # The last row where M[i][1] = 1 can still end within the bound
+    last_start = X_len - Y_len + band
+
+    previous = [inf] * (Y_len + 1)
+    for i in range(1, X_len + 1):
+        current = [inf] * (Y_len + 1)
+        lo = max(1, i + shift - band)
+        hi = min(Y_len, i + shift + band)
+
+        for j in range(lo, hi + 1):
+            subcost = 0 if X[i-1] == Y[j-1] else 1
+            left = 0 if j == 1 else current[j-1]
+            up = 0 if i == 1 else previous[j]
+            diagonal = j-1 if i == 1 else (i-1 if j == 1 else previous[j-1])
+
+            value = min(left + 1, up + 1, diagonal + subcost)
+            if value + abs((X_len - i) - (Y_len - j)) <= bound:
+                current[j] = value
+
+        if i >= last_start and min(current[lo:hi+1], default=inf) == inf:
+            return inf
+        previous = current
+
+    return previous[Y_len] if previous[Y_len] <= bound else inf
+
+
+def edit_distance_bounded(hash_x: list, hash_y: list, max_cost: float) -> tuple[float, float]:
+    """
+    Computes the edit distance between two trajectory hashes, stopping as soon as it is known to exceed max_cost
+
+    Param
+    ---
+    hash_x : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or integer (cell ids | disk indices)
+    hash_y : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory y, either alphabetical or integer (cell ids | disk indices)
+    max_cost : float
+        The largest combined edit distance of interest
+
+    Returns
+    ---
+    The same (cost, c) as edit_distance if cost <= max_cost, otherwise (inf, inf)
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    exceeded = (float("inf"), float("inf"))
+    cost = 0
+    c = 0
+
+    for layer in range(len(hash_x)):
+        X = hash_x[layer]
+        Y = hash_y[layer]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            # The slack keeps rounding from pruning a result that is exactly at max_cost
+            edits = edit_distance_layer_bounded(X, Y, (max_cost - cost) * max(X_len, Y_len) + 1e-9)
+            if edits == float("inf"):
+                return exceeded
+            cost += float(edits) / max([X_len, Y_len])
+            c += float(edits)
+
+        if cost > max_cost:
+            return exceeded
+
+    return cost, c
+
+
+def _edit_distance_layer_batch(X: np.ndarray, Y: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Computes the number of edits between one layer X and K layers at once, sweeping the DP matrices along their anti-diagonals
+
+    Params
+    ---
+    X : np.ndarray[int64] (m,)
+        The codes of the query layer, m > 0
+    Y : np.ndarray[int64] (K, N)
+        The codes of the candidate layers, padded with -1 to a common length N
+    lengths : np.ndarray[int64] (K,)
+        The length of each candidate layer, all > 0
+
+    Returns
+    ---
+    The number of edits for each candidate, equal to M[m][n] of edit_distance
+    """
+    m = len(X)
+    K, N = Y.shape
+
+    # Diagonal d holds M[i][d-i] at index i, with the boundaries M[0][j] = j and M[i][0] = i
+    previous_2 = np.zeros((K, m + 1))
+    previous_1 = np.ones((K, m + 1))
+
+    edits = np.empty(K)
+    for d in range(2, m + N + 1):
+        current = np.empty((K, m + 1))
+        current[:, 0] = d
+        if d <= m:
+            current[:, d] = d
+
+        lo, hi = max(1, d - N), min(m, d - 1)
+        if lo <= hi:
+            i = np.arange(lo, hi + 1)
+            subcost = X[i - 1] != Y[:, d - i - 1]
+            left = previous_1[:, lo:hi + 1]
+            up = previous_1[:, lo - 1:hi]
+
+            # edit_distance sets the boundary of a row or column just after it is first read,
+            # so the first row sees M[0][j] = 0 above it and the first column sees M[i][0] = 0 to its left
+            if lo == 1 or hi == d - 1:
+                left, up = left.copy(), up.copy()
+                if lo == 1:
+                    up[:, 0] = 0
+                if hi == d - 1:
+                    left[:, -1] = 0
+
+            current[:, lo:hi + 1] = np.minimum(np.minimum(left, up) + 1, previous_2[:, lo - 1:hi] + subcost)
+
+        done = lengths == d - m
+        edits[done] = current[done, m]
+        previous_2, previous_1 = previous_1, current
+
+    return edits
+
+
+def edit_distance_batch(hash_x: list, hashes_y: list[list]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the edit distance between one trajectory hash and K other hashes in one vectorized sweep per layer
+
+    Param
+    ---
+    hash_x : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or integer. Converting the layers with get_codes first avoids repeated conversion
+    hashes_y : list of hashes
+        The K hashes that x is compared against
+
+    Returns
+    ---
+    (cost, c) arrays of length K, equal to what edit_distance returns for each pair
+    """
+    K = len(hashes_y)
+    cost = np.zeros(K)
+    c = np.zeros(K)
+
+    if any(len(hash_y) != len(hash_x) for hash_y in hashes_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    for layer in range(len(hash_x)):
+        X = get_codes(hash_x[layer])
+        Ys = [get_codes(hash_y[layer]) for hash_y in hashes_y]
+        lengths = np.fromiter(map(len, Ys), dtype=np.int64, count=K)
+        m = len(X)
+
+        # Edge cases if one or both of the hashes are empty
+        empty = (lengths == 0) | (m == 0)
+        cost[empty] += (lengths[empty] != m)
+        c[empty] += np.maximum(lengths[empty], m)
+        if empty.all():
+            continue
+
+        full = np.flatnonzero(~empty)
+        Y = np.full((len(full), lengths[full].max()), -1, dtype=np.int64)
+        for row, k in enumerate(full):
+            Y[row, :lengths[k]] = Ys[k]
+
+        edits = _edit_distance_layer_batch(X, Y, lengths[full])
+        cost[full] += edits / np.maximum(lengths[full], m)
+        c[full] += edits
+
     return cost, c
 
 
@@ -86,4 +302,25 @@ if __name__=="__main__":
     assert edit_distance([["b", "a"]], [["a", "b"]]) == (1,2)
     assert edit_distance([["b", "a","b"]], [["a", "b","a"]]) == (float(2/3), 2)
     assert edit_distance([["b", "a","b","a"]], [["a", "b","a","b"]]) == (0.5, 2)
+    assert edit_distance([np.array([2, 1, 2], dtype=np.uint32)], [np.array([1, 2, 1], dtype=np.uint32)]) == (float(2/3), 2)
+    assert edit_distance([["a"]], [["b"]*5]) == (0.2, 1.0)
+
+    # The batched version must give the same results as edit_distance
+    import random
+    random.seed(1)
+    for _ in range(50):
+        layers = random.randint(1, 3)
+        x = [random.choices("abc", k=random.randint(0, 7)) for _ in range(layers)]
+        ys = [[random.choices("abc", k=random.randint(0, 7)) for _ in range(layers)] for _ in range(20)]
+        cost, c = edit_distance_batch(x, ys)
+        assert [(cost[k], c[k]) for k in range(len(ys))] == [edit_distance(x, y) for y in ys]
+
+    # The bounded version must give the same results within the bound and (inf, inf) outside it
+    for _ in range(1000):
+        x = [random.choices("abc", k=random.randint(0, 9)) for _ in range(3)]
+        y = [random.choices("abc", k=random.randint(0, 9)) for _ in range(3)]
+        max_cost = random.choice([0, 0.5, 1, 1.5, 2, 3])
+        expected = edit_distance(x, y)
+        assert edit_distance_bounded(x, y, max_cost) == (expected if expected[0] <= max_cost else (float("inf"), float("inf")))
+        assert edit_distance_bounded(x, y, expected[0]) == expected
     print("All tests passed")
\ No newline at end of file
@@ -0,0 +1,138 @@
+""" Sheet containing a bit-parallel (Myers) version of the edit distance that will be applied to the hashes. See edit_distance.py for the reference implementation """
+
+import numpy as np
+
+from .edit_distance import edit_distance_layer, get_codes
+
+
+# The longest pattern that fits in one machine word. Longer layers fall back to the DP
+WORD_SIZE = 64
+
+
+def edit_distance_layer_bitparallel(X, Y) -> float:
+    """
+    Returns the number of edits between two non-empty layers of codes, equal to M[m][n] of edit_distance
+
+    In edit_distance the first row and column of M are set just after they are read, so the DP below M[1][1] starts from
+    M[1][1] = subcost, M[1][j] = 1 and M[i][1] = 1. This is an ordinary unit cost DP over X[1:] and Y[1:] with that boundary,
+    which Myers' algorithm computes one column at a time with the vertical differences of the shorter layer packed in a word.
+    The DP is symmetric, so the shorter layer is always used as the pattern.
+    """
+    if len(X) > len(Y):
+        X, Y = Y, X
+
+    m, n = len(X), len(Y)
+    subcost = 0 if X[0] == Y[0] else 1
+    if m == 1:
+        return float(subcost if n == 1 else 1)
+    if m - 1 > WORD_SIZE:
+        return float(edit_distance_layer(X, Y))
+
+    # Bit i is set in peq[symbol] if X[i+1] == symbol
+    peq = dict()
+    for i, symbol in enumerate(X[1:]):
+        peq[symbol] = peq.get(symbol, 0) | (1 << i)
+
+    mask = (1 << (m - 1)) - 1
+    last = 1 << (m - 2)
+
+    # Vertical differences of the first column (M[2][1] - M[1][1] = 1 - subcost, the rest are 0)
+    pv = 1 - subcost
+    mv = 0
+    score = 1
+
+    for j in range(1, n):
+        eq = peq.get(Y[j], 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        # Horizontal difference of the first row, M[1][2] - M[1][1] = 1 - subcost and 0 after that
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        if j == 1 and subcost == 0:
+            ph |= 1
+
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return float(score)
+
+
+def edit_distance_bitparallel(hash_x: list, hash_y: list) -> tuple[float, float]:
+    """
+    Computes the edit distance between two trajectory hashes (Grid | Disk hash) with Myers' bit-parallel algorithm\n
+    Runs in layers x O(n) word operations when the layers are at most WORD_SIZE + 1 long, and falls back to the DP otherwise
+
+    Param
+    ---
+    hash_x : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or integer (cell ids | disk indices)
+    hash_y : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory y, either alphabetical or integer (cell ids | disk indices)
+
+    Returns
+    ---
+    Their combined edit distance (sum of number of edits divided by longest sequence) and total number of edits (float, float), equal to edit_distance
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+    c = 0
+
+    for layer in range(len(hash_x)):
+        X = get_codes(hash_x[layer]).tolist()
+        Y = get_codes(hash_y[layer]).tolist()
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+            continue
+        # Edge case if both hashes are empty
+        if X_len == 0 and Y_len == 0:
+            continue
+
+        edits = edit_distance_layer_bitparallel(X, Y)
+        cost += edits / max(X_len, Y_len)
+        c += edits
+
+    return cost, c
+
+
+
+if __name__=="__main__":
+    import random
+    import timeit as ti
+
+    from .edit_distance import edit_distance
+
+    assert edit_distance_bitparallel([["a"]], [["b"]*5]) == edit_distance([["a"]], [["b"]*5])
+    assert edit_distance_bitparallel([np.array([2, 1, 2], dtype=np.uint32)], [np.array([1, 2, 1], dtype=np.uint32)]) == (float(2/3), 2)
+
+    random.seed(1)
+    for _ in range(2000):
+        x = [random.choices("abcd", k=random.randint(0, 9)) for _ in range(3)]
+        y = [random.choices("abcd", k=random.randint(0, 9)) for _ in range(3)]
+        assert edit_distance_bitparallel(x, y) == edit_distance(x, y), (x, y)
+
+    # Layers longer than a word use the DP
+    x = [random.choices("ab", k=100)]
+    y = [random.choices("ab", k=90)]
+    assert edit_distance_bitparallel(x, y) == edit_distance(x, y)
+
+    cells = [np.array(random.choices(range(500), k=40)) for _ in range(8)]
+    x, y = cells[:4], cells[4:]
+    for method in (edit_distance, edit_distance_bitparallel):
+        print(f"{method.__name__}: {min(ti.repeat(lambda: method(x, y), number=20, repeat=3)) / 20 * 1000:.3f} ms")
+
+    print("All tests passed")
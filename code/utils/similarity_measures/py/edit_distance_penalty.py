@@ -1,5 +1,9 @@
 import numpy as np
 
+from utils.cell_id import alphabetical_to_cells, unpack_cells
+
+from .warping import get_band_window, get_band_ranges, warp, fast_warp
+
 # This is dynamic-time-warping - code was changed from edit distance - names and methodstring not correct!!!
 
 
@@ -25,6 +29,32 @@ def _get_alphabetical_grid_distance(hash_x, hash_y):
     
     return x+y
 
+
+def _is_integer_hash(hash) -> bool:
+    """ Returns true if the hash layer consists of packed integer cell ids """
+    if isinstance(hash, np.ndarray) and hash.dtype != object:
+        return np.issubdtype(hash.dtype, np.integer)
+    return isinstance(hash[0], (int, np.integer))
+
+def get_cell_coordinates(layer) -> tuple[np.ndarray, np.ndarray]:
+    """ Returns the (lat, lon) cell indices of a grid layer, either alphabetical or packed integer cell ids """
+    if len(layer) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return unpack_cells(layer if _is_integer_hash(layer) else alphabetical_to_cells(list(layer)))
+
+
+def get_cell_points(layer) -> np.ndarray:
+    """ Returns the (lat, lon) cell indices of a grid layer as a (n, 2) float array, as used by py/warping.py """
+    return np.stack(get_cell_coordinates(layer), axis=1).astype(np.float64)
+
+
+def get_cell_distances(X, Y) -> np.ndarray:
+    """ Returns the Manhattan distances in cells between every cell of X and every cell of Y as a (len(X), len(Y)) array """
+    x_lat, x_lon = get_cell_coordinates(X)
+    y_lat, y_lon = get_cell_coordinates(Y)
+    return np.abs(x_lat[:, np.newaxis] - y_lat) + np.abs(x_lon[:, np.newaxis] - y_lon)
+
+
 def edit_distance_penalty(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
     """
     Computes the edit distance with penalty between two trajectory hashes (Grid | Disk hash)\n
@@ -32,10 +62,10 @@ def edit_distance_penalty(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
 
     Param
     ---
-    hash_x : np array list(list(str))
-        The full hash of trajectory x
-    hash_y : np array list(list(str))
-        The full hash of trajectory y
+    hash_x : np array list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or packed integer cell ids
+    hash_y : np array list(list(str)) | list(np.ndarray)
+        The full hash of trajectory y, either alphabetical or packed integer cell ids
     
     Returns
     ---
@@ -73,10 +103,13 @@ def edit_distance_penalty(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
             cost += 0
 
             continue
+
+        # The cell distances of the whole layer are computed at once from the (lat, lon) cell indices
+        S = get_cell_distances(X, Y).tolist()
         
         for i in range(1, X_len + 1):
             for j in range(1, Y_len + 1):
-                s = _get_alphabetical_grid_distance(X[i-1], Y[j-1])
+                s = S[i-1][j-1]
                 #d = _get_alphabetical_grid_distance(X[i], Y[j-1])
                 #r = _get_alphabetical_grid_distance(X[i-1], Y[j])
                 if i == 1:
@@ -95,6 +128,173 @@ def edit_distance_penalty(hash_x: np.ndarray, hash_y: np.ndarray) -> float:
     return cost, c
 
 
+def edit_distance_penalty_layer_bounded(X, Y, bound: float) -> float:
+    """
+    Returns the accumulated cell distance between two non-empty layers, or inf as soon as it is known to exceed bound
+
+    The cell distances are non-negative, so a cell above the bound can never lead to a result within it and is dropped.
+    Each row only fills the columns that can be reached from the cells kept in the row above. The first row and column of
+    edit_distance_penalty make M[i][1] = s(i-1, 0) a new start in every row, so the DP is only abandoned on an empty row
+    once none of the later rows can start within the bound.
+    """
+    X_len = len(X)
+    Y_len = len(Y)
+    inf = float("inf")
+    x_lat, x_lon = (cells.tolist() for cells in get_cell_coordinates(X))
+    y_lat, y_lon = (cells.tolist() for cells in get_cell_coordinates(Y))
+
+    def grid_distance(i: int, j: int) -> int:
+        return abs(x_lat[i] - y_lat[j]) + abs(x_lon[i] - y_lon[j])
+
+    # M[i][1] for each row, and the smallest of them in row i or later
+    starts = [grid_distance(i, 0) for i in range(X_len)]
+    later_starts = starts + [inf]
+    for i in range(X_len - 1, -1, -1):
+        later_starts[i] = min(starts[i], later_starts[i+1])
+
+    # The first row only holds new starts, M[1][j] = s(0, j-1)
+    previous = [inf] + [s if s <= bound else inf for s in [starts[0]] + [grid_distance(0, j) for j in range(1, Y_len)]]
+    kept = [j for j in range(1, Y_len + 1) if previous[j] != inf]
+
+    for i in range(2, X_len + 1):
+        if not kept and later_starts[i-1] > bound:
+            return inf
+
+        current = [inf] * (Y_len + 1)
+        if starts[i-1] <= bound:
+            current[1] = starts[i-1]
+
+        # Cells can be reached from the row above up to one column past its last kept cell, and from the left after that
+        j = 2 if current[1] != inf or not kept else max(2, kept[0])
+        last = kept[-1] + 1 if kept else 1
+        while j <= Y_len and (j <= last or current[j-1] != inf):
+            value = grid_distance(i-1, j-1) + min(current[j-1], previous[j], previous[j-1])
+            if value <= bound:
+                current[j] = value
+            j += 1
+
+        kept = [j for j in range(1, Y_len + 1) if current[j] != inf]
+        previous = current
+
+    return previous[Y_len]
+
+
+def edit_distance_penalty_bounded(hash_x: list, hash_y: list, max_cost: float) -> tuple[float, float]:
+    """
+    Computes the edit distance with penalty between two trajectory hashes, stopping as soon as it is known to exceed max_cost
+
+    Param
+    ---
+    hash_x : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory x, either alphabetical or packed integer cell ids
+    hash_y : list(list(str)) | list(np.ndarray)
+        The full hash of trajectory y, either alphabetical or packed integer cell ids
+    max_cost : float
+        The largest combined edit distance of interest
+
+    Returns
+    ---
+    The same (cost, c) as edit_distance_penalty if cost <= max_cost, otherwise (inf, inf)
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    exceeded = (float("inf"), float("inf"))
+    cost = 0
+    c = 0
+
+    for layer in range(len(hash_x)):
+        X = hash_x[layer]
+        Y = hash_y[layer]
+        X_len = len(X)
+        Y_len = len(Y)
+
+        # Edge case if one of hashes is empty
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        # Edge case if both hashes are empty
+        elif X_len != 0:
+            # The slack keeps rounding from pruning a result that is exactly at max_cost
+            edits = edit_distance_penalty_layer_bounded(X, Y, (max_cost - cost) * max(X_len, Y_len) + 1e-9)
+            if edits == float("inf"):
+                return exceeded
+            cost += float(edits) / max([X_len, Y_len])
+            c += float(edits)
+
+        if cost > max_cost:
+            return exceeded
+
+    return cost, c
+
+
+def edit_distance_penalty_banded(hash_x: list, hash_y: list, band: float) -> tuple[float, float]:
+    """
+    Computes the edit distance with penalty between two trajectory hashes within a Sakoe-Chiba band\n
+    Runs in layers x O(n * band * n) time, see py/warping.py
+
+    Param
+    ---
+    hash_x, hash_y : list(list(str)) | list(np.ndarray)
+        The full hashes, either alphabetical or packed integer cell ids
+    band : float
+        The width of the band as a fraction of the longest layer, 1 gives the exact edit distance with penalty
+
+    Returns
+    ---
+    Their combined edit distance and total number of edits as edit_distance_penalty, at least as large as those
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+    c = 0
+    for X, Y in zip(hash_x, hash_y):
+        X_len, Y_len = len(X), len(Y)
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        elif X_len != 0:
+            starts, ends = get_band_ranges(X_len, Y_len, get_band_window(X_len, Y_len, band))
+            edits = float(warp(get_cell_points(X), get_cell_points(Y), starts, ends, "manhattan", True))
+            cost += edits / max(X_len, Y_len)
+            c += edits
+    return cost, c
+
+
+def edit_distance_penalty_fast(hash_x: list, hash_y: list, radius: int) -> tuple[float, float]:
+    """
+    Approximates the edit distance with penalty between two trajectory hashes with FastDTW\n
+    Runs in layers x O(n * radius) time, see py/warping.py
+
+    Param
+    ---
+    hash_x, hash_y : list(list(str)) | list(np.ndarray)
+        The full hashes, either alphabetical or packed integer cell ids
+    radius : int
+        The number of cells the path found at a coarser resolution is widened by
+
+    Returns
+    ---
+    Their combined edit distance and total number of edits as edit_distance_penalty, at least as large as those
+    """
+    if len(hash_x) != len(hash_y):
+        raise ValueError("Number of layers are different for the hashes. Unable to compute edit distance")
+
+    cost = 0
+    c = 0
+    for X, Y in zip(hash_x, hash_y):
+        X_len, Y_len = len(X), len(Y)
+        if (X_len == 0 or Y_len == 0) and X_len != Y_len:
+            cost += 1
+            c += max(X_len, Y_len)
+        elif X_len != 0:
+            edits = float(fast_warp(get_cell_points(X), get_cell_points(Y), radius, "manhattan", True))
+            cost += edits / max(X_len, Y_len)
+            c += edits
+    return cost, c
+
+
 if __name__=="__main__":
     
     assert _get_num_value("ZZ", "A") == 675
@@ -111,4 +311,29 @@ if __name__=="__main__":
     assert _get_alphabetical_grid_distance("ACan", "ABam") == 2
     assert _get_alphabetical_grid_distance("ABan", "BCai") == 32
 
+    # Integer cell ids must give the same results as the alphabetical hashes
+    x = [["ACad", "ABan", "BCai"], ["ABan"]]
+    y = [["ABam", "ACan"], ["BCai", "ACad"]]
+    assert edit_distance_penalty([alphabetical_to_cells(l) for l in x], [alphabetical_to_cells(l) for l in y]) == edit_distance_penalty(x, y)
+
+    # The cell distances must be the same as the alphabetical grid distance
+    cells = ["ACad", "ABan", "BCai", "ABam", "ACan", "AAaa", "ZZzz", "AZaz"]
+    assert get_cell_distances(cells, cells).tolist() == [[_get_alphabetical_grid_distance(a, b) for b in cells] for a in cells]
+    assert get_cell_distances(alphabetical_to_cells(cells), cells).tolist() == get_cell_distances(cells, cells).tolist()
+
+    # The bounded version must give the same results within the bound and (inf, inf) outside it
+    import random
+    random.seed(1)
+    for _ in range(1000):
+        x = [random.choices(cells, k=random.randint(0, 7)) for _ in range(3)]
+        y = [random.choices(cells, k=random.randint(0, 7)) for _ in range(3)]
+        max_cost = random.choice([0, 1, 5, 10, 30, 100])
+        expected = edit_distance_penalty(x, y)
+        assert edit_distance_penalty_bounded(x, y, max_cost) == (expected if expected[0] <= max_cost else (float("inf"), float("inf")))
+        assert edit_distance_penalty_bounded(x, y, expected[0]) == expected
+
+        # The cell distances are integers, so a band or radius covering the whole DP gives exactly the same result
+        assert edit_distance_penalty_banded(x, y, 1) == expected and edit_distance_penalty_fast(x, y, 7) == expected
+        assert edit_distance_penalty_banded(x, y, 0.2)[1] >= expected[1] and edit_distance_penalty_fast(x, y, 1)[1] >= expected[1]
+
     print("All tests passed")
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Sheet containing the windowed warping recursion shared by the banded and approximate versions of dtw and edit_distance_penalty
+
+Both measures fill a DP over the point distances of two layers, C[i][j] = d(i, j) + min(C[i][j-1], C[i-1][j], C[i-1][j-1]).
+They differ in the distance (euclidean between disk centers, manhattan between grid cells) and the boundary:
+dtw starts from C[-1][-1] = 0 only, while edit_distance_penalty lets every cell of the first row and column start a path (C[0][j] = d(0, j)).
+
+Here the DP is only filled within a window, given as a range of columns [starts[i], ends[i]) per row:
+
+    banded : Sakoe-Chiba band, the cells with |i - j| <= window. See get_band_window for the window of a band fraction
+    fast   : FastDTW (Salvador & Chan), the warping path is found on layers coarsened by halving, projected to the
+             next finer level and widened by radius cells, until the full resolution is reached
+
+The windows only remove paths, so both give a cost at least as large as the full DP, and equal to it when the window holds the optimal path.
+"""
+
+import math
+
+import numpy as np
+
+
+def get_band_window(X_len: int, Y_len: int, band: float) -> int:
+    """ Returns the band window of two layers, a fraction of the longest layer and at least the difference in length, so the last cell is reachable """
+    return max(math.ceil(band * max(X_len, Y_len)), abs(X_len - Y_len))
+
+
+def get_band_ranges(X_len: int, Y_len: int, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Returns the column ranges [starts[i], ends[i]) of the cells with |i - j| <= window """
+    rows = np.arange(X_len)
+    return np.maximum(rows - window, 0), np.minimum(rows + window + 1, Y_len)
+
+
+def get_point_distances(X: np.ndarray, Y: np.ndarray, metric: str) -> np.ndarray:
+    """ Returns the distances between the points of X and a range of points Y, "euclidean" | "manhattan" """
+    if metric == "euclidean":
+        return np.sqrt(((X - Y) ** 2).sum(axis=-1))
+    return np.abs(X - Y).sum(axis=-1)
+
+
+def warp(X: np.ndarray, Y: np.ndarray, starts: np.ndarray, ends: np.ndarray, metric: str, free_start: bool, keep: bool = False):
+    """
+    Fills the warping DP of two layers of points within a window
+
+    Params
+    ---
+    X, Y : np.ndarray (n, 2)
+        The points of the layers
+    starts, ends : np.ndarray
+        The columns [starts[i], ends[i]) of row i within the window. Non-decreasing, with row i+1 starting at or before ends[i]
+    metric : str
+        "euclidean" | "manhattan"
+    free_start : bool
+        Every cell of the first row and column starts a path, as in edit_distance_penalty
+    keep : bool
+        Also returns the rows of the DP, as needed to find the warping path
+
+    Returns
+    ---
+    The cost C[n-1][m-1], and the list of rows (row i holds columns starts[i]:ends[i]) if keep
+    """
+    inf = float("inf")
+    rows = []
+    previous, previous_start, previous_end = None, 0, 0
+
+    for i in range(len(X)):
+        start, end = int(starts[i]), int(ends[i])
+        distances = get_point_distances(X[i], Y[start:end], metric).tolist()
+        current = [inf] * (end - start)
+
+        for j in range(start, end):
+            d = distances[j - start]
+            if free_start and (i == 0 or j == 0):
+                current[j - start] = d
+                continue
+
+            best = current[j - start - 1] if j > start else inf
+            if i == 0:
+                if j == 0:
+                    best = 0.0
+            else:
+                if previous_start <= j < previous_end:
+                    best = min(best, previous[j - previous_start])
+                if previous_start <= j - 1 < previous_end:
+                    best = min(best, previous[j - 1 - previous_start])
+            current[j - start] = d + best
+
+        if keep:
+            rows.append(current)
+        previous, previous_start, previous_end = current, start, end
+
+    cost = previous[len(Y) - 1 - previous_start]
+    return (cost, rows) if keep else cost
+
+
+def get_path_ranges(rows: list, starts: np.ndarray, ends: np.ndarray, free_start: bool) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Follows the warping path back from the last cell of a filled window, and returns the first and last column the path visits in every row.
+    A free start path that begins in the first row or column is extended along it to the first cell, so that all rows are visited
+    """
+    inf = float("inf")
+    lowest = np.zeros(len(rows), dtype=np.int64)
+    highest = np.zeros(len(rows), dtype=np.int64)
+
+    def get_cost(i: int, j: int) -> float:
+        if i < 0 or j < 0 or not starts[i] <= j < ends[i]:
+            return inf
+        return rows[i][j - starts[i]]
+
+    # The path visits every row, entering it at its last column and leaving it at its first
+    i, j = len(rows) - 1, int(ends[-1]) - 1
+    lowest[i] = highest[i] = j
+    while i > 0 or j > 0:
+        row = i
+        if free_start and (i == 0 or j == 0):
+            i, j = (0, j - 1) if i == 0 else (i - 1, 0)
+        else:
+            # Diagonal steps are preferred on ties, as in FastDTW
+            candidates = ((get_cost(i-1, j-1), i-1, j-1), (get_cost(i-1, j), i-1, j), (get_cost(i, j-1), i, j-1))
+            _, i, j = min(candidates, key=lambda candidate: candidate[0])
+        if i != row:
+            highest[i] = j
+        lowest[i] = j
+
+    return lowest, highest
+
+
+def coarsen(X: np.ndarray) -> np.ndarray:
+    """ Halves the resolution of a layer by averaging pairs of points. An odd last point is kept as it is """
+    half = len(X) // 2
+    coarse = np.empty(((len(X) + 1) // 2, X.shape[1]), dtype=np.float64)
+    coarse[:half] = (X[0:2*half:2] + X[1:2*half:2]) / 2
+    if len(X) % 2:
+        coarse[-1] = X[-1]
+    return coarse
+
+
+def expand_ranges(lowest: np.ndarray, highest: np.ndarray, radius: int, X_len: int, Y_len: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Widens the coarse path ranges by radius cells, and projects them to the column ranges of the layers at twice the resolution """
+    coarse_len = len(lowest)
+    starts = np.empty(X_len, dtype=np.int64)
+    ends = np.empty(X_len, dtype=np.int64)
+    for i in range(coarse_len):
+        first, last = max(0, i - radius), min(coarse_len, i + radius + 1)
+        start = max(0, 2 * (int(lowest[first:last].min()) - radius))
+        end = min(Y_len, 2 * (int(highest[first:last].max()) + radius) + 2)
+        starts[2*i:2*i + 2] = start
+        ends[2*i:2*i + 2] = end
+    return starts, ends
+
+
+def fast_warp(X: np.ndarray, Y: np.ndarray, radius: int, metric: str, free_start: bool) -> float:
+    """ Approximates the warping cost of two layers of points with FastDTW, where radius is the number of cells the projected path is widened by """
+    levels = [(X, Y)]
+    while min(len(levels[-1][0]), len(levels[-1][1])) > radius + 2:
+        levels.append((coarsen(levels[-1][0]), coarsen(levels[-1][1])))
+
+    X_level, Y_level = levels[-1]
+    starts, ends = np.zeros(len(X_level), dtype=np.int64), np.full(len(X_level), len(Y_level), dtype=np.int64)
+    for level in range(len(levels) - 1, 0, -1):
+        X_level, Y_level = levels[level]
+        _, rows = warp(X_level, Y_level, starts, ends, metric, free_start, keep=True)
+        lowest, highest = get_path_ranges(rows, starts, ends, free_start)
+        starts, ends = expand_ranges(lowest, highest, radius, len(levels[level - 1][0]), len(levels[level - 1][1]))
+
+    return warp(X, Y, starts, ends, metric, free_start)
+
+
+
+if __name__=="__main__":
+    import random
+
+    from .dtw import dtw
+    from .edit_distance_penalty import edit_distance_penalty, get_cell_points
+
+    random.seed(1)
+    np.random.seed(1)
+    for _ in range(200):
+        X = np.random.rand(random.randint(1, 30), 2)
+        Y = np.random.rand(random.randint(1, 30), 2)
+        exact = dtw([list(X)], [list(Y)])
+
+        # A band covering the whole DP gives the exact dtw, narrower bands and fast warping can only give larger costs
+        assert abs(warp(X, Y, *get_band_ranges(len(X), len(Y), max(len(X), len(Y))), "euclidean", False) - exact) < 1e-9
+        assert warp(X, Y, *get_band_ranges(len(X), len(Y), get_band_window(len(X), len(Y), 0.1)), "euclidean", False) >= exact - 1e-9
+        assert fast_warp(X, Y, 1, "euclidean", False) >= exact - 1e-9
+        assert abs(fast_warp(X, Y, 30, "euclidean", False) - exact) < 1e-9
+
+        cells = ["ACad", "ABan", "BCai", "ABam", "ACan", "AAaa", "BBbb"]
+        x = random.choices(cells, k=random.randint(1, 30))
+        y = random.choices(cells, k=random.randint(1, 30))
+        X, Y = get_cell_points(x), get_cell_points(y)
+        exact = edit_distance_penalty([x], [y])[1]
+        assert warp(X, Y, *get_band_ranges(len(X), len(Y), max(len(X), len(Y))), "manhattan", True) == exact
+        assert warp(X, Y, *get_band_ranges(len(X), len(Y), get_band_window(len(X), len(Y), 0.2)), "manhattan", True) >= exact
+        assert fast_warp(X, Y, 1, "manhattan", True) >= exact
+        assert fast_warp(X, Y, 30, "manhattan", True) == exact
+
+    print("All tests passed")
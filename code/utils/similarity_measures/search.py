@@ -0,0 +1,209 @@
+"""
+Sheet containing threshold and top-k queries over trajectory hashes
+
+The queries use the bounded kernels, which stop comparing a pair as soon as it can no longer be within the threshold
+(or better than the current k-th best), so most pairs are rejected without computing their full distance.
+For dtw, candidates are first checked against cheap lower bounds (LB_Kim, LB_Keogh), and the top-k query visits them
+in order of their lower bound, so that the remaining candidates can be skipped once the bound exceeds the k-th best.
+"""
+
+import heapq
+
+from . import kernels
+from .py.dtw import dtw_lower_bound, get_layer_points
+
+
+# Lower bounds are compared with this relative slack, as they may be rounded differently than the kernels
+LOWER_BOUND_SLACK = 1e-9
+
+
+class QueryStats:
+    """ Counts how the candidates of queries were decided """
+
+    def __init__(self) -> None:
+        self.candidates = 0
+        self.pruned = 0
+        self.abandoned = 0
+        self.computed = 0
+
+
+    @property
+    def pruning_rate(self) -> float:
+        """ The share of the candidates that were rejected by a lower bound, without running the kernel """
+        return self.pruned / self.candidates if self.candidates else 0.0
+
+
+    def __repr__(self) -> str:
+        return f"QueryStats(candidates={self.candidates}, pruned={self.pruned}, abandoned={self.abandoned}, computed={self.computed}, pruning_rate={self.pruning_rate:.1%})"
+
+
+
+def _ed_cost(hash_x, hash_y, max_cost: float) -> float:
+    return kernels.edit_distance_bounded(hash_x, hash_y, max_cost)[0]
+
+def _edp_cost(hash_x, hash_y, max_cost: float) -> float:
+    return kernels.edit_distance_penalty_bounded(hash_x, hash_y, max_cost)[0]
+
+def _prepare_dtw(hash: list) -> tuple:
+    return kernels.prepare_hash_dtw(hash), [get_layer_points(layer) for layer in hash]
+
+def _dtw_cost(hash_x: tuple, hash_y: tuple, max_cost: float) -> float:
+    return kernels.dtw_bounded(hash_x[0], hash_y[0], max_cost)
+
+def _dtw_lower_bound(hash_x: tuple, hash_y: tuple) -> float:
+    return dtw_lower_bound(hash_x[1], hash_y[1])
+
+
+# Measure -> (hash preparation, lower bound | None, bounded kernel)
+MEASURES = {
+    "ed" : (kernels.prepare_hash_ed, None, _ed_cost),
+    "edp" : (kernels.prepare_hash_edp, None, _edp_cost),
+    "dtw" : (_prepare_dtw, _dtw_lower_bound, _dtw_cost),
+}
+
+
+def _get_measure(measure: str):
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure {measure}. Must be one of {', '.join(MEASURES)}")
+    return MEASURES[measure]
+
+
+def _compute(cost, query, candidate, bound: float, stats: QueryStats) -> float:
+    """ Runs the bounded kernel and counts whether it finished or was abandoned """
+    value = cost(query, candidate, bound)
+    if value == float("inf") and bound != float("inf"):
+        stats.abandoned += 1
+    else:
+        stats.computed += 1
+    return value
+
+
+def threshold_query(query: list, hashes: dict[str, list], max_cost: float, measure: str = "ed", stats: QueryStats | None = None) -> list[tuple[str, float]]:
+    """
+    Finds the hashes within a distance of the query hash
+
+    Params
+    ---
+    query : list
+        The hash of the query trajectory
+    hashes : dict[str, list]
+        The hashes that are searched
+    max_cost : float
+        The largest distance (combined cost) of a match
+    measure : str
+        "ed" | "edp" | "dtw"
+    stats : QueryStats | None
+        Counts the pruned, abandoned and computed candidates if given
+
+    Returns
+    ---
+    The (key, distance) of all matches, closest first
+    """
+    prepare, lower_bound, cost = _get_measure(measure)
+    stats = stats if stats is not None else QueryStats()
+    query = prepare(query)
+
+    matches = []
+    for key, hash in hashes.items():
+        stats.candidates += 1
+        candidate = prepare(hash)
+        if lower_bound is not None and lower_bound(query, candidate) > max_cost * (1 + LOWER_BOUND_SLACK):
+            stats.pruned += 1
+            continue
+
+        value = _compute(cost, query, candidate, max_cost, stats)
+        if value <= max_cost:
+            matches.append((key, value))
+
+    return sorted(matches, key=lambda match: (match[1], match[0]))
+
+
+def top_k_query(query: list, hashes: dict[str, list], k: int, measure: str = "ed", stats: QueryStats | None = None) -> list[tuple[str, float]]:
+    """
+    Finds the k hashes closest to the query hash
+
+    Params
+    ---
+    query : list
+        The hash of the query trajectory
+    hashes : dict[str, list]
+        The hashes that are searched
+    k : int
+        The number of hashes to return
+    measure : str
+        "ed" | "edp" | "dtw"
+    stats : QueryStats | None
+        Counts the pruned, abandoned and computed candidates if given
+
+    Returns
+    ---
+    The (key, distance) of the k closest hashes, closest first. Ties at the k-th distance are broken by the order of hashes
+    """
+    prepare, lower_bound, cost = _get_measure(measure)
+    stats = stats if stats is not None else QueryStats()
+    query = prepare(query)
+
+    candidates = [(position, key, prepare(hash)) for position, (key, hash) in enumerate(hashes.items())]
+    stats.candidates += len(candidates)
+
+    # The candidates most likely to be close are visited first, so the k-th best distance becomes tight early
+    bounds = [0.0] * len(candidates)
+    if lower_bound is not None:
+        bounds = [lower_bound(query, candidate) for _, _, candidate in candidates]
+        order = sorted(range(len(candidates)), key=lambda index: bounds[index])
+        candidates = [candidates[index] for index in order]
+        bounds = [bounds[index] for index in order]
+
+    # Max heap of the k best so far as (-cost, -position, key), where the k-th best distance bounds the next comparisons
+    best = []
+    for visited, ((position, key, candidate), lower) in enumerate(zip(candidates, bounds)):
+        bound = -best[0][0] if len(best) == k else float("inf")
+        if lower > bound * (1 + LOWER_BOUND_SLACK):
+            stats.pruned += len(candidates) - visited
+            break
+
+        value = _compute(cost, query, candidate, bound, stats)
+        if len(best) < k:
+            heapq.heappush(best, (-value, -position, key))
+        elif (value, position) < (bound, -best[0][1]):
+            heapq.heapreplace(best, (-value, -position, key))
+
+    return [(key, -value) for value, _, key in sorted(best, reverse=True)]
+
+
+
+if __name__=="__main__":
+    import random
+
+    import numpy as np
+
+    random.seed(1)
+    cells = ["ACad", "ABan", "BCai", "ABam", "ACan", "AAaa"]
+    hashes = {f"T{i}": [random.choices(cells, k=random.randint(1, 8)) for _ in range(3)] for i in range(100)}
+    query = hashes["T0"]
+
+    for measure, distance in (("ed", kernels.py_edit_distance), ("edp", kernels.py_edit_distance_penalty)):
+        costs = sorted(((distance(query, hash)[0], key) for key, hash in hashes.items()))
+
+        assert threshold_query(query, hashes, costs[10][0], measure) == [(key, cost) for cost, key in costs if cost <= costs[10][0]]
+        assert [cost for _, cost in top_k_query(query, hashes, 10, measure)] == [cost for cost, _ in costs[:10]]
+        assert top_k_query(query, hashes, 1, measure) == [("T0", 0.0)]
+
+    # Disk hashes along random walks, so that some trajectories are close to each other
+    np.random.seed(1)
+    hashes = dict()
+    for i in range(200):
+        start = np.random.rand(2) * 10
+        hashes[f"T{i}"] = [list(start + np.cumsum(np.random.rand(random.randint(0, 12), 2) - 0.5, axis=0)) for _ in range(3)]
+    query = hashes["T0"]
+    costs = {key: kernels.dtw(query, hash) for key, hash in hashes.items()}
+
+    stats = QueryStats()
+    top = top_k_query(query, hashes, 5, "dtw", stats)
+    assert [cost for _, cost in top] == sorted(costs.values())[:5] and top[0] == ("T0", 0.0)
+    assert stats.candidates == stats.pruned + stats.abandoned + stats.computed and stats.pruned > 0
+
+    max_cost = sorted(costs.values())[20]
+    assert threshold_query(query, hashes, max_cost, "dtw") == sorted(((key, cost) for key, cost in costs.items() if cost <= max_cost), key=lambda match: (match[1], match[0]))
+
+    print(f"All tests passed (dtw top-5: {stats})")
@@ -0,0 +1,262 @@
+"""
+Sheet containing the columnar, memory-mapped trajectory store
+
+A store is a single binary file holding every trajectory of a dataset:
+
+    header   : 64 bytes (magic, version, number of trajectories/points and section offsets)
+    coords   : float64 (n_points, 2) block of (lat, lon) coordinates, trajectories stored back to back
+    offsets  : int64 (n_trajectories + 1) where trajectory k is coords[offsets[k]:offsets[k+1]]
+    ids      : utf-8 encoded, newline separated trajectory ids
+
+The coordinate block is written before the offsets and ids so that trajectories can be appended while streaming.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+
+STORE_MAGIC = b"TRJSTORE"
+STORE_VERSION = 1
+
+_HEADER_FORMAT = "<8sIIQQQQQ"
+_HEADER_SIZE = 64
+
+
+class TrajectoryStoreWriter:
+    """ Writer that streams trajectories into a trajectory store. Use as a context manager or call close() when done """
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Parameters
+        ----------
+        file_path : str
+            The path of the store that will be written. The file is written to a temporary file and moved in place on close
+        """
+        self.file_path = file_path
+        self._tmp_path = file_path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\x00" * _HEADER_SIZE)
+        self._offsets = [0]
+        self._ids = []
+        self._seen = set()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+    def append(self, trajectory_id: str, coordinates) -> None:
+        """ Appends a single trajectory given as a sequence of (lat, lon) coordinates """
+        coords = np.ascontiguousarray(coordinates, dtype="<f8").reshape(-1, 2)
+        self.append_many([trajectory_id], coords, [len(coords)])
+
+
+    def append_many(self, trajectory_ids: list[str], coordinates: np.ndarray, lengths) -> None:
+        """
+        Appends several trajectories stored back to back in one coordinate block
+
+        Params
+        ---
+        trajectory_ids : list[str]
+            The ids of the trajectories, in the same order as in the block
+        coordinates : np.ndarray (n, 2)
+            The (lat, lon) coordinates of all the trajectories
+        lengths : array-like[int]
+            The number of points in each trajectory
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        coords = np.ascontiguousarray(coordinates, dtype="<f8").reshape(-1, 2)
+
+        if len(trajectory_ids) != len(lengths):
+            raise ValueError("Number of trajectory ids and lengths are different")
+        if int(lengths.sum()) != len(coords):
+            raise ValueError("Trajectory lengths does not match the number of coordinates")
+
+        for trajectory_id in trajectory_ids:
+            trajectory_id = str(trajectory_id)
+            if "\n" in trajectory_id:
+                raise ValueError(f"Trajectory id can't contain newlines: {trajectory_id!r}")
+            if trajectory_id in self._seen:
+                raise ValueError(f"Trajectory id {trajectory_id} is already in the store")
+            self._seen.add(trajectory_id)
+            self._ids.append(trajectory_id)
+
+        self._file.write(coords.tobytes())
+        self._offsets.extend((self._offsets[-1] + np.cumsum(lengths)).tolist())
+
+
+    def close(self) -> None:
+        """ Writes the offsets, ids and header and moves the store in place """
+        if self._file.closed:
+            return
+
+        n_points = self._offsets[-1]
+        offsets_start = _HEADER_SIZE + n_points * 16
+        ids = "\n".join(self._ids).encode("utf-8")
+        ids_start = offsets_start + len(self._offsets) * 8
+
+        self._file.write(np.asarray(self._offsets, dtype="<i8").tobytes())
+        self._file.write(ids)
+        self._file.seek(0)
+        self._file.write(struct.pack(_HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, 0, len(self._ids), n_points, offsets_start, ids_start, len(ids)))
+        self._file.close()
+
+        os.replace(self._tmp_path, self.file_path)
+
+
+
+class TrajectoryStore:
+    """ Read-only, memory-mapped view of a trajectory store. Trajectories are handed out as zero-copy (n, 2) views """
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Parameters
+        ----------
+        file_path : str
+            The path of the store that should be opened
+        """
+        self.file_path = file_path
+
+        with open(file_path, "rb") as file:
+            header = file.read(_HEADER_SIZE)
+            if len(header) != _HEADER_SIZE:
+                raise ValueError(f"{file_path} is not a trajectory store")
+
+            magic, version, _, n_trajectories, n_points, offsets_start, ids_start, ids_nbytes = struct.unpack(_HEADER_FORMAT, header[:struct.calcsize(_HEADER_FORMAT)])
+            if magic != STORE_MAGIC:
+                raise ValueError(f"{file_path} is not a trajectory store")
+            if version != STORE_VERSION:
+                raise ValueError(f"Unsupported trajectory store version {version}")
+
+            file.seek(ids_start)
+            ids = file.read(ids_nbytes).decode("utf-8")
+
+        self.ids = ids.split("\n") if n_trajectories else []
+        self.offsets = np.memmap(file_path, dtype="<i8", mode="r", offset=offsets_start, shape=(n_trajectories + 1,))
+
+        if n_points:
+            self.coordinates = np.memmap(file_path, dtype="<f8", mode="r", offset=_HEADER_SIZE, shape=(n_points, 2))
+        else:
+            self.coordinates = np.empty((0, 2), dtype="<f8")
+
+        self._index = {trajectory_id: i for i, trajectory_id in enumerate(self.ids)}
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    def __contains__(self, trajectory_id: str) -> bool:
+        return trajectory_id in self._index
+
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+    def __getitem__(self, trajectory_id: str) -> np.ndarray:
+        """ Returns the coordinates of a trajectory as a read-only view into the store """
+        i = self._index[trajectory_id]
+        return self.coordinates[self.offsets[i]:self.offsets[i+1]]
+
+
+    def keys(self) -> list[str]:
+        return list(self.ids)
+
+
+    def items(self):
+        for trajectory_id in self.ids:
+            yield trajectory_id, self[trajectory_id]
+
+
+    def lengths(self) -> np.ndarray:
+        """ Returns the number of points in each trajectory """
+        return np.diff(self.offsets)
+
+
+    def to_dict(self, keys: list[str] | None = None) -> dict[str, np.ndarray]:
+        """ Returns a dictionary of zero-copy trajectory views, optionally restricted to the given keys """
+        if keys is None:
+            keys = self.ids
+        return {key: self[key] for key in keys}
+
+
+    def select(self, keys: list[str] | None = None) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """
+        Returns the trajectories with the given keys as one coordinate block
+
+        Params
+        ---
+        keys : list[str] | None
+            The trajectories to select, all trajectories if None
+
+        Returns
+        ---
+        (keys, coordinates (n, 2), offsets (len(keys) + 1)). The block is zero-copy if all trajectories are selected in store order
+        """
+        if keys is None or list(keys) == self.ids:
+            return list(self.ids), self.coordinates, np.asarray(self.offsets)
+
+        keys = list(keys)
+        index = np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+        starts = self.offsets[index]
+        lengths = self.offsets[index + 1] - starts
+
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # Gather the selected point indices in one go
+        point_index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return keys, self.coordinates[point_index], offsets
+
+
+
+def write_trajectory_store(trajectories: dict, file_path: str) -> None:
+    """
+    Writes a dictionary of trajectories to a trajectory store
+
+    Params
+    ---
+    trajectories : dict[str, list[list[float]]]
+        The trajectories as (lat, lon) coordinates with their name as key
+    file_path : str
+        The path of the store
+    """
+    with TrajectoryStoreWriter(file_path) as writer:
+        for key, trajectory in trajectories.items():
+            writer.append(key, trajectory)
+
+
+
+if __name__=="__main__":
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "test.store")
+    trajectories = {"a": [[41.1, -8.6], [41.2, -8.5]], "b": [[41.15, -8.65]], "c": []}
+    write_trajectory_store(trajectories, path)
+
+    store = TrajectoryStore(path)
+    assert store.keys() == ["a", "b", "c"]
+    assert store["a"].tolist() == trajectories["a"]
+    assert store["c"].shape == (0, 2)
+    assert store.lengths().tolist() == [2, 1, 0]
+
+    keys, coords, offsets = store.select(["b", "a"])
+    assert keys == ["b", "a"] and offsets.tolist() == [0, 1, 3]
+    assert coords.tolist() == trajectories["b"] + trajectories["a"]
+
+    print("All tests passed")